@@ -9,6 +9,10 @@ well, and it was easier to use a 3x3 than figure out what was going wrong.
 
 It's also currently set up to track the left eye.
 
+Gaze samples can be read from a thread at the tracker's own rate, rather than once per frame (startSampling).
+Each new sample (by ViewPoint's data time) goes into a ring buffer of [time, x, y, quality],
+and getSamplesSinceLastFrame() hands the frame loop everything that arrived since it last asked.
+
 Code was adapted from EyeTrackerCalibrationNVIS obtained from Dmitry Kit in July 2012. Most modifications were
 in constructing the grid and adding some flexibility to the adjustments.
 
@@ -21,7 +25,10 @@ V0.1 Internal copy (Dmitry Kit, adapted from C++)
 import viz
 import math
 import sys
+import time
 import pickle
+import threading
+import numpy as np
 from vizhmd import HMD
 import vizact
 
@@ -48,8 +55,13 @@ class EyeTrackerCalibrationNVIS:
 	toggleCalib - Toggles calibration between showing and hiding.
 	setProportion - Sets dx and dy manually.
 	setOffset - Sets offset manually.
+	readSample - Reads the current gaze sample from ViewPoint.
+	startSampling - Starts a thread that reads every gaze sample into a ring buffer.
+	stopSampling - Stops that thread.
+	isSampling - Returns whether the thread is running.
+	getSamplesSinceLastFrame - Returns the samples the thread has read since the last call.
 	"""
-	def __init__(self, save_dir):
+	def __init__(self, save_dir, sampleBufferLength=4096):
 		"""Sets the internal variables to their initial conditions.
 		
 		"""
@@ -91,6 +103,34 @@ class EyeTrackerCalibrationNVIS:
 		## Use the DLL to set up initial settings
 		self.importDLL()
 		
+		## ctypes buffers for readSample.  Made once, and refilled by each call
+		self.eyeA = c_int(0)
+		self.gazePoint = VPX_RealType()
+		self.dataTime = c_double()
+		self.dataQuality = c_int()
+		self.dataDeltaTime = c_double()
+		
+		self.gazePointPtr = pointer(self.gazePoint)
+		self.dataTimePtr = pointer(self.dataTime)
+		self.dataQualityPtr = pointer(self.dataQuality)
+		self.dataDeltaTimePtr = pointer(self.dataDeltaTime)
+		
+		## Ring buffer of samples, one row per sample: [time, x, y, quality].  
+		# Written by the sampling thread.  A row is published by incrementing numSamplesWritten after it is filled
+		self.sampleBufferLength = sampleBufferLength
+		self.sample_s_TXYQ = np.zeros((sampleBufferLength,4))
+		self.numSamplesWritten = 0
+		self.numSamplesRead = 0
+		self.numSamplesLost = 0
+		
+		# numSamplesLost = numSamplesMissed (gaps in data time, counted by the sampling thread) + numSamplesOverwritten (by getSamplesSinceLastFrame)
+		self.numSamplesMissed = 0
+		self.numSamplesOverwritten = 0
+		self.trackerPeriod = None
+		
+		self.samplingThread = None
+		self.samplingRunning = False
+		
 	def updateViewPointCalGrid(self,calibPointNum,normalX,normalY):
 		# gjd
 		# Remember that calibPointNum must be >0
@@ -406,7 +446,132 @@ class EyeTrackerCalibrationNVIS:
 		self.offset = newOffset
 		self.show()
 		
+	def readSample(self):
+		"""Reads the current gaze sample from ViewPoint.  Returns [time, x, y, quality]
+		Reuses one set of ctypes buffers, so don't call it while the sampling thread is running.
+		"""
+		self.arrington.VPX_GetGazePoint2(self.eyeA, self.gazePointPtr)
+		self.arrington.VPX_GetDataTime2(self.eyeA, self.dataTimePtr)
+		self.arrington.VPX_GetDataQuality2(self.eyeA, self.dataQualityPtr)
+		
+		return [self.dataTime.value, self.gazePoint.x, self.gazePoint.y, self.dataQuality.value]
+		
+	def startSampling(self, pollRateHz=1000, trackerRateHz=0):
+		"""Starts a thread that reads every gaze sample into a ring buffer.
+		Poll faster than the tracker runs (220-400 Hz).  Samples that have already been read (same data time) are dropped.
+		On Windows, the timer resolution is raised to 1 ms while sampling.  At the default (~15.6 ms), time.sleep would hold polling to ~64 Hz.
+		trackerRateHz is the tracker's sample rate, used to count the samples polling missed (gaps in data time) in numSamplesLost.
+		0 takes the period from ViewPoint (VPX_GetDataDeltaTime2), or if this ViewPoint doesn't have it, from the smallest interval seen between samples.
+		That last one is only right if polling catches some consecutive samples.
+		"""
+		if self.samplingRunning: return
+		
+		self.pollRateHz = pollRateHz
+		
+		self.trackerPeriod = None
+		self.readTrackerPeriod = False
+		
+		if trackerRateHz > 0:
+			self.trackerPeriod = 1.0 / trackerRateHz
+		elif hasattr(self.arrington, 'VPX_GetDataDeltaTime2'):
+			self.readTrackerPeriod = True
+		else:
+			print 'EyeTrackerCalibrationNVIS: No VPX_GetDataDeltaTime2.  Set trackerRateHz to count the samples polling misses'
+		
+		if sys.platform == 'win32':
+			windll.winmm.timeBeginPeriod(1)
+		
+		self.samplingRunning = True
+		
+		self.samplingThread = threading.Thread(target=self._samplingLoop)
+		self.samplingThread.daemon = True
+		self.samplingThread.start()
+		
+		vizact.onexit(self.stopSampling)
+		
+	def stopSampling(self):
+		"""Stops the sampling thread."""
+		if not self.samplingRunning: return
+		
+		self.samplingRunning = False
+		self.samplingThread.join()
+		self.samplingThread = None
+		
+		if sys.platform == 'win32':
+			windll.winmm.timeEndPeriod(1)
+		
+		self.numSamplesLost = self.numSamplesOverwritten + self.numSamplesMissed
+		
+		trackerRate = 1.0 / self.trackerPeriod if self.trackerPeriod else 0
+		
+		print 'EyeTrackerCalibrationNVIS: Read %i gaze samples at %.0f Hz.  Lost %i (%i missed by polling, %i overwritten before they were logged)' % \
+			(self.numSamplesWritten, trackerRate, self.numSamplesLost, self.numSamplesMissed, self.numSamplesOverwritten)
+		
+	def isSampling(self):
+		"""Returns whether the sampling thread is running."""
+		return self.samplingRunning
+		
+	def _samplingLoop(self):
+		
+		period = 1.0 / self.pollRateHz
+		lastDataTime = None
+		
+		while self.samplingRunning:
+			
+			startTime = viz.tick()
+			
+			sample_TXYQ = self.readSample()
+			
+			if sample_TXYQ[0] != lastDataTime:
+				
+				self.sample_s_TXYQ[self.numSamplesWritten % self.sampleBufferLength] = sample_TXYQ
+				self.numSamplesWritten += 1
+				
+				if lastDataTime is not None:
+					self._countMissedSamples(sample_TXYQ[0] - lastDataTime)
+				
+				lastDataTime = sample_TXYQ[0]
+			
+			wait = period - (viz.tick() - startTime)
+			
+			if wait > 0:
+				time.sleep(wait)
+		
+	def _countMissedSamples(self, interval):
+		
+		# VPX_Get*2 only return the latest sample, so one that came and went between polls leaves a gap in data time
+		# Intervals that aren't positive (ViewPoint restarted) are ignored
+		
+		if interval <= 0: return
+		
+		if self.readTrackerPeriod:
+			self.arrington.VPX_GetDataDeltaTime2(self.eyeA, self.dataDeltaTimePtr)
+			
+			if self.dataDeltaTime.value > 0:
+				self.trackerPeriod = self.dataDeltaTime.value
+		
+		if self.trackerPeriod is None or ( not self.readTrackerPeriod and interval < self.trackerPeriod ):
+			self.trackerPeriod = interval
+		
+		self.numSamplesMissed += max(0, int(round(interval / self.trackerPeriod)) - 1)
+		
+	def getSamplesSinceLastFrame(self):
+		"""Returns the samples read since the last call, oldest first, as an array of rows [time, x, y, quality].
+		If more than sampleBufferLength arrived in between, the oldest were overwritten.
+		numSamplesLost counts those, and the samples polling missed.
+		"""
+		numSamplesWritten = self.numSamplesWritten
+		numSamplesRead = max(self.numSamplesRead, numSamplesWritten - self.sampleBufferLength)
+		
+		self.numSamplesOverwritten += numSamplesRead - self.numSamplesRead
+		self.numSamplesRead = numSamplesWritten
+		
+		self.numSamplesLost = self.numSamplesOverwritten + self.numSamplesMissed
+		
+		return self.sample_s_TXYQ[ np.arange(numSamplesRead, numSamplesWritten) % self.sampleBufferLength ]
+		
 	def quitViewPoint(self):
+		self.stopSampling()
 		self.arrington.VPX_SendCommand('quitViewPoint')
 		
 		VPX_SendCommand ('quitViewPoint');
\ No newline at end of file
@@ -7,7 +7,7 @@ from Vector import Vector
 
 
 class HiBallCamera(viz.EventClass):
-	def __init__(self, offset, particle=None, sensorNum=0, attachTo=viz.MainView, preTrans = [0, 0, 0.1778]) :
+	def __init__(self, offset, particle=None, sensorNum=0, attachTo=viz.MainView, preTrans = [0, 0, 0.1778], selfUpdate=True) :
 		viz.EventClass.__init__(self)
 
 		self.offset 	= offset
@@ -30,7 +30,9 @@ class HiBallCamera(viz.EventClass):
 		self.postMat = vizmat.Transform();
 		self.postMat.postTrans(offset);
 		
-		vizact.ontimer(0, self.updateView)
+		# With selfUpdate False, the owner calls updateView() (see trackerBackend.hiballBackend)
+		if selfUpdate:
+			vizact.ontimer(0, self.updateView)
 		self.pos = [0,0,0]
 		self.rot = [0, 0, 0, 0]
 		self.turnOn()
@@ -0,0 +1,185 @@
+"""
+Writes data files from a background thread, so that the frame loop never waits on the disk.
+
+asyncFileWriter stands in for a file opened for writing.  write() only adds the data to a queue, and returns.
+A thread joins whatever has queued up into one write, every flushIntervalS, or sooner when the queue is over half of maxQueueLength.
+
+The queue holds at most maxQueueLength writes.  When it is full (the disk has stalled for that long), write() drops the data and returns False,
+rather than wait or grow without bound.  The first dropped write is printed, and all of them are counted (numQueueFull)
+in the stats printed on close().
+
+	expDataFile = asyncWriter.asyncFileWriter('Data/exp_data.txt','a')
+	expDataFile.write(expDataString + '\\n')	# every frame.  False if it was dropped
+	expDataFile.drain()			# waits until everything queued so far is on disk
+	expDataFile.close()			# drains, then closes
+"""
+
+import time
+import timeit
+import threading
+import collections
+
+class asyncFileWriter():
+
+	def __init__(self,fileName,mode='w',maxQueueLength=1000,flushIntervalS=0.1):
+
+		self.fileName = fileName
+		self.fileObject = open(fileName,mode)
+
+		self.maxQueueLength = maxQueueLength
+		self.flushIntervalS = flushIntervalS
+
+		# deque.append and deque.popleft are atomic, so the frame loop and the writer thread share it without a lock
+		self.queue = collections.deque()
+
+		# Kept by write(), on the frame loop
+		self.numWrites = 0
+		self.maxQueueDepth = 0
+		self.numQueueFull = 0
+		self.numDropped = 0
+
+		# Kept by the writer thread
+		self.numBatches = 0
+		self.bytesWritten = 0
+		self.maxBatchMS = 0
+		self.totalBatchMS = 0
+		self.writing = False
+
+		self.wakeEvent = threading.Event()
+		self.running = True
+
+		self.writerThread = threading.Thread(target=self._writeLoop)
+		self.writerThread.daemon = True
+		self.writerThread.start()
+
+	def write(self,data):
+
+		# data is a str (or anything else a file in this mode takes).  Never waits.  Returns False if data was dropped
+
+		if( not self.running ):
+			self.numDropped += 1
+			return False
+
+		queueDepth = len(self.queue)
+
+		if( queueDepth >= self.maxQueueLength ):
+
+			if( self.numQueueFull == 0 ):
+				print 'asyncFileWriter: %i writes to %s are queued, waiting on the disk.  Dropping writes until they are written' % (queueDepth,self.fileName)
+
+			self.numQueueFull += 1
+			self.numDropped += 1
+			self.wakeEvent.set()
+
+			return False
+
+		self.queue.append(data)
+		self.numWrites += 1
+
+		queueDepth += 1
+
+		if( queueDepth > self.maxQueueDepth ):
+			self.maxQueueDepth = queueDepth
+
+		if( queueDepth > self.maxQueueLength // 2 ):
+			self.wakeEvent.set()
+
+		return True
+
+	def flush(self):
+
+		# Asks for a write now, without waiting for it.  See drain()
+		self.wakeEvent.set()
+
+	def drain(self,timeoutS=5.0):
+
+		# Waits until everything queued so far has been written.  Returns False if that took longer than timeoutS
+
+		deadline = timeit.default_timer() + timeoutS
+
+		while( len(self.queue) or self.writing ):
+
+			if( timeit.default_timer() > deadline ):
+				print 'asyncFileWriter.drain: %i writes to %s still queued after %.1f s' % (len(self.queue),self.fileName,timeoutS)
+				return False
+
+			self.wakeEvent.set()
+			time.sleep(0.001)
+
+		return True
+
+	def close(self):
+
+		if( not self.running ):
+			return
+
+		self.drain()
+
+		self.running = False
+		self.wakeEvent.set()
+		self.writerThread.join()
+
+		self.fileObject.close()
+
+		self.printStats()
+
+	def _writeLoop(self):
+
+		while( True ):
+
+			self.wakeEvent.wait(self.flushIntervalS)
+			self.wakeEvent.clear()
+
+			self._writeBatch()
+
+			if( not self.running and len(self.queue) == 0 ):
+				return
+
+	def _writeBatch(self):
+
+		numItems = len(self.queue)
+
+		if( numItems == 0 ):
+			return
+
+		self.writing = True
+
+		# Only what was queued when the batch began.  Anything added meanwhile goes in the next one
+		batch = [ self.queue.popleft() for itemIdx in range(numItems) ]
+
+		startTime = timeit.default_timer()
+
+		try:
+			data = ''.join(batch)
+
+			self.fileObject.write(data)
+			self.fileObject.flush()
+
+			self.bytesWritten += len(data)
+
+		except IOError as error:
+			print 'asyncFileWriter: Lost %i writes to %s (%s)' % (numItems,self.fileName,error)
+			self.numDropped += numItems
+
+		batchMS = 1000 * (timeit.default_timer() - startTime)
+
+		self.numBatches += 1
+		self.totalBatchMS += batchMS
+		self.maxBatchMS = max(self.maxBatchMS,batchMS)
+
+		self.writing = False
+
+	def getStats(self):
+
+		# [writes queued, batches, bytes written, largest queue, writes dropped on a full queue, writes lost in all, mean batch ms, max batch ms]
+
+		meanBatchMS = self.totalBatchMS / self.numBatches if self.numBatches else 0
+
+		return [self.numWrites, self.numBatches, self.bytesWritten, self.maxQueueDepth, self.numQueueFull, self.numDropped, meanBatchMS, self.maxBatchMS]
+
+	def printStats(self):
+
+		numWrites, numBatches, bytesWritten, maxQueueDepth, numQueueFull, numDropped, meanBatchMS, maxBatchMS = self.getStats()
+
+		print 'asyncFileWriter: %s: %i writes (%i bytes) in %i batches of %.2f ms (max %.2f ms).  Largest queue %i of %i, %i dropped when full, %i lost in all' % \
+			(self.fileName,numWrites,bytesWritten,numBatches,meanBatchMS,maxBatchMS,maxQueueDepth,self.maxQueueLength,numQueueFull,numDropped)
@@ -0,0 +1,158 @@
+"""
+Benchmark for logParser, against the kind of parser we each used to write:  a regular expression, line by line.
+
+Runs in plain Python.  Writes a synthetic log of numLines lines in the format of Experiment.getOutput
+(plus a view matrix, as an @@ field) to a temporary file, parses it both ways, and checks that they agree.
+
+Usage:  python benchLogParser.py [numLines] [numProcesses]
+
+numProcesses defaults to the number of CPUs.
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import tempfile
+import multiprocessing
+import numpy as np
+import logParser
+
+def makeLine(frameNum):
+
+	outputString = '* frameTime %f * ' % (frameNum / 120.0)
+	outputString = outputString + '* inCalibrateBool %f * ' % (0)
+	outputString = outputString + '* eventFlag %f * ' % (random.choice([0,0,0,0,1,3,4,6]))
+	outputString = outputString + '* trialType %s * ' % (random.choice(['t1','t2']))
+	outputString = outputString + '[ viewPos_XYZ %f %f %f ] ' % (random.uniform(-4,4),random.uniform(1,2),random.uniform(-20,20))
+	outputString = outputString + '( eyePos %f  %f ) ' % (random.random(),random.random())
+	outputString = outputString + '< viewQuat_XYZW %f %f %f %f > ' % tuple( [ random.uniform(-1,1) for i in range(4) ] )
+	outputString = outputString + '@ viewMat ' + ' '.join( [ '%f' % random.uniform(-1,1) for i in range(16) ] ) + ' @ '
+
+	return outputString
+
+def writeLog(fileName,numLines):
+
+	random.seed(numLines)
+
+	logFile = open(fileName,'w')
+
+	for frameNum in range(numLines):
+		logFile.write(makeLine(frameNum) + '\n')
+
+	logFile.close()
+
+def naiveParseFile(fileName):
+
+	# Returns {name: list of values per line}
+
+	fieldPattern = re.compile(r'([\*\(\[<@])\s+(\S+)\s+(.*?)\s+[\*\)\]>@](?:\s|$)')
+
+	values_name = {}
+
+	for line in open(fileName):
+
+		for opening, name, valueText in fieldPattern.findall(line):
+
+			values = valueText.split()
+
+			try:
+				values = [ float(value) for value in values ]
+			except ValueError:
+				pass
+
+			if( len(values) == 1 ):
+				values = values[0]
+
+			values_name.setdefault(name,[]).append(values)
+
+	return values_name
+
+def checkAgreement(data,values_name):
+
+	# Largest difference over every numeric value, and whether the string fields match
+
+	maxDiff = 0
+	stringsMatch = True
+
+	for name in data.dtype.names:
+
+		if( data.dtype.fields[name][0].base.kind == 'f' ):
+			maxDiff = max( maxDiff, np.abs( data[name] - np.array(values_name[name]) ).max() )
+		else:
+			stringsMatch = stringsMatch and list(data[name]) == values_name[name]
+
+	return [maxDiff, stringsMatch]
+
+def checkSkippedChunks():
+
+	# Chunks with no line that fits:  a truncated last line on its own, and lines from another run (logs are opened in 'a' mode)
+
+	fileName = os.path.join(tempfile.gettempdir(),'benchLogParserSkipped.txt')
+
+	random.seed(0)
+
+	goodLines = [ makeLine(frameNum) for frameNum in range(3) ]
+	otherRunLines = [ '* frameTime %f * * eventFlag 0 * ' % (frameNum / 60.0) for frameNum in range(3) ]
+
+	for tailLines in [ [ goodLines[0][:40] ], otherRunLines ]:
+
+		logFile = open(fileName,'w')
+		logFile.write( '\n'.join(goodLines + tailLines) )
+		logFile.close()
+
+		# One chunk per line
+		data = logParser.parseFile(fileName,chunkBytes=1)
+
+		print '  %i good lines + %i that do not fit:  parsed %i' % (len(goodLines),len(tailLines),len(data))
+
+	os.remove(fileName)
+
+def benchParse(numLines = 500000, numProcesses = None):
+
+	if( numProcesses is None ):
+		numProcesses = multiprocessing.cpu_count()
+
+	fileName = os.path.join(tempfile.gettempdir(),'benchLogParser.txt')
+
+	writeLog(fileName,numLines)
+
+	megabytes = os.path.getsize(fileName) / 1e6
+
+	print 'benchParse: %i lines, %.1f MB' % (numLines,megabytes)
+	print '  method                    seconds       MB/s    speedup'
+
+	startTime = time.time()
+	values_name = naiveParseFile(fileName)
+	naiveS = time.time() - startTime
+
+	results = [['regex per line',naiveS]]
+
+	runs = [['logParser',1]]
+
+	if( numProcesses > 1 ):
+		runs.append(['logParser, %i processes' % numProcesses,numProcesses])
+
+	for label, processes in runs:
+
+		startTime = time.time()
+		data = logParser.parseFile(fileName,numProcesses=processes)
+		results.append([label,time.time() - startTime])
+
+	for label, seconds in results:
+		print '  %-24s %8.2f %10.1f %10.1f' % (label,seconds,megabytes / seconds,naiveS / seconds)
+
+	maxDiff, stringsMatch = checkAgreement(data,values_name)
+	print '  largest difference from regex: %g.  Strings match: %s' % (maxDiff,stringsMatch)
+
+	os.remove(fileName)
+
+	checkSkippedChunks()
+
+if __name__ == "__main__":
+
+	numLines = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+	numProcesses = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+	benchParse(numLines,numProcesses)
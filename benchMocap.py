@@ -0,0 +1,146 @@
+"""
+Benchmarks for the phasespace to Vizard conversion in mocapInterface.
+
+Run from within Vizard (mocapInterface depends upon viz and OWL).  No window or OWL server is needed.
+
+benchConversion:  conversions per second for a frame of 30 markers and 3 rigids,
+	comparing the per-call viz.Transform conversion that mocapInterface used before psToVizConverter
+	with psToVizConverter (preallocated transforms, one 4x4 matrix, markers converted in one batch)
+"""
+
+import time
+import random
+import viz
+import numpy as np
+import mocapInterface
+
+numMarkers = 30
+numRigids = 3
+
+# Same as the [phasespace] defaults in sysCfgSpec.ini
+origin = [0,0,0]
+scale = [.001,.001,.001]
+
+class fakeMarker():
+
+	def __init__(self,x,y,z):
+		self.x = x
+		self.y = y
+		self.z = z
+
+def legacyPsPoseToVizTransform(psPose):
+
+	# phasespaceInterface.psPoseToVizTransform before psToVizConverter.  Kept here only as a reference point
+
+	pos_XYZ = [  psPose[0]*scale[0] + origin[0],
+	 psPose[1]*scale[1] + origin[1],
+	-psPose[2]*scale[2] + origin[2] ];
+
+	quat_ABCW = [ psPose[4], psPose[5], -psPose[6], -psPose[3] ];
+
+	transformViz = viz.Transform()
+	transformViz.setQuat(quat_ABCW)
+	transformViz.postTrans(pos_XYZ)
+	transformViz.postAxisAngle(0,1,0,90)
+
+	return transformViz
+
+def legacyPsPosToVizPos(posPS_XYZ):
+
+	# phasespaceInterface.psPosToVizPos before psToVizConverter
+
+	pos_XYZ = [  posPS_XYZ[0]*scale[0] + origin[0],
+	 posPS_XYZ[1]*scale[1] + origin[1],
+	-posPS_XYZ[2]*scale[2] + origin[2] ];
+
+	transformViz = viz.Transform()
+	transformViz.postTrans(pos_XYZ)
+	transformViz.postAxisAngle(0,1,0,90)
+
+	return transformViz.getPosition()
+
+def makeFrame():
+
+	# One OWL frame's worth of markers and rigid poses [x,y,z,w,a,b,c], in mm
+
+	random.seed(numMarkers)
+	np.random.seed(numMarkers)
+
+	markers_midx = [ fakeMarker(random.uniform(-4000,4000),random.uniform(0,2500),random.uniform(-4000,4000)) for mIdx in range(numMarkers) ]
+
+	poses_ridx = []
+
+	for rIdx in range(numRigids):
+
+		quat_WABC = np.random.randn(4)
+		quat_WABC = quat_WABC / np.sqrt(np.dot(quat_WABC,quat_WABC))
+
+		poses_ridx.append( [random.uniform(-4000,4000),random.uniform(0,2500),random.uniform(-4000,4000)] + list(quat_WABC) )
+
+	return [markers_midx, poses_ridx]
+
+def legacyConvertFrame(markers_midx,poses_ridx):
+
+	for rIdx in range(len(poses_ridx)):
+		legacyPsPoseToVizTransform(poses_ridx[rIdx])
+
+	for psMarker in markers_midx:
+		legacyPsPosToVizPos([psMarker.x, psMarker.y, psMarker.z])
+
+def convertFrame(converter,transforms_ridx,markers_midx,poses_ridx):
+
+	for rIdx in range(len(poses_ridx)):
+		converter.poseToVizTransform(poses_ridx[rIdx],transforms_ridx[rIdx])
+
+	posPS_midx_XYZ = np.array([ [psMarker.x, psMarker.y, psMarker.z] for psMarker in markers_midx ])
+	converter.posArrayToVizPos(posPS_midx_XYZ)
+
+def timeFrames(convertFunc,args,numFrames):
+
+	# Returns frames per second
+
+	startTime = time.clock()
+
+	for fIdx in range(numFrames):
+		convertFunc(*args)
+
+	return numFrames / (time.clock() - startTime)
+
+def checkAgreement(converter,markers_midx,poses_ridx):
+
+	# Largest difference between the two conversions, over every matrix element and marker coordinate
+
+	maxDiff = 0
+
+	for pose in poses_ridx:
+
+		legacyMat = np.array(legacyPsPoseToVizTransform(pose).get())
+		newMat = np.array(converter.poseToVizTransform(pose).get())
+
+		maxDiff = max(maxDiff,np.abs(legacyMat - newMat).max())
+
+	legacyPos_midx_XYZ = np.array([ legacyPsPosToVizPos([psMarker.x, psMarker.y, psMarker.z]) for psMarker in markers_midx ])
+	newPos_midx_XYZ = converter.posArrayToVizPos(np.array([ [psMarker.x, psMarker.y, psMarker.z] for psMarker in markers_midx ]))
+
+	return max(maxDiff,np.abs(legacyPos_midx_XYZ - newPos_midx_XYZ).max())
+
+def benchConversion(numFrames = 5000):
+
+	markers_midx, poses_ridx = makeFrame()
+
+	converter = mocapInterface.psToVizConverter(origin,scale)
+	transforms_ridx = [ viz.Transform() for rIdx in range(numRigids) ]
+
+	print 'benchConversion: %i frames of %i markers and %i rigids' % (numFrames,numMarkers,numRigids)
+	print '  largest difference from legacy: %g' % checkAgreement(converter,markers_midx,poses_ridx)
+	print '  method               frames/s   conversions/s'
+
+	legacyFPS = timeFrames(legacyConvertFrame,[markers_midx,poses_ridx],numFrames)
+	newFPS = timeFrames(convertFrame,[converter,transforms_ridx,markers_midx,poses_ridx],numFrames)
+
+	for label, fps in [['legacy',legacyFPS],['psToVizConverter',newFPS]]:
+		print '  %-18s %10.0f %15.0f' % (label,fps,fps * (numMarkers + numRigids))
+
+if __name__ == "__main__":
+
+	benchConversion()
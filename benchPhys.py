@@ -0,0 +1,150 @@
+"""
+Benchmarks for physEnv.
+
+Run from within Vizard (physEnv depends upon viz and ode).  No window is needed.
+
+benchCollideCostVsNodeCount:  per-frame cost of stepPhysics() as the number of physNodes in the room grows
+benchNarrowPhase:  cost of physEnv.detectCollisions() for the ball/floor (sphere-plane) and 
+	ball/paddle (sphere-cylinder) pairs, compared with the old callback that called ode.collide() once more per contact
+"""
+
+import time
+import random
+import ode
+import physEnv
+
+# Same room dimensions as exampleExpConfig.cfg (roomSize_WHL = 8,2.75,40)
+roomWidth = 8.0
+roomHeight = 2.75
+roomLength = 40.0
+
+def makeRoomPlanes(thePhysEnv):
+
+	# Same planes (ABCD) that visEnv.room creates for its walls, floor and ceiling
+
+	for planeABCD in physEnv.roomPlanes(roomWidth,roomHeight,roomLength).itervalues():
+		thePhysEnv.makePhysNode('plane',planeABCD)
+
+def fillWithBalls(thePhysEnv,numBalls,radius=0.07):
+
+	random.seed(numBalls)
+
+	ballList_bIdx = []
+
+	for bIdx in range(numBalls):
+
+		pos_XYZ = [random.uniform(-roomWidth/2 + radius, roomWidth/2 - radius),
+			random.uniform(radius, roomHeight - radius),
+			random.uniform(-roomLength/2 + radius, roomLength/2 - radius)]
+
+		ball = thePhysEnv.makePhysNode('sphere',pos_XYZ,radius)
+		ball.setVelocity([random.uniform(-5,5),random.uniform(-5,5),random.uniform(-5,5)])
+		ball.enableMovement()
+
+		ballList_bIdx.append(ball)
+
+	return ballList_bIdx
+
+def timeStepPhysics(thePhysEnv,numFrames):
+
+	# Returns the mean duration of stepPhysics() in ms
+
+	startTime = time.clock()
+
+	for fIdx in range(numFrames):
+		thePhysEnv.stepPhysics()
+
+	return 1000.0 * (time.clock() - startTime) / numFrames
+
+def benchCollideCostVsNodeCount(nodeCounts_nIdx = [5,10,25,50,100,200],numFrames = 120):
+
+	print 'benchCollideCostVsNodeCount: ' + str(numFrames) + ' frames per node count'
+	print '  numNodes   ms/frame   contacts/frame'
+
+	for numNodes in nodeCounts_nIdx:
+
+		thePhysEnv = physEnv.physEnv()
+		makeRoomPlanes(thePhysEnv)
+		fillWithBalls(thePhysEnv,numNodes)
+
+		msPerFrame = timeStepPhysics(thePhysEnv,numFrames)
+
+		# One more frame to count the contacts generated in a typical frame
+		thePhysEnv.stepPhysics()
+		numContacts = len(thePhysEnv.getCollisions())
+
+		print '  %8i   %8.3f   %14i' % (len(thePhysEnv.physNodes_phys),msPerFrame,numContacts)
+
+def legacyDetectCollisions(thePhysEnv, callbackArg, geom1, geom2):
+	
+	# The narrow phase of detectCollisions before contacts were generated once per pair.
+	# Kept here only as a reference point for benchNarrowPhase
+	
+	contactObjectList_idx = ode.collide(geom1, geom2)
+	
+	for contactObject in contactObjectList_idx:
+		
+		body1 = geom1.getBody()
+		body2 = geom2.getBody()
+		
+		physNode1 = thePhysEnv.returnPointerToPhysNode(geom1)
+		physNode2 = thePhysEnv.returnPointerToPhysNode(geom2)
+		
+		contactInfo = ode.collide(geom1,geom2)
+		
+		contactObject.setBounce(physNode1.bounciness * physNode2.bounciness )
+		contactObject.setBounceVel(thePhysEnv.minBounceVel)
+		contactObject.setMu(physNode1.friction * physNode2.friction )
+		
+		contactJoint = ode.ContactJoint(thePhysEnv.world, thePhysEnv.jointGroup, contactObject)
+		contactJoint.attach(body1, body2)
+
+def timeNarrowPhase(thePhysEnv,detectFunc,geom1,geom2,numCalls):
+	
+	# Returns the mean duration of one call to detectFunc in microseconds
+	# detectFunc is called as detectFunc(thePhysEnv, thePhysEnv, geom1, geom2), like an unbound physEnv.detectCollisions
+	
+	startTime = time.clock()
+	
+	for cIdx in range(numCalls):
+		detectFunc(thePhysEnv,thePhysEnv,geom1,geom2)
+		
+		# Keep the joint group from growing 
+		if( cIdx % 100 == 0 ):
+			thePhysEnv.emptyCollisionBuffer()
+	
+	return 1000000.0 * (time.clock() - startTime) / numCalls
+
+def benchNarrowPhase(numCalls = 20000):
+	
+	thePhysEnv = physEnv.physEnv()
+	
+	radius = 0.07
+	
+	# Ball resting slightly inside the floor
+	theFloor = thePhysEnv.makePhysNode('plane',[0,1,0,0])
+	floorBall = thePhysEnv.makePhysNode('sphere',[0,radius - 0.005,0],radius)
+	
+	# Ball touching the face of a paddle-sized cylinder (height,radius)
+	thePaddle = thePhysEnv.makePhysNode('cylinder_Z',[2,1,0],[0.04,0.15])
+	paddleBall = thePhysEnv.makePhysNode('sphere',[2,1,0.02 + radius - 0.005],radius)
+	
+	pairs_pIdx = [ ['sphere-plane',floorBall.geom,theFloor.geom],
+		['sphere-cylinder',paddleBall.geom,thePaddle.geom] ]
+	
+	print 'benchNarrowPhase: ' + str(numCalls) + ' calls per pair'
+	print '  pair              contacts   legacy us/call   detectCollisions us/call'
+	
+	for pairName, geom1, geom2 in pairs_pIdx:
+		
+		numContacts = len(ode.collide(geom1,geom2))
+		
+		legacyTime = timeNarrowPhase(thePhysEnv,legacyDetectCollisions,geom1,geom2,numCalls)
+		newTime = timeNarrowPhase(thePhysEnv,physEnv.physEnv.detectCollisions,geom1,geom2,numCalls)
+		
+		print '  %-16s  %8i   %14.2f   %24.2f' % (pairName,numContacts,legacyTime,newTime)
+
+if __name__ == "__main__":
+
+	benchCollideCostVsNodeCount()
+	benchNarrowPhase()
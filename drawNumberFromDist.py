@@ -40,6 +40,38 @@ def drawFromGaussianTruncated(muSigmaClip):
 	
 	return randNum
 	
+def getTrialVarDist(expCfg,trialType,varName):
+	
+	# Returns [distType, distParams] of a variable in the [trialTypes] section of the experiment config.
+	# Taken from the [[trialType]] subsection, or from [[default]] if it is not there
+	
+	try:
+		distType = expCfg['trialTypes'][trialType][varName + '_distType']
+		distParams = expCfg['trialTypes'][trialType][varName + '_distParams']
+	except KeyError:
+		distType = expCfg['trialTypes']['default'][varName + '_distType']
+		distParams = expCfg['trialTypes']['default'][varName + '_distParams']
+		
+	return distType, distParams
+
+def drawTrialParams(expCfg,trialType):
+	
+	# Draws a value for every variable that has a _distType in [trialTypes] [[default]]
+	# Returns {varName: [distType, distParams, value]}
+	# Used by main.trial, and by simulateTrials.py
+	
+	drawnParams = {}
+	
+	for key in expCfg['trialTypes']['default'].keys():
+		if( key.endswith('_distType') ):
+			
+			varName = key[0:-9]
+			
+			distType, distParams = getTrialVarDist(expCfg,trialType,varName)
+			drawnParams[varName] = [distType, distParams, drawNumberFromDist(distType,distParams)]
+	
+	return drawnParams
+	
 if __name__ == "__main__":
 	
 	a = drawNumberFromDist('gaussianTruncated',[10,1,2])
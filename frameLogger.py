@@ -0,0 +1,232 @@
+"""
+Per-frame data, logged as binary rows rather than text.
+
+Each writable declares the fields it logs, and fills them in on each frame:
+
+	def getLogFields(self):
+		# [name, dtype] for one value, [name, dtype, count] for several
+		return [ ['frameTime','f8'], ['eventFlag','i4'], ['trialType','S32'], ['viewPos_XYZ','f8',3] ]
+
+	def fillLogRow(self,row):
+		row['frameTime'] = viz.getFrameTime()
+		...
+
+frameLogger joins the fields of its writables into one numpy record dtype, and fills one row of a preallocated block per frame.
+Full blocks are appended to the file as .npy chunks, so nothing is formatted or parsed in the frame loop.
+Counts follow the legend of the text logs (1, 2, 3, 4 or 16 values), so that a log can always be exported as text.
+With asyncWrite, the blocks are written by an asyncWriter.asyncFileWriter thread, and flush() does not wait on the disk.
+The DVR records only the row number of each frame (getOutput), and not the text of the writables.
+
+	data = frameLogger.loadFrameLog('Data/exp_data-2014-5-1-12-0.npy')
+	data['viewPos_XYZ'][ data['eventFlag'] == 1 ]
+
+	python frameLogger.py <file.npy>	writes <file>.txt in the text log format (Experiment.getOutput)
+"""
+
+import os
+import io
+import numpy as np
+import asyncWriter
+
+# Number of values -> the delimiters used for them in text logs
+textDelimitersByCount = { 1: ['*','*'], 2: ['(',')'], 3: ['[',']'], 4: ['<','>'], 16: ['@','@'] }
+
+def fieldsToDtype(fields):
+
+	# [[name, dtype(, count)], ...] -> numpy dtype.  Raises ValueError for repeated names, or counts that have no text delimiter
+
+	dtypeList = []
+	names = set()
+
+	for field in fields:
+
+		name = field[0]
+		count = field[2] if len(field) > 2 else 1
+
+		if( name in names ):
+			raise ValueError('frameLogger: More than one field is named ' + name)
+
+		if( count not in textDelimitersByCount ):
+			raise ValueError('frameLogger: %s has %i values.  Fields have one of %s' % (name,count,sorted(textDelimitersByCount.keys())))
+
+		names.add(name)
+
+		if( count == 1 ):
+			dtypeList.append( (name,field[1]) )
+		else:
+			dtypeList.append( (name,field[1],(count,)) )
+
+	return np.dtype(dtypeList)
+
+class frameLogger():
+
+	def __init__(self,fileName,writables,blockLength=600,asyncWrite=False):
+
+		self.fileName = fileName
+
+		# Only writables that declare their fields are logged
+		self.writables = [ writable for writable in writables if hasattr(writable,'getLogFields') ]
+
+		for writable in writables:
+			if( writable is not None and not hasattr(writable,'getLogFields') ):
+				print 'frameLogger: ' + writable.__class__.__name__ + ' has no getLogFields(), and will not be logged'
+
+		fields = []
+
+		for writable in self.writables:
+			fields.extend( writable.getLogFields() )
+
+		self.dtype = fieldsToDtype(fields)
+
+		self.blockLength = blockLength
+		self.block_row = np.zeros(blockLength,dtype=self.dtype)
+		self.numRowsInBlock = 0
+		self.numRowsWritten = 0
+		self.numRowsDropped = 0
+
+		if( asyncWrite ):
+			self.fileObject = asyncWriter.asyncFileWriter(fileName,'wb')
+		else:
+			self.fileObject = open(fileName,'wb')
+
+	def write(self):
+
+		# Fills the next row from every writable.  Fields a writable leaves alone are 0 for that frame
+
+		row = self.block_row[self.numRowsInBlock]
+
+		for writable in self.writables:
+			writable.fillLogRow(row)
+
+		self.numRowsInBlock += 1
+
+		if( self.numRowsInBlock == self.blockLength ):
+			self.flush()
+
+		# The block is reused, so clear the row for the next frame
+		self.block_row[self.numRowsInBlock % self.blockLength] = 0
+
+	def getOutput(self):
+
+		# For the DVR, in place of the text of each writable:  the row last written, so that the movie's frames can be matched to rows
+
+		return '* frameLogRow %i * ' % (self.numRowsWritten + self.numRowsInBlock - 1)
+
+	def flush(self):
+
+		if( self.numRowsInBlock == 0 or self.fileObject is None ):
+			return
+
+		# Saved to a copy, so that an asyncFileWriter can write it while the block is refilled
+		chunkBuffer = io.BytesIO()
+		np.save(chunkBuffer,self.block_row[:self.numRowsInBlock])
+
+		# An asyncFileWriter with a full queue drops the block, and returns False
+		if( self.fileObject.write(chunkBuffer.getvalue()) is False ):
+			self.numRowsDropped += self.numRowsInBlock
+		else:
+			self.numRowsWritten += self.numRowsInBlock
+
+		self.fileObject.flush()
+
+		self.numRowsInBlock = 0
+
+	def drain(self):
+
+		# Flushes, and waits until the rows are on disk
+
+		self.flush()
+
+		if( isinstance(self.fileObject,asyncWriter.asyncFileWriter) ):
+			self.fileObject.drain()
+
+	def close(self):
+
+		if( self.fileObject is None ):
+			return
+
+		self.flush()
+
+		self.fileObject.close()
+		self.fileObject = None
+
+		print 'frameLogger: Wrote %i frames to %s' % (self.numRowsWritten,self.fileName)
+
+		if( self.numRowsDropped ):
+			print 'frameLogger: Dropped %i frames of %s while the disk was stalled' % (self.numRowsDropped,self.fileName)
+
+def loadFrameLog(fileName):
+
+	# Returns every row of a log, as one numpy record array
+
+	fileSize = os.path.getsize(fileName)
+	fileObject = open(fileName,'rb')
+
+	chunks = []
+
+	while( fileObject.tell() < fileSize ):
+		chunks.append( np.load(fileObject) )
+
+	fileObject.close()
+
+	if( len(chunks) == 0 ):
+		raise IOError(fileName + ' has no frames')
+
+	return np.concatenate(chunks)
+
+def _formatValue(value):
+
+	if( isinstance(value,(float,np.floating)) ):
+		return '%f' % value
+
+	if( isinstance(value,(int,long,np.integer,np.bool_)) ):
+		return '%i' % value
+
+	return str(value)
+
+def rowToText(row):
+
+	# One line in the format of Experiment.getOutput:  * name value * ( name v1 v2 ) [ name v1 v2 v3 ] ...
+
+	outputString = ''
+
+	for name in row.dtype.names:
+
+		value = row[name]
+
+		if( isinstance(value,np.ndarray) ):
+			values = [ _formatValue(element) for element in value.flat ]
+		else:
+			values = [ _formatValue(value) ]
+
+		opening, closing = textDelimitersByCount[len(values)]
+
+		outputString = outputString + '%s %s %s %s ' % (opening,name,' '.join(values),closing)
+
+	return outputString
+
+def exportText(fileName,textFileName=None):
+
+	# Writes a log out in the text format.  Returns the name of the text file
+
+	if( textFileName is None ):
+		textFileName = os.path.splitext(fileName)[0] + '.txt'
+
+	data = loadFrameLog(fileName)
+
+	textFile = open(textFileName,'w')
+
+	for row in data:
+		textFile.write(rowToText(row) + '\n')
+
+	textFile.close()
+
+	print 'frameLogger: Exported %i frames to %s' % (len(data),textFileName)
+
+	return textFileName
+
+if __name__ == "__main__":
+
+	import sys
+
+	exportText(sys.argv[1])
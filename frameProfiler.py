@@ -0,0 +1,215 @@
+"""
+Per-frame timing of the callbacks that make up the frame loop.
+
+Register per-frame callbacks through this module instead of vizact:
+
+	frameProfiler.onupdate('applyPhysToVis', viz.PRIORITY_FIRST_UPDATE, self.applyPhysToVis)
+	self.callback(viz.POST_SWAP_EVENT, frameProfiler.wrap('recordData', viz.PRIORITY_LAST_UPDATE, func), viz.PRIORITY_LAST_UPDATE)
+
+Until enable() is called (see use_frameProfiler in sysCfgSpec.ini), these are plain vizact.onupdate / the unwrapped function.
+
+Once enabled, the wall time of each callback is added to a preallocated ring buffer with one row per frame
+and one column (slot) per label.  Callbacks that share a label, such as the applyPhysToVis of every visObj, share a slot.
+An overlay shows the mean and max time per priority and per label over the last second,
+and the buffer is written to <outFileName>.csv and <outFileName>.npy on exit.
+"""
+
+import time
+import viz
+import vizact
+import numpy as np
+
+# The profiler in use, or None.  Set by enable()
+profiler = None
+
+class frameProfiler():
+
+	def __init__(self,numFrames=3600,maxSlots=32,showOverlay=True,outFileName='frameProfile'):
+
+		self.numFrames = numFrames
+		self.maxSlots = maxSlots
+		self.outFileName = outFileName
+
+		# Ring buffer.  Row (frame number % numFrames) holds the time (s) spent in each slot on that frame
+		self.time_fr_slot = np.zeros((numFrames,maxSlots))
+		self.frameNum_fr = np.zeros(numFrames,dtype=np.int64) - 1
+		self.frameElapsed_fr = np.zeros(numFrames)
+
+		# One label and priority per slot
+		self.labels_slot = []
+		self.priorities_slot = []
+		self.slotByLabel = {}
+
+		self.currentFrame = -1
+		self.currentRow = 0
+
+		self.overlayText = None
+
+		if( showOverlay ):
+			vizact.ontimer(0.5,self.updateOverlay)
+
+		vizact.onexit(self.dump)
+
+	def getSlot(self,label,priority):
+
+		# Returns the slot of a label, or None if there are no slots left
+
+		slot = self.slotByLabel.get(label)
+
+		if( slot is None ):
+
+			if( len(self.labels_slot) == self.maxSlots ):
+				print 'frameProfiler.getSlot(): No slots left.  ' + label + ' will not be profiled.'
+				return None
+
+			slot = len(self.labels_slot)
+
+			self.labels_slot.append(label)
+			self.priorities_slot.append(priority)
+			self.slotByLabel[label] = slot
+
+		return slot
+
+	def wrap(self,label,priority,func):
+
+		slot = self.getSlot(label,priority)
+
+		if( slot is None ):
+			return func
+
+		def timedFunc(*args,**kwargs):
+
+			frameNum = viz.getFrameNumber()
+
+			if( frameNum != self.currentFrame ):
+				self._startFrame(frameNum)
+
+			startTime = time.clock()
+
+			try:
+				return func(*args,**kwargs)
+			finally:
+				self.time_fr_slot[self.currentRow,slot] += time.clock() - startTime
+
+		return timedFunc
+
+	def _startFrame(self,frameNum):
+
+		# Called by the first profiled callback of each frame.  Clears the row it is about to fill
+
+		self.currentFrame = frameNum
+		self.currentRow = frameNum % self.numFrames
+
+		self.time_fr_slot[self.currentRow,:] = 0
+		self.frameNum_fr[self.currentRow] = frameNum
+		self.frameElapsed_fr[self.currentRow] = viz.getFrameElapsed()
+
+	def getRecordedFrames(self):
+
+		# Returns [frameNum_fr, frameElapsed_fr, time_fr_slot] for the frames still in the ring buffer, oldest first
+
+		numSlots = len(self.labels_slot)
+
+		rows_fr = np.flatnonzero( self.frameNum_fr >= 0 )
+		rows_fr = rows_fr[ np.argsort(self.frameNum_fr[rows_fr]) ]
+
+		return [ self.frameNum_fr[rows_fr], self.frameElapsed_fr[rows_fr], self.time_fr_slot[rows_fr,:numSlots] ]
+
+	def getSummary(self,windowS=1.0):
+
+		# Returns [[priority, label, mean ms, max ms], ...] over the frames of the last windowS seconds (at least one), sorted by priority
+
+		frameNum_fr, frameElapsed_fr, time_fr_slot = self.getRecordedFrames()
+
+		# Frame durations, newest first, so that the window holds the same time at any frame rate
+		elapsedSinceNewest_fr = np.cumsum(frameElapsed_fr[::-1])
+		numRecentFrames = max( 1, np.searchsorted(elapsedSinceNewest_fr,windowS,side='right') )
+
+		time_fr_slot = time_fr_slot[-numRecentFrames:]
+
+		if( len(time_fr_slot) == 0 ):
+			return []
+
+		meanMS_slot = 1000 * time_fr_slot.mean(axis=0)
+		maxMS_slot = 1000 * time_fr_slot.max(axis=0)
+
+		summary_slot = [ [self.priorities_slot[slot], self.labels_slot[slot], meanMS_slot[slot], maxMS_slot[slot]]
+			for slot in range(len(self.labels_slot)) ]
+
+		summary_slot.sort()
+
+		return summary_slot
+
+	def updateOverlay(self):
+
+		if( self.overlayText is None ):
+			self.overlayText = viz.addText('',viz.SCREEN)
+			self.overlayText.setPosition(0.01,0.97)
+			self.overlayText.fontSize(14)
+			self.overlayText.alignment(viz.ALIGN_LEFT_TOP)
+			self.overlayText.color(viz.YELLOW)
+
+		summary_slot = self.getSummary()
+
+		lines_idx = ['frame %.2f ms' % (1000 * viz.getFrameElapsed())]
+
+		lastPriority = None
+
+		# One line per priority, followed by one line per label
+		for priority, label, meanMS, maxMS in summary_slot:
+
+			if( priority != lastPriority ):
+
+				priorityMeanMS = sum( [ entry[2] for entry in summary_slot if entry[0] == priority ] )
+				lines_idx.append('priority %i: %.2f ms' % (priority,priorityMeanMS))
+
+				lastPriority = priority
+
+			lines_idx.append('   %-24s %6.2f  (max %6.2f)' % (label,meanMS,maxMS))
+
+		self.overlayText.message('\n'.join(lines_idx))
+
+	def dump(self):
+
+		# Writes the ring buffer to <outFileName>.npy and <outFileName>.csv.  One row per frame, times in ms
+
+		frameNum_fr, frameElapsed_fr, time_fr_slot = self.getRecordedFrames()
+
+		columns_col = ['frameNum','frameElapsedMS'] + [ '%s(%i)' % (self.labels_slot[slot],self.priorities_slot[slot]) for slot in range(len(self.labels_slot)) ]
+
+		table_fr_col = np.column_stack( [frameNum_fr, 1000 * frameElapsed_fr, 1000 * time_fr_slot] )
+
+		np.save(self.outFileName + '.npy',table_fr_col)
+
+		csvFile = open(self.outFileName + '.csv','w')
+		csvFile.write(','.join(columns_col) + '\n')
+		np.savetxt(csvFile,table_fr_col,fmt='%.4f',delimiter=',')
+		csvFile.close()
+
+		print 'frameProfiler: Wrote %i frames to %s.csv' % (len(frameNum_fr),self.outFileName)
+
+def enable(numFrames=3600,showOverlay=True,outFileName='frameProfile'):
+
+	# Callbacks registered through onupdate() and wrap() from now on are profiled
+
+	global profiler
+
+	if( profiler is None ):
+		profiler = frameProfiler(numFrames,showOverlay=showOverlay,outFileName=outFileName)
+
+	return profiler
+
+def wrap(label,priority,func):
+
+	# Returns func, timed if the profiler is enabled
+
+	if( profiler is None ):
+		return func
+
+	return profiler.wrap(label,priority,func)
+
+def onupdate(label,priority,func,*args):
+
+	# vizact.onupdate(priority,func,*args), timed under label if the profiler is enabled
+
+	return vizact.onupdate(priority,wrap(label,priority,func),*args)
@@ -0,0 +1,557 @@
+"""
+Reads the text logs (exp_data-*.txt, eye_data-*.txt) into numpy record arrays, or pandas DataFrames.
+
+Each line is a run of fields in the legend of Experiment.getOutput:
+
+	* name value *   ( name v1 v2 )   [ name v1 v2 v3 ]   < name v1 .. v4 >   @ name v1 .. v16 @
+
+The fields (names, number of values, numeric or not) are taken from the first line, and every line is expected to have the same ones.
+Numeric fields become float64, others strings.  Fields with more than one value are arrays:  data['viewPos_XYZ'][:,1]
+
+Files are memory-mapped and parsed in chunks of whole lines, in one process per CPU.  If pandas is installed, each chunk goes through
+its C tokenizer (read_csv), split at single spaces into the columns of the first line, reading only the value columns.
+Only a few lines of each chunk are checked against the first line.  The rest are only checked by their values parsing as numbers,
+which catches truncated lines and lines of another run with other fields, but not one with the same fields under other names.
+Otherwise each chunk is split into tokens all at once, and since every line has the same number of tokens, each field is a fixed stride through them.
+Chunks that don't parse (a truncated last line, a line from another run) are parsed line by line, and lines that don't fit are skipped.
+
+	data = logParser.parseFile('Data/exp_data-2014-5-1-12-0.txt')
+	data_f = logParser.parseFiles(glob.glob('Data/exp_data-*.txt'))		# one process per file
+	data = logParser.parseFile('Data/huge.txt',numProcesses=1)		# one file, in this process
+	dataFrame = logParser.toDataFrame(data)					# if pandas is installed
+
+Multiple processes need a plain Python (not Vizard, where parseFile uses one), and the usual  if __name__ == "__main__":  guard around the call on Windows.
+"""
+
+import io
+import os
+import sys
+import csv
+import mmap
+import multiprocessing
+import numpy as np
+
+try:
+	import pandas
+except ImportError:
+	pandas = None
+
+# Opening delimiter -> closing delimiter
+closingDelimiters = { '*': '*', '(': ')', '[': ']', '<': '>', '@': '@' }
+
+# Chunks are about this long, and end at a line break
+defaultChunkBytes = 16 * 1024 * 1024
+
+# Lines of each chunk checked against the first line, on the pandas path
+numCheckedLines = 8
+
+def _isNumber(token):
+
+	try:
+		float(token)
+		return True
+	except ValueError:
+		return False
+
+def inferSchema(line):
+
+	# Returns [[name, count, isNumeric], ...] for the fields of one line
+
+	tokens = line.split()
+	schema = []
+
+	tokenIdx = 0
+
+	while( tokenIdx < len(tokens) ):
+
+		opening = tokens[tokenIdx]
+
+		if( opening not in closingDelimiters or tokenIdx + 1 >= len(tokens) ):
+			raise ValueError('logParser.inferSchema: Expected a field at token %i of: %s' % (tokenIdx,line.strip()))
+
+		name = tokens[tokenIdx + 1]
+		closing = closingDelimiters[opening]
+
+		try:
+			closingIdx = tokens.index(closing,tokenIdx + 2)
+		except ValueError:
+			raise ValueError('logParser.inferSchema: ' + name + ' is not closed with ' + closing)
+
+		values = tokens[tokenIdx + 2:closingIdx]
+
+		schema.append( [name, len(values), all( [ _isNumber(value) for value in values ] )] )
+
+		tokenIdx = closingIdx + 1
+
+	return schema
+
+class _tokenLayout():
+
+	# Where each field's name and values fall among the tokens of a line.
+	# line (the first line of the file) also gives each token's column when split at single spaces
+
+	def __init__(self,schema,line=None):
+
+		self.schema = schema
+		self.namePos_f = []
+		self.valuePos_f = []
+
+		tokenPos = 0
+
+		for name, count, isNumeric in schema:
+
+			self.namePos_f.append(tokenPos + 1)
+			self.valuePos_f.append(range(tokenPos + 2,tokenPos + 2 + count))
+
+			tokenPos += count + 3
+
+		self.tokensPerLine = tokenPos
+
+		# Rows of the numeric block, per field
+		self.numericPos = []
+		self.numericRows_f = []
+
+		for fIdx in range(len(schema)):
+
+			if( schema[fIdx][2] ):
+				self.numericRows_f.append( range(len(self.numericPos),len(self.numericPos) + schema[fIdx][1]) )
+				self.numericPos.extend( self.valuePos_f[fIdx] )
+			else:
+				self.numericRows_f.append(None)
+
+		self.stringPos = []
+
+		for fIdx in range(len(schema)):
+			if( not schema[fIdx][2] ):
+				self.stringPos.extend( self.valuePos_f[fIdx] )
+
+		self.columns = None
+		self.columnPos_t = None
+
+		if( line is not None ):
+			self.columns = line.rstrip('\r\n').split(' ')
+			self.columnPos_t = [ cIdx for cIdx in range(len(self.columns)) if self.columns[cIdx] ]
+
+	def matches(self,tokens,numLines):
+
+		# True if tokens are numLines whole lines with the right field names
+
+		if( len(tokens) != numLines * self.tokensPerLine ):
+			return False
+
+		for fIdx in range(len(self.schema)):
+
+			name = self.schema[fIdx][0]
+
+			if( tokens[self.namePos_f[fIdx]::self.tokensPerLine].count(name) != numLines ):
+				return False
+
+		return True
+
+	def lineMatches(self,tokens):
+
+		if( len(tokens) != self.tokensPerLine ):
+			return False
+
+		for fIdx in range(len(self.schema)):
+			if( tokens[self.namePos_f[fIdx]] != self.schema[fIdx][0] ):
+				return False
+
+		return all( [ _isNumber(tokens[pos]) for pos in self.numericPos ] )
+
+	def lineSpacingMatches(self,line):
+
+		# True if line fits, with its tokens in the columns of the first line
+
+		columns = line.rstrip('\r\n').split(' ')
+
+		if( len(columns) != len(self.columns) ):
+			return False
+
+		if( [ cIdx for cIdx in range(len(columns)) if columns[cIdx] ] != self.columnPos_t ):
+			return False
+
+		return self.lineMatches(line.split())
+
+	def emptyArray(self):
+
+		# No lines, in the fields of the schema.  String fields are widened by _concatenate to those of other chunks
+
+		dtypeList = []
+
+		for name, count, isNumeric in self.schema:
+
+			dtype = 'f8' if isNumeric else 'S1'
+
+			if( count == 1 ):
+				dtypeList.append( (name,dtype) )
+			else:
+				dtypeList.append( (name,dtype,(count,)) )
+
+		return np.zeros(0,dtype=dtypeList)
+
+	def toArray(self,tokens,numLines):
+
+		# tokens of numLines whole lines -> record array
+
+		if( numLines == 0 ):
+			return self.emptyArray()
+
+		stride = self.tokensPerLine
+
+		# Every numeric column, one after another, through one strtod pass
+		numeric_col_l = None
+
+		if( len(self.numericPos) ):
+			numericText = ' '.join( [ ' '.join(tokens[pos::stride]) for pos in self.numericPos ] )
+			numeric_col_l = np.fromstring(numericText,sep=' ').reshape(len(self.numericPos),numLines)
+
+		strings_f = {}
+
+		for fIdx in range(len(self.schema)):
+			if( not self.schema[fIdx][2] ):
+				strings_f[fIdx] = np.array( [ tokens[pos::stride] for pos in self.valuePos_f[fIdx] ], dtype=str )
+
+		return self.toRecords(numeric_col_l,strings_f,numLines)
+
+	def toRecords(self,numeric_col_l,strings_f,numLines):
+
+		# numeric_col_l:  one row per numeric value (numericPos), one column per line.  strings_f:  fIdx -> [value, line] strings
+
+		dtypeList = []
+
+		for fIdx in range(len(self.schema)):
+
+			name, count, isNumeric = self.schema[fIdx]
+
+			if( isNumeric ):
+				dtype = 'f8'
+			else:
+				dtype = strings_f[fIdx].dtype.str
+
+			if( count == 1 ):
+				dtypeList.append( (name,dtype) )
+			else:
+				dtypeList.append( (name,dtype,(count,)) )
+
+		data = np.zeros(numLines,dtype=dtypeList)
+
+		for fIdx in range(len(self.schema)):
+
+			name, count, isNumeric = self.schema[fIdx]
+
+			if( isNumeric ):
+				values_v_l = numeric_col_l[self.numericRows_f[fIdx]]
+			else:
+				values_v_l = strings_f[fIdx]
+
+			if( count == 1 ):
+				data[name] = values_v_l[0]
+			else:
+				data[name] = values_v_l.T
+
+		return data
+
+def _getCheckedLines(text):
+
+	# The first and last lines of text, and a few evenly spaced between.  Without copying text
+
+	starts = [0]
+
+	for offset in np.linspace(0,len(text),numCheckedLines,endpoint=False)[1:].astype(int):
+
+		start = text.find('\n',offset) + 1
+
+		if( start > 0 ):
+			starts.append(start)
+
+	# The last line, before any line breaks at the end
+	end = len(text)
+
+	while( end > 0 and text[end - 1] in '\r\n' ):
+		end -= 1
+
+	starts.append( text.rfind('\n',0,end) + 1 )
+
+	lines = []
+
+	for start in sorted(set(starts)):
+
+		end = text.find('\n',start)
+
+		if( end < 0 ):
+			end = len(text)
+
+		if( text[start:end].strip() ):
+			lines.append(text[start:end])
+
+	return lines
+
+def _parseTextPandas(text,layout):
+
+	# Whole chunk through pandas' C tokenizer and strtod, reading only the value columns.  Returns None unless every line parses,
+	# for _parseText to go line by line.  A line that doesn't fit puts a name, delimiter or nothing in a value column, or has too many columns
+
+	for line in _getCheckedLines(text):
+		if( not layout.lineSpacingMatches(line) ):
+			return None
+
+	numericCols = [ layout.columnPos_t[pos] for pos in layout.numericPos ]
+	stringCols = [ layout.columnPos_t[pos] for pos in layout.stringPos ]
+
+	dtype_col = dict( [ (col,np.float64) for col in numericCols ] + [ (col,str) for col in stringCols ] )
+
+	try:
+		table = pandas.read_csv( io.BytesIO(text), sep=' ', header=None, names=range(len(layout.columns)), usecols=numericCols + stringCols,
+			dtype=dtype_col, na_filter=False, quoting=csv.QUOTE_NONE, float_precision='high' )
+
+	# (pandas' ParserError and EmptyDataError are ValueErrors)
+	except ValueError:
+		return None
+
+	numLines = len(table)
+
+	if( numLines == 0 ):
+		return None
+
+	numeric_col_l = None
+
+	if( len(numericCols) ):
+		numeric_col_l = np.array( [ table[col].values for col in numericCols ] )
+
+	strings_f = {}
+
+	for fIdx in range(len(layout.schema)):
+		if( not layout.schema[fIdx][2] ):
+			strings_f[fIdx] = np.array( [ table[layout.columnPos_t[pos]].values for pos in layout.valuePos_f[fIdx] ], dtype=str )
+
+	return layout.toRecords(numeric_col_l,strings_f,numLines)
+
+def _parseText(text,layout):
+
+	# Returns [data, numLinesSkipped]
+
+	if( pandas is not None and layout.columns is not None ):
+
+		data = _parseTextPandas(text,layout)
+
+		if( data is not None ):
+			return [data, 0]
+
+	else:
+
+		tokens = text.split()
+		numLines = len(tokens) // layout.tokensPerLine
+
+		if( layout.matches(tokens,numLines) ):
+
+			# Unless a numeric field has something else in it
+			try:
+				return [layout.toArray(tokens,numLines), 0]
+			except ValueError:
+				pass
+
+	# Slow path.  Keep the lines that fit
+	tokens = []
+	numLines = 0
+	numLinesSkipped = 0
+
+	for line in text.splitlines():
+
+		lineTokens = line.split()
+
+		if( len(lineTokens) == 0 ):
+			continue
+
+		if( layout.lineMatches(lineTokens) ):
+			tokens.extend(lineTokens)
+			numLines += 1
+		else:
+			numLinesSkipped += 1
+
+	return [layout.toArray(tokens,numLines), numLinesSkipped]
+
+def _getChunkRanges(mapped,fileSize,chunkBytes):
+
+	# [[start, end], ...] byte ranges that end at a line break
+
+	ranges = []
+	start = 0
+
+	while( start < fileSize ):
+
+		end = min(start + chunkBytes,fileSize)
+
+		if( end < fileSize ):
+			end = ( mapped.find('\n',end) + 1 ) or fileSize
+
+		ranges.append([start,end])
+		start = end
+
+	return ranges
+
+def _concatenate(chunks):
+
+	# Chunks differ only in the width of their string fields
+
+	if( len(chunks) == 1 ):
+		return chunks[0]
+
+	if( all( [ chunk.dtype == chunks[0].dtype for chunk in chunks ] ) ):
+		return np.concatenate(chunks)
+
+	dtypeList = []
+
+	for name in chunks[0].dtype.names:
+
+		fieldDtypes = [ chunk.dtype.fields[name][0] for chunk in chunks ]
+
+		if( fieldDtypes[0].subdtype ):
+			baseDtype, shape = fieldDtypes[0].subdtype
+			itemSize = max( [ fieldDtype.subdtype[0].itemsize for fieldDtype in fieldDtypes ] )
+		else:
+			baseDtype, shape = fieldDtypes[0], ()
+			itemSize = max( [ fieldDtype.itemsize for fieldDtype in fieldDtypes ] )
+
+		if( baseDtype.kind == 'S' ):
+			baseDtype = np.dtype('S%i' % itemSize)
+
+		dtypeList.append( (name,baseDtype,shape) )
+
+	dtype = np.dtype(dtypeList)
+
+	return np.concatenate( [ chunk.astype(dtype) for chunk in chunks ] )
+
+def _parseRange(job):
+
+	fileName, start, end, firstLine = job
+
+	fileObject = open(fileName,'rb')
+	mapped = mmap.mmap(fileObject.fileno(),0,access=mmap.ACCESS_READ)
+
+	try:
+		return _parseText(mapped[start:end],_tokenLayout(inferSchema(firstLine),firstLine))
+	finally:
+		mapped.close()
+		fileObject.close()
+
+def parseFile(fileName,chunkBytes=defaultChunkBytes,numProcesses=None,asDataFrame=False):
+
+	# Returns a record array with one row per line (or a DataFrame, see toDataFrame).
+	# numProcesses defaults to the number of CPUs, or 1 inside Vizard
+
+	if( numProcesses is None ):
+		numProcesses = 1 if 'viz' in sys.modules else multiprocessing.cpu_count()
+
+	fileSize = os.path.getsize(fileName)
+
+	if( fileSize == 0 ):
+		raise IOError(fileName + ' is empty')
+
+	# A chunk for each process, at least
+	chunkBytes = max( min(chunkBytes,fileSize // numProcesses + 1), 1 )
+
+	fileObject = open(fileName,'rb')
+	mapped = mmap.mmap(fileObject.fileno(),0,access=mmap.ACCESS_READ)
+
+	try:
+		firstLine = mapped.readline()
+		schema = inferSchema(firstLine)
+		ranges = _getChunkRanges(mapped,fileSize,chunkBytes)
+
+		if( numProcesses == 1 or len(ranges) == 1 ):
+			numProcesses = 1
+			layout = _tokenLayout(schema,firstLine)
+			results_c = [ _parseText(mapped[start:end],layout) for start, end in ranges ]
+
+	finally:
+		mapped.close()
+		fileObject.close()
+
+	if( numProcesses != 1 ):
+
+		pool = multiprocessing.Pool(numProcesses)
+
+		try:
+			results_c = pool.map( _parseRange, [ [fileName, start, end, firstLine] for start, end in ranges ] )
+		finally:
+			pool.close()
+			pool.join()
+
+	numLinesSkipped = sum( [ numSkipped for chunk, numSkipped in results_c ] )
+
+	if( numLinesSkipped ):
+		print 'logParser.parseFile: Skipped %i lines of %s that did not match its first line' % (numLinesSkipped,fileName)
+
+	data = _concatenate( [ chunk for chunk, numSkipped in results_c ] )
+
+	if( asDataFrame ):
+		return toDataFrame(data)
+
+	return data
+
+def _parseFileJob(job):
+
+	return parseFile(*job)
+
+def parseFiles(fileNames,chunkBytes=defaultChunkBytes,numProcesses=None,asDataFrame=False):
+
+	# parseFile for each file, one file per process (and one process per file).  Returns a list in the order of fileNames
+
+	pool = multiprocessing.Pool(numProcesses)
+
+	try:
+		data_f = pool.map( _parseFileJob, [ [fileName, chunkBytes, 1] for fileName in fileNames ], 1 )
+	finally:
+		pool.close()
+		pool.join()
+
+	if( asDataFrame ):
+		return [ toDataFrame(data) for data in data_f ]
+
+	return data_f
+
+def toDataFrame(data):
+
+	# One column per value.  viewPos_XYZ becomes viewPos_X, viewPos_Y, viewPos_Z.  Other fields with n values become name_0 .. name_n-1
+
+	if( pandas is None ):
+		raise ImportError('logParser.toDataFrame needs pandas')
+
+	columns = []
+	values_col = []
+
+	for name in data.dtype.names:
+
+		values = data[name]
+
+		if( values.ndim == 1 ):
+			columns.append(name)
+			values_col.append(values)
+			continue
+
+		count = values.shape[1]
+		stem, separator, suffix = name.rpartition('_')
+
+		if( separator and len(suffix) == count ):
+			valueNames = [ stem + '_' + letter for letter in suffix ]
+		else:
+			valueNames = [ '%s_%i' % (name,vIdx) for vIdx in range(count) ]
+
+		columns.extend(valueNames)
+		values_col.extend( [ values[:,vIdx] for vIdx in range(count) ] )
+
+	return pandas.DataFrame( dict( zip(columns,values_col) ), columns=columns )
+
+if __name__ == "__main__":
+
+	# Summarizes the fields of a log:  python logParser.py <file>
+
+	import sys
+
+	data = parseFile(sys.argv[1])
+
+	print '%i lines' % len(data)
+
+	for name in data.dtype.names:
+		print '  %-40s %s' % (name,data.dtype.fields[name][0])
@@ -12,7 +12,11 @@ import visEnv
 import physEnv
 import ode
 import datetime
-from ctypes import * # eyetrackka
+import frameProfiler
+import frameLogger
+import asyncWriter
+import sessionIndex
+import os
 
 
 expConfigFileName = 'exampleExpConfig.cfg'
@@ -73,9 +77,27 @@ class Experiment(viz.EventClass):
 		# One could then add experiment, theBall, theRacquet, eyeTrackingCal to the list, assuming 
 		# they include the member function .getOutput().
 		# I prefer to do all my data collection in one place: experiment.getOutput()
+		# With a binary log (logFormat), the frameLogger replaces them, and the DVR records only its row numbers
 		
 		self.config.writables = [self]
 		
+		# Set below if use_DVR.  See writeDataToText and writeFrameLog
+		self.expDataFile = None
+		self.eyeDataFile = None
+		self.frameLog = None
+		self.sessionIndex = None
+		
+		# Text files opened by _openDataFile
+		self.dataFiles = []
+		
+		# For the session index.  See _indexFrame
+		self.numFramesLogged = 0
+		self.expDataBytes = 0
+		self.expDataLines = 0
+		self.lastIndexedFrame = None
+		self.lastIndexedBlock = None
+		self.lastIndexedTrial = None
+		
 		################################################################
 		################################################################
 		## Set states
@@ -131,8 +153,9 @@ class Experiment(viz.EventClass):
 			
 			################################################################
 			##  Link up the hmd to the mainview
-			if( self.config.use_HMD and  config.mocap.returnPointerToRigid('hmd') ):
-				self.config.mocap.enableHMDTracking()
+			if( self.config.use_HMD and self.config.tracker.resolve(self.config.sysCfg['trackerManager']['mainViewHandle']) ):
+				
+				self.config.tracker.linkMainView(self.config.sysCfg['trackerManager']['mainViewHandle'])
 						# If there is a paddle visObj and a paddle rigid...
 		
 		#self.setupPaddle()
@@ -142,7 +165,7 @@ class Experiment(viz.EventClass):
 		##############################################################
 		## Callbacks and timers
 		
-		vizact.onupdate(viz.PRIORITY_PHYSICS,self._checkForCollisions)
+		frameProfiler.onupdate('checkForCollisions',viz.PRIORITY_PHYSICS,self._checkForCollisions)
 		
 		#self.callback(viz.TIMER_EVENT, self.timer_event)
 		self.callback(viz.KEYDOWN_EVENT,  self.onKeyDown)
@@ -153,7 +176,7 @@ class Experiment(viz.EventClass):
 		self.starttimer( self.perFrameTimerID, viz.FASTEST_EXPIRATION, viz.FOREVER)
 		
 		# DVR snaps a shot of the frame, records eye data, and contents of self.writables is written out to the movie
-		self.callback(viz.POST_SWAP_EVENT, self.config.__record_data__, viz.PRIORITY_LAST_UPDATE)
+		self.callback(viz.POST_SWAP_EVENT, frameProfiler.wrap('recordData',viz.PRIORITY_LAST_UPDATE,self.config.__record_data__), viz.PRIORITY_LAST_UPDATE)
 	
 		# Use text output!
 		if( config.sysCfg['use_DVR'] >0):
@@ -164,13 +187,41 @@ class Experiment(viz.EventClass):
 			dateTimeStr = str(now.year) + '-' + str(now.month) + '-' + str(now.day) + '-' + str(now.hour) + '-' + str(now.minute)
 			
 			dataOutPutDir = config.sysCfg['writer']['outFileDir']
+			logFormat = config.sysCfg['writer']['logFormat']
 			
-			self.expDataFile = open(dataOutPutDir + 'exp_data-' + dateTimeStr + '.txt','a')
+			# Experiment data as text (getOutput), as binary rows (getLogFields / fillLogRow), or both.  See frameLogger.py
+			expDataFileName = None
+			frameLogFileName = None
+			
+			if( logFormat != 'binary' ):
+				expDataFileName = dataOutPutDir + 'exp_data-' + dateTimeStr + '.txt'
+				self.expDataFile = self._openDataFile(expDataFileName)
+				
+				# Appending, so offsets start after anything already there
+				self.expDataBytes = os.path.getsize(expDataFileName)
+				self.expDataLines = self._countLines(expDataFileName)
+			
+			if( logFormat != 'text' ):
+				frameLogFileName = dataOutPutDir + 'exp_data-' + dateTimeStr + '.npy'
+				self.frameLog = frameLogger.frameLogger(frameLogFileName,
+					[self, self.config.mainViewLatency], config.sysCfg['writer']['logBlockLength'], config.sysCfg['writer']['asyncWrite'])
+				vizact.onexit(self.frameLog.close)
+				frameProfiler.onupdate('writeFrameLog',viz.PRIORITY_LAST_UPDATE,self.writeFrameLog)
+				
+				# The DVR gets the row of the binary log, rather than the getOutput string, on each frame
+				self.config.writables = [self.frameLog]
 			
 			if( self.config.sysCfg['use_eyetracking']):
-				self.eyeDataFile = open(dataOutPutDir + 'eye_data-' + dateTimeStr + '.txt','a')
+				self.eyeDataFile = self._openDataFile(dataOutPutDir + 'eye_data-' + dateTimeStr + '.txt')
 			
-			vizact.onupdate(viz.PRIORITY_LAST_UPDATE,self.writeDataToText)
+			# Where each block, trial and event starts in the logs.  See sessionIndex.py
+			if( config.sysCfg['writer']['writeSessionIndex'] ):
+				self.sessionIndex = sessionIndex.sessionIndex(self._openDataFile(dataOutPutDir + 'exp_data-' + dateTimeStr + '.index.jsonl'))
+				self.sessionIndex.addEntry({'kind': 'session', 'expData': expDataFileName, 'frameLog': frameLogFileName, 'byte': self.expDataBytes, 'line': self.expDataLines})
+			
+			vizact.onexit(self._closeDataFiles)
+			
+			frameProfiler.onupdate('writeDataToText',viz.PRIORITY_LAST_UPDATE,self.writeDataToText)
 		
 		# Create an event flag object
 		# This var is set to an int on every frame
@@ -193,85 +244,91 @@ class Experiment(viz.EventClass):
 		
 	def _checkForCollisions(self):
 		
+		# Handles the contact-begin events emitted by physEnv during this frame.
+		# Each contact is reported once, however many substeps it lasts, 
+		# and event.time is the time of the substep on which it began.
+		
 		thePhysEnv = self.room.physEnv;
 		
-		if( thePhysEnv.collisionDetected == False ): 
+		collisionEvents_idx = thePhysEnv.getCollisionEvents()
+		
+		if( len(collisionEvents_idx) == 0 ): 
 			# No collisions this time!
 			return
 		
+		theBall = self.currentTrial.ballObj
+		
+		if( theBall <= 0 ):
+			return
+		
 		theFloor = self.room.floor
 		theBackWall = self.room.wall_NegZ
-		theBall = self.currentTrial.ballObj		
 		thePaddle = self.room.paddle
 		
-		for idx in range(len(thePhysEnv.collisionList_idx_physNodes)):
+		for event in collisionEvents_idx:
 			
-			physNode1 = thePhysEnv.collisionList_idx_physNodes[idx][0]
-			physNode2 = thePhysEnv.collisionList_idx_physNodes[idx][1]
+			if( event.eventType != physEnv.CONTACT_BEGIN or not event.involves(theBall.physNode) ):
+				continue
+			
+			otherPhysNode = event.other(theBall.physNode)
 			
 			# BALL / FLOOR
 			
-			if( theBall > 0 ):
-				if( self.currentTrial.ballHasBouncedOnFloor == False and
-					(physNode1 == theFloor.physNode and physNode2 == theBall.physNode or 
-					physNode1 == theBall.physNode and physNode2 == theFloor.physNode )):
-						
-					self.eventFlag.setStatus(3)
-					
-					self.currentTrial.ballHasBouncedOnFloor = True 
-					 
-					# This is an example of how to get contact information
-					bouncePos_XYZ,normal,depth,geom1,geom2 = thePhysEnv.contactObjects_idx[0].getContactGeomParams()
-					
-					self.currentTrial.ballOnPaddlePos_XYZ = bouncePos_XYZ
-					
-					#print 'Ball has hit the ground.'
-					soundBank.bounce.play()
+			if( otherPhysNode is theFloor.physNode and self.currentTrial.ballHasBouncedOnFloor == False ):
 					
-					# Compare pre-bounce flight dur with predicted pre-bounce flight dur
-					actualPreBounceFlightDur =  float(viz.getFrameTime()) - self.currentTrial.launchTime
-					durationError = self.currentTrial.predictedPreBounceFlightDur - actualPreBounceFlightDur
-					self.currentTrial.flightDurationError = durationError 
-					
-					print 'Predicted: ' + str(self.currentTrial.predictedPreBounceFlightDur)
-					print 'Actual   : ' + str(actualPreBounceFlightDur)
-					
-					print 'Flight duration error: ' + str(durationError)
+				self.eventFlag.setStatus(3)
+				
+				self.currentTrial.ballHasBouncedOnFloor = True 
+				 
+				# This is an example of how to get contact information
+				bouncePos_XYZ = event.contactPos_XYZ
+				
+				self.currentTrial.ballOnPaddlePos_XYZ = bouncePos_XYZ
+				
+				#print 'Ball has hit the ground.'
+				soundBank.bounce.play()
+				
+				# Compare pre-bounce flight dur with predicted pre-bounce flight dur
+				actualPreBounceFlightDur =  event.time - self.currentTrial.launchTime
+				durationError = self.currentTrial.predictedPreBounceFlightDur - actualPreBounceFlightDur
+				self.currentTrial.flightDurationError = durationError 
+				
+				print 'Predicted: ' + str(self.currentTrial.predictedPreBounceFlightDur)
+				print 'Actual   : ' + str(actualPreBounceFlightDur)
+				
+				print 'Flight duration error: ' + str(durationError)
+				
+			# BALL / PADDLE
+			elif( otherPhysNode is thePaddle.physNode and self.currentTrial.ballHasHitPaddle == False ):
 					
-				# BALL / PADDLE
-				if( self.currentTrial.ballHasHitPaddle == False and
-					(physNode1 == thePaddle.physNode and physNode2 == theBall.physNode or 
-					physNode1 == theBall.physNode and physNode2 == thePaddle.physNode )):
-						
-					self.eventFlag.setStatus(4)
-					self.currentTrial.ballHasHitPaddle = True
+				self.eventFlag.setStatus(4)
+				self.currentTrial.ballHasHitPaddle = True
+				
+				soundBank.cowbell.play()
+				
+				# self.ballObj.physNode.setStickUponContact( room.paddle.physNode.geom )
+				if( theBall.physNode.queryStickyState(thePaddle.physNode) ):
+				
+					theBall.visNode.setParent(thePaddle.visNode)
+					collPoint_XYZ = theBall.physNode.collisionPosLocal_XYZ
+					theBall.visNode.setPosition(collPoint_XYZ)
 					
-					soundBank.cowbell.play()
+					self.currentTrial.ballOnPaddlePosLoc_XYZ = collPoint_XYZ
 					
-					# self.ballObj.physNode.setStickUponContact( room.paddle.physNode.geom )
-					if( theBall.physNode.queryStickyState(thePaddle.physNode) ):
+					# If you don't set position in this way (on the next frame using vizact.onupdate),
+					# then it doesn't seem to update correctly.  
+					# My guess is that this is because the ball's position is updated later on this frame using
+					# visObj.applyPhysToVis()
 					
-						theBall.visNode.setParent(thePaddle.visNode)
-						collPoint_XYZ = theBall.physNode.collisionPosLocal_XYZ
-						theBall.visNode.setPosition(collPoint_XYZ)
-						
-						self.currentTrial.ballOnPaddlePosLoc_XYZ = collPoint_XYZ
-						
-						# If you don't set position in this way (on the next frame using vizact.onupdate),
-						# then it doesn't seem to update correctly.  
-						# My guess is that this is because the ball's position is updated later on this frame using
-						# visObj.applyPhysToVis()
-						
-						vizact.onupdate(viz.PRIORITY_LINKS,theBall.visNode.setPosition,collPoint_XYZ[0],collPoint_XYZ[1],collPoint_XYZ[2])
+					vizact.onupdate(viz.PRIORITY_LINKS,theBall.visNode.setPosition,collPoint_XYZ[0],collPoint_XYZ[1],collPoint_XYZ[2])
 
-				if( physNode1 == theBackWall.physNode and physNode2 == theBall.physNode or 
-					physNode1 == theBall.physNode and physNode2 == theBackWall.physNode):
-					
-					self.eventFlag.setStatus(5)
-					#print 'Ball has hit the back wall.'
-					
-					#currentTrial.removeBall()
-					soundBank.bounce.play()
+			elif( otherPhysNode is theBackWall.physNode ):
+				
+				self.eventFlag.setStatus(5)
+				#print 'Ball has hit the back wall.'
+				
+				#currentTrial.removeBall()
+				soundBank.bounce.play()
 
 	def start(self):
 		
@@ -291,15 +348,8 @@ class Experiment(viz.EventClass):
 		self.model = viz.add('pit.osgb',parent = self.room)
 		"""
 		
-		if not self.config.mocap:
-			pass
-		#elif (self.config.mocap.isOn() == 1): 
-		elif( self.config.mocap.mainViewUpdateAction == False):
-			#self.config.mocap.turnOff()
-			self.config.mocap.enableHMDTracking()
-			#self.config.mocap.turnOn()
-		else:
-			self.config.mocap.disableHMDTracking()
+		if( self.config.tracker ):
+			self.config.tracker.toggleMainViewLink(self.config.sysCfg['trackerManager']['mainViewHandle'])
 			
 		viz.mouse.setOverride(viz.TOGGLE)
 		self.config.eyeTrackingCal.toggleCalib()
@@ -331,14 +381,8 @@ class Experiment(viz.EventClass):
 		"""
 		Interactive commands can be given via the keyboard. Some are provided here. You'll likely want to add more.
 		"""
-		mocapSys = self.config.mocap;
-		
-		if( self.config.use_phasespace == True ):
-			hmdRigid = mocapSys.returnPointerToRigid('hmd')
-			paddleRigid = mocapSys.returnPointerToRigid('paddle')
-		else:
-			hmdRigid = []
-			paddleRigid = []
+		# resetRigid / saveRigid are phasespace's own.  self.config.mocap is the HiBall when both are used
+		mocapSys = self.config.phasespace;
 		
 		##########################################################
 		##########################################################
@@ -358,14 +402,11 @@ class Experiment(viz.EventClass):
 			if key == 'M':
 				
 				# Toggle the link between the HMD and Mainview
-				if( mocapSys ):
-					if( mocapSys.mainViewUpdateAction ):
-						mocapSys.disableHMDTracking()
-					else:
-						mocapSys.enableHMDTracking()
-			elif key == 'h':
+				if( self.config.tracker ):
+					self.config.tracker.toggleMainViewLink(self.config.sysCfg['trackerManager']['mainViewHandle'])
+			elif key == 'h' and mocapSys:
 				mocapSys.resetRigid('hmd')
-			elif key == 'H':
+			elif key == 'H' and mocapSys:
 				mocapSys.saveRigid('hmd')
 			elif key == 'W':
 				self.connectWiiMote()
@@ -432,9 +473,31 @@ class Experiment(viz.EventClass):
 		
 		viewPos_XYZ = viz.MainView.getPosition()
 		outputString = outputString + '[ viewPos_XYZ %f %f %f ] ' % (viewPos_XYZ[0],viewPos_XYZ[1],viewPos_XYZ[2])
+		
+		# Tracker pose latency of the last frame displayed, with percentiles
+		if( self.config.mainViewLatency ):
+			outputString = outputString + self.config.mainViewLatency.getOutput()
 	
 	
 		return outputString #%f %d' % (viz.getFrameTime(), self.inCalibrateMode)
+	
+	def getLogFields(self):
+		
+		# The fields of getOutput, for frameLogger.  Latency is logged by config.mainViewLatency itself
+		
+		return [ ['frameTime','f8'],
+			['inCalibrateBool','b1'],
+			['eventFlag','i4'],
+			['trialType','S32'],
+			['viewPos_XYZ','f8',3] ]
+	
+	def fillLogRow(self,row):
+		
+		row['frameTime'] = viz.getFrameTime()
+		row['inCalibrateBool'] = self.inCalibrateMode
+		row['eventFlag'] = self.eventFlag.status
+		row['trialType'] = self.currentTrial.trialType
+		row['viewPos_XYZ'] = viz.MainView.getPosition()
 		
 	def getEyeData(self):
 		
@@ -445,38 +508,20 @@ class Experiment(viz.EventClass):
 		# <> for 4 vars
 		# @@ for 16 vars (view and projection matrices)
 
-		outputString = ''		
-
-		class VPX_RealType(Structure):
-			 _fields_ = [("x", c_float),("y", c_float)]
-
-		## Position
-		arrington = self.config.eyeTrackingCal.arrington;
+		# One line per gaze sample.  With the sampling thread running, every sample read since the last frame.
+		# Otherwise, the current sample.  frameTime is the frame that logged it
 		
-		#eyePos_XY = pyArr.getPosition(self.arrington.RAW)
-		#outputString = outputString + '( eyePos_XY %f %f ) ' %(eyePos_XY[0],eyePos_XY[1])
+		eyeTrackingCal = self.config.eyeTrackingCal
 		
-		Eye_A  = c_int(0)
-
-		eyePos = VPX_RealType()
-		eyePosPointer = pointer(eyePos)
-		
-		arrington.VPX_GetGazePoint2(Eye_A ,eyePosPointer)
-		outputString = outputString + '( eyePos %f  %f ) ' % (eyePos.x, eyePos.y)
-		
-		## Time
-		eyeTime = c_double();
-		eyeTimePointer = pointer(eyeTime)		
-		arrington.VPX_GetDataTime2(Eye_A ,eyeTimePointer)
-		outputString = outputString + '* eyeDataTime %f * ' % eyeTime.value
+		if( eyeTrackingCal.isSampling() ):
+			sample_s_TXYQ = eyeTrackingCal.getSamplesSinceLastFrame()
+		else:
+			sample_s_TXYQ = [eyeTrackingCal.readSample()]
 		
-		## Quality
-		eyeQual = c_int();
-		eyeQualPointer = pointer(eyeQual)		
-		arrington.VPX_GetDataQuality2(Eye_A ,eyeQualPointer)
-		outputString = outputString + '* eyeQuality %i * ' % eyeQual.value
+		frameTime = viz.getFrameTime()
 		
-		return outputString
+		return '\n'.join( [ '( eyePos %f  %f ) * eyeDataTime %f * * eyeQuality %i * * frameTime %f * ' % (sample_TXYQ[1], sample_TXYQ[2], sample_TXYQ[0], sample_TXYQ[3], frameTime)
+			for sample_TXYQ in sample_s_TXYQ ] )
 		
 	def endTrial(self):
 		
@@ -530,16 +575,131 @@ class Experiment(viz.EventClass):
 		now = datetime.datetime.now()
 		dateTimeStr = str(now.hour) + ':' + str(now.minute) + ':' + str(now.second) + ':' + str(now.microsecond)
 		
-		expDataString = self.getOutput()
-		self.expDataFile.write(expDataString + '\n')
+		self._indexFrame()
+		
+		if( self.expDataFile ):
+			expDataString = self.getOutput()
+			
+			# An asyncFileWriter with a full queue drops the line, and returns False
+			if( self.expDataFile.write(expDataString + '\n') is not False ):
+				
+				# Text mode writes os.linesep for the newline
+				self.expDataBytes += len(expDataString) + len(os.linesep)
+				self.expDataLines += 1
 		
 		if( self.config.sysCfg['use_eyetracking']):
 			
 			eyeDataString = self.getEyeData()
-			self.eyeDataFile.write(eyeDataString + '\n')
+			
+			# No new samples, no line
+			if( eyeDataString ):
+				self.eyeDataFile.write(eyeDataString + '\n')
 		
 		# Eyetracker data
 	
+	def _countLines(self,fileName):
+		
+		# Lines already in a file that is appended to
+		
+		numLines = 0
+		dataFile = open(fileName,'rb')
+		
+		for chunk in iter(lambda: dataFile.read(1024 * 1024), ''):
+			numLines += chunk.count('\n')
+		
+		dataFile.close()
+		
+		return numLines
+	
+	def _openDataFile(self,fileName):
+		
+		# With asyncWrite, the frame loop only queues each line.  A thread writes them out.  See asyncWriter.py
+		
+		writerCfg = self.config.sysCfg['writer']
+		
+		if( writerCfg['asyncWrite'] ):
+			dataFile = asyncWriter.asyncFileWriter(fileName,'a',writerCfg['maxQueueLength'],writerCfg['flushIntervalMS'] / 1000.0)
+		else:
+			dataFile = open(fileName,'a')
+		
+		self.dataFiles.append(dataFile)
+		
+		return dataFile
+	
+	def _drainDataFiles(self):
+		
+		# Waits until everything written so far is on disk
+		
+		if( self.frameLog ):
+			self.frameLog.drain()
+		
+		for dataFile in self.dataFiles:
+			if( isinstance(dataFile,asyncWriter.asyncFileWriter) ):
+				dataFile.drain()
+			else:
+				dataFile.flush()
+	
+	def _closeDataFiles(self):
+		
+		for dataFile in self.dataFiles:
+			dataFile.close()
+		
+		self.dataFiles = []
+	
+	def writeFrameLog(self):
+		
+		# Only write data if the experiment is ongoing
+		if( self.inProgress is False ):
+			return
+		
+		self._indexFrame()
+		self.frameLog.write()
+	
+	def _indexFrame(self):
+		
+		# Adds this frame's block, trial and event entries to the session index.
+		# Called by writeDataToText and writeFrameLog before they write, so that the offsets are those of this frame
+		
+		frameNum = viz.getFrameNumber()
+		
+		if( frameNum == self.lastIndexedFrame ):
+			return
+		
+		self.lastIndexedFrame = frameNum
+		
+		if( self.sessionIndex ):
+			
+			offsets = {'row': self.numFramesLogged, 'frame': frameNum, 'frameTime': viz.getFrameTime()}
+			
+			if( self.expDataFile ):
+				offsets['byte'] = self.expDataBytes
+				offsets['line'] = self.expDataLines
+			
+			# Events belong to the trial that was running.  endTrial moves on to the next trial on the frame of its 6
+			if( self.eventFlag.status != 0 and self.lastIndexedTrial is not None ):
+				entry = {'kind': 'event', 'eventFlag': self.eventFlag.status, 'block': self.lastIndexedBlock, 'trial': self.lastIndexedTrial}
+				entry.update(offsets)
+				self.sessionIndex.addEntry(entry)
+			
+			# After the last block, blockNumber is one past the end until endExperiment
+			if( self.blockNumber < len(self.blocks_bl) ):
+				
+				if( self.blockNumber != self.lastIndexedBlock ):
+					entry = {'kind': 'block', 'block': self.blockNumber, 'blockName': self.blocks_bl[self.blockNumber].blockName}
+					entry.update(offsets)
+					self.sessionIndex.addEntry(entry)
+				
+				if( self.blockNumber != self.lastIndexedBlock or self.trialNumber != self.lastIndexedTrial ):
+					entry = {'kind': 'trial', 'block': self.blockNumber, 'trial': self.trialNumber, 
+						'trialType': self.currentTrial.trialType, 'drawnParams': self.currentTrial.drawnParams}
+					entry.update(offsets)
+					self.sessionIndex.addEntry(entry)
+				
+				self.lastIndexedBlock = self.blockNumber
+				self.lastIndexedTrial = self.trialNumber
+		
+		self.numFramesLogged += 1
+	
 	def registerWiimoteActions(self):
 				
 		wii = viz.add('wiimote.dle')#Add wiimote extension
@@ -549,7 +709,7 @@ class Experiment(viz.EventClass):
 		
 		if( self.config.use_phasespace == True ):
 			
-			mocapSys = self.config.mocap;
+			mocapSys = self.config.phasespace;
 		
 			vizact.onsensorup(self.config.wiimote,wii.BUTTON_DOWN,mocapSys.resetRigid,'hmd') 
 			vizact.onsensorup(self.config.wiimote,wii.BUTTON_UP,mocapSys.saveRigid,'hmd') 
@@ -568,6 +728,10 @@ class Experiment(viz.EventClass):
 		print 'end experiment'
 		self.inProgress = False
 		soundBank.gong.play()
+		
+		self.room.physEnv.printSubstepSummary()
+		
+		self._drainDataFiles()
 			
 	
 	def checkDVRStatus(self):
@@ -605,7 +769,7 @@ class eventFlag(viz.EventClass):
 		
 		# On every frame, self.eventFlag should be set to 0
 		# This should happen first, before any timer object has the chance to overwrite it!
-		vizact.onupdate(viz.PRIORITY_FIRST_UPDATE,self._resetEventFlag)
+		frameProfiler.onupdate('resetEventFlag',viz.PRIORITY_FIRST_UPDATE,self._resetEventFlag)
 		
 	def setStatus(self,status,overWriteBool = False):
 		
@@ -731,19 +895,19 @@ class trial(viz.EventClass):
 		# Go into config file and draw variables from the specified distributions
 		# When a distribution is specified, select a value from the distribution
 		
-		variablesInATrial = config.expCfg['trialTypes']['default'].keys()
+		# The same draw is made without Vizard by simulateTrials.py.  See drawNumberFromDist.drawTrialParams
+		drawnParams = drawTrialParams(config.expCfg,self.trialType)
 		
-		for varIdx in range(len(variablesInATrial)):
-			if "_distType" in variablesInATrial[varIdx]:
+		# Kept for the session index
+		self.drawnParams = drawnParams
+		
+		for varName, (distType, distParams, value) in drawnParams.iteritems():
 			
-				varName = variablesInATrial[varIdx][0:-9]
-
-				distType, distParams, value = self._setValueOrUseDefault(config,varName)
-				exec( 'self.' + varName + '_distType = distType' )
-				exec( 'self.' + varName + '_distParams = distParams' )
-				exec( 'self.' + varName + '_distType = distType' )
-				# Draw value from a distribution
-				exec( 'self.' + varName + ' = drawNumberFromDist( distType , distParams);' )
+			setattr( self, varName + '_distType', distType )
+			setattr( self, varName + '_distParams', distParams )
+			
+			# Value drawn from the distribution
+			setattr( self, varName, value )
 					
 	
 	 
@@ -757,33 +921,13 @@ class trial(viz.EventClass):
 #		self.ballLaunched = False
 		
 
-	def _setValueOrUseDefault(self,config,paramPrefix):
-		
-		try:
-			#print paramPrefix
-			# Try to values from the subsection [[trialType]]
-			distType = config.expCfg['trialTypes'][self.trialType][paramPrefix + '_distType']
-			distParams = config.expCfg['trialTypes'][self.trialType][paramPrefix +'_distParams']
-			
-		except:
-			# print 'Using default: **' + paramPrefix + '**'
-			# Try to values from the subsection [['default']]
-			distType = config.expCfg['trialTypes']['default'][paramPrefix + '_distType'];
-			distParams = config.expCfg['trialTypes']['default'][paramPrefix + '_distParams'];
-		
-		
-		value = drawNumberFromDist(distType,distParams)
-	
-		
-		return distType,distParams,value
-			
-
 #	def placeBall(self,room):
 #		# An example of how to place an object in the room
 #		
 #		print self.initialPos_XYZ
 #		
 #		self.ballObj = visEnv.visObj(room,'sphere',self.ballDiameter/2,self.initialPos_XYZ,self.ballColor_RGB)
+#		self.ballObj.collisionCategory = physEnv.CATEGORY_BALL
 #
 #		self.ballObj.toggleUpdateWithPhys()
 #		self.ballObj.setVelocity([0,0,0])
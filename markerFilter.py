@@ -0,0 +1,202 @@
+"""
+Jitter filtering and short gap filling for a set of markers, vectorized over all markers at once.
+
+Each call to markerFilterBank.update() takes the positions of every marker at one time, with a flag for whether each was seen,
+and updates:
+
+	raw_m_XYZ, seen_m		as given (raw_m_XYZ holds the last position seen)
+	filtered_m_XYZ, valid_m		smoothed positions.  A marker that has not been seen for up to maxHoldMS is
+					extrapolated from its last filtered position and velocity, and is still valid.
+
+filterType is one of
+	'oneEuro'	One Euro filter (Casiez, Roussel & Vogel, 2012).  Low lag at speed, heavy smoothing when still
+	'kalman'	Constant velocity Kalman filter, the same for each axis
+	'none'		No smoothing.  Gaps are held at the last position seen, since a velocity from raw differences is mostly noise
+"""
+
+import numpy as np
+
+filterTypes = ['none','oneEuro','kalman']
+
+def _smoothingFactor(cutoffHz,dt):
+
+	tau = 1.0 / (2 * np.pi * cutoffHz)
+
+	return 1.0 / (1.0 + tau / dt)
+
+class markerFilterBank():
+
+	def __init__(self,numMarkers,filterType='oneEuro',maxHoldMS=100,
+		minCutoffHz=1.0,beta=5.0,derivCutoffHz=1.0,
+		measNoise=0.0005,accelNoise=30.0):
+
+		if( filterType not in filterTypes ):
+			raise ValueError('markerFilterBank: filterType must be one of ' + str(filterTypes))
+
+		self.numMarkers = numMarkers
+		self.filterType = filterType
+		self.maxHoldMS = maxHoldMS
+
+		# One Euro.  beta is per unit of speed, e.g. per m/s
+		self.minCutoffHz = minCutoffHz
+		self.beta = beta
+		self.derivCutoffHz = derivCutoffHz
+
+		# Kalman.  Std of measurement noise (position units) and of acceleration (position units / s**2)
+		self.measNoise = measNoise
+		self.accelNoise = accelNoise
+
+		self.raw_m_XYZ = np.zeros((numMarkers,3))
+		self.seen_m = np.zeros(numMarkers,dtype=bool)
+
+		self.filtered_m_XYZ = np.zeros((numMarkers,3))
+		self.valid_m = np.zeros(numMarkers,dtype=bool)
+
+		# Filter state, as of each marker's last sighting
+		self.pos_m_XYZ = np.zeros((numMarkers,3))
+		self.lastRaw_m_XYZ = np.zeros((numMarkers,3))
+		self.vel_m_XYZ = np.zeros((numMarkers,3))
+		self.lastSeenTime_m = np.zeros(numMarkers)
+		self.tracking_m = np.zeros(numMarkers,dtype=bool)
+
+		# Kalman covariance of [pos,vel], the same for each axis: P00, P01, P11
+		self.covPP_m = np.zeros(numMarkers)
+		self.covPV_m = np.zeros(numMarkers)
+		self.covVV_m = np.zeros(numMarkers)
+
+		self.lastUpdateTime = None
+
+	def update(self,sampleTime,pos_m_XYZ,seen_m):
+
+		seen_m = np.asarray(seen_m,dtype=bool)
+
+		self.seen_m[:] = seen_m
+		self.raw_m_XYZ[seen_m] = np.asarray(pos_m_XYZ)[seen_m]
+
+		self.lastUpdateTime = sampleTime
+
+		maxHold = self.maxHoldMS / 1000.0
+
+		# Markers lost for longer than maxHoldMS start again from their next sighting
+		self.tracking_m &= (sampleTime - self.lastSeenTime_m) <= maxHold
+
+		restart_m = seen_m & ~self.tracking_m
+		continue_m = seen_m & self.tracking_m
+
+		if( restart_m.any() ):
+			self._restart(restart_m,sampleTime)
+
+		if( continue_m.any() ):
+
+			dt_c = sampleTime - self.lastSeenTime_m[continue_m]
+
+			# OWL frames can share a timestamp.  Take the newest position and leave the rest of the state alone
+			forward_c = dt_c > 0
+
+			if( not forward_c.all() ):
+
+				sameTime_m = np.zeros(self.numMarkers,dtype=bool)
+				sameTime_m[ np.flatnonzero(continue_m)[~forward_c] ] = True
+
+				if( self.filterType == 'none' ):
+					self.pos_m_XYZ[sameTime_m] = self.raw_m_XYZ[sameTime_m]
+
+				continue_m = continue_m & ~sameTime_m
+				dt_c = dt_c[forward_c]
+
+			if( continue_m.any() ):
+
+				if( self.filterType == 'oneEuro' ):
+					self._updateOneEuro(continue_m,dt_c)
+				elif( self.filterType == 'kalman' ):
+					self._updateKalman(continue_m,dt_c)
+				else:
+					# Velocity stays 0
+					self.pos_m_XYZ[continue_m] = self.raw_m_XYZ[continue_m]
+
+				self.lastSeenTime_m[continue_m] = sampleTime
+				self.lastRaw_m_XYZ[continue_m] = self.raw_m_XYZ[continue_m]
+
+		# Seen markers are where the filter has them.  Others are extrapolated, up to maxHoldMS
+		sinceSeen_m = sampleTime - self.lastSeenTime_m
+
+		self.filtered_m_XYZ[:] = self.pos_m_XYZ + self.vel_m_XYZ * sinceSeen_m[:,np.newaxis]
+		self.valid_m[:] = self.tracking_m & (sinceSeen_m <= maxHold)
+
+	def _restart(self,restart_m,sampleTime):
+
+		self.pos_m_XYZ[restart_m] = self.raw_m_XYZ[restart_m]
+		self.lastRaw_m_XYZ[restart_m] = self.raw_m_XYZ[restart_m]
+		self.vel_m_XYZ[restart_m] = 0
+		self.lastSeenTime_m[restart_m] = sampleTime
+		self.tracking_m[restart_m] = True
+
+		# Kalman: position known to within measurement noise.  Velocity unknown, so start it loose
+		self.covPP_m[restart_m] = self.measNoise ** 2
+		self.covPV_m[restart_m] = 0
+		self.covVV_m[restart_m] = 1.0
+
+	def _updateOneEuro(self,continue_m,dt_c):
+
+		prevPos_c_XYZ = self.pos_m_XYZ[continue_m]
+		rawPos_c_XYZ = self.raw_m_XYZ[continue_m]
+
+		# From the raw positions, as in the reference implementation.  The filtered position lags, and would inflate it
+		rawVel_c_XYZ = (rawPos_c_XYZ - self.lastRaw_m_XYZ[continue_m]) / dt_c[:,np.newaxis]
+
+		derivAlpha_c = _smoothingFactor(self.derivCutoffHz,dt_c)[:,np.newaxis]
+		vel_c_XYZ = derivAlpha_c * rawVel_c_XYZ + (1 - derivAlpha_c) * self.vel_m_XYZ[continue_m]
+
+		# Cutoff rises with speed
+		speed_c = np.sqrt( np.sum(vel_c_XYZ**2,axis=1) )
+		alpha_c = _smoothingFactor(self.minCutoffHz + self.beta * speed_c,dt_c)[:,np.newaxis]
+
+		self.pos_m_XYZ[continue_m] = alpha_c * rawPos_c_XYZ + (1 - alpha_c) * prevPos_c_XYZ
+		self.vel_m_XYZ[continue_m] = vel_c_XYZ
+
+	def _updateKalman(self,continue_m,dt_c):
+
+		pos_c_XYZ = self.pos_m_XYZ[continue_m]
+		vel_c_XYZ = self.vel_m_XYZ[continue_m]
+
+		covPP_c = self.covPP_m[continue_m]
+		covPV_c = self.covPV_m[continue_m]
+		covVV_c = self.covVV_m[continue_m]
+
+		# Predict
+		pos_c_XYZ = pos_c_XYZ + vel_c_XYZ * dt_c[:,np.newaxis]
+
+		accelVar = self.accelNoise ** 2
+
+		covPP_c = covPP_c + 2 * dt_c * covPV_c + dt_c**2 * covVV_c + accelVar * dt_c**4 / 4
+		covPV_c = covPV_c + dt_c * covVV_c + accelVar * dt_c**3 / 2
+		covVV_c = covVV_c + accelVar * dt_c**2
+
+		# Correct with the measured position
+		innovationVar_c = covPP_c + self.measNoise ** 2
+
+		gainPos_c = covPP_c / innovationVar_c
+		gainVel_c = covPV_c / innovationVar_c
+
+		innovation_c_XYZ = self.raw_m_XYZ[continue_m] - pos_c_XYZ
+
+		self.pos_m_XYZ[continue_m] = pos_c_XYZ + gainPos_c[:,np.newaxis] * innovation_c_XYZ
+		self.vel_m_XYZ[continue_m] = vel_c_XYZ + gainVel_c[:,np.newaxis] * innovation_c_XYZ
+
+		self.covVV_m[continue_m] = covVV_c - gainVel_c * covPV_c
+		self.covPV_m[continue_m] = (1 - gainPos_c) * covPV_c
+		self.covPP_m[continue_m] = (1 - gainPos_c) * covPP_c
+
+	def getFiltered(self,markerIdx):
+
+		# Filtered position of one marker, or None if it is not valid
+
+		if( self.valid_m[markerIdx] ):
+			return self.filtered_m_XYZ[markerIdx].tolist()
+
+	def getRaw(self,markerIdx):
+
+		# Last position seen, or None if the marker was not seen on the last update
+
+		if( self.seen_m[markerIdx] ):
+			return self.raw_m_XYZ[markerIdx].tolist()
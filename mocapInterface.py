@@ -1,11 +1,23 @@
 import viz
 import vizshape
 import vizact
+import frameProfiler
+import markerFilter
+import rigidSolver
 
 # not a vizard module.  My own.
 
+import os
 import math
-from OWL import *
+import time
+import threading
+import numpy as np
+
+# Record or replay the OWL stream.  See owlReplay.py
+if( os.environ.get('OWL_RECORD_FILE') or os.environ.get('OWL_REPLAY_FILE') ):
+	from owlReplay import *
+else:
+	from OWL import *
 
 from os import rename
 
@@ -25,6 +37,461 @@ def markerNumToID(tracker, index):
 	
 	return ( ( tracker << 12 ) | (index) );
 
+def makeMarkerSlotIndex(alPSMarkers_midx):
+	
+	# Maps the server ID of each marker in alPSMarkers_midx to its index in the list
+	
+	markerSlotByServerID = {}
+	
+	for slot in range(len(alPSMarkers_midx)):
+		markerSlotByServerID[alPSMarkers_midx[slot].id] = slot
+		
+	return markerSlotByServerID
+
+class psToVizConverter():
+	
+	# Phasespace to Vizard coordinates, as one fixed 4x4 (row vector) matrix: 
+	# scale, flip Z, add origin, then rotate the basis 90 degs about Y.
+	# The rotation is taken from viz.Transform itself, so it follows Vizard's conventions exactly.
+	
+	def __init__(self,origin,scale):
+		
+		self.axisTransform = viz.Transform()
+		self.axisTransform.postAxisAngle(0,1,0,90)
+		
+		# Row i is where the basis vector i ends up
+		axisRot_XYZ_XYZ = np.array([ self._rotateBasis(basis_XYZ) for basis_XYZ in np.eye(3) ])
+		
+		self.psToViz_4x4 = np.eye(4)
+		self.psToViz_4x4[:3,:3] = np.dot( np.diag([scale[0],scale[1],-scale[2]]), axisRot_XYZ_XYZ )
+		self.psToViz_4x4[3,:3] = np.dot( origin, axisRot_XYZ_XYZ )
+		
+		# The same, as floats, for converting one point at a time without numpy overhead
+		self.linear_XYZ_XYZ = [ [ float(value) for value in row ] for row in self.psToViz_4x4[:3,:3] ]
+		self.offset_XYZ = [ float(value) for value in self.psToViz_4x4[3,:3] ]
+		
+	def _rotateBasis(self,basis_XYZ):
+		
+		transformViz = viz.Transform()
+		transformViz.postTrans(list(basis_XYZ))
+		transformViz.postAxisAngle(0,1,0,90)
+		
+		return transformViz.getPosition()
+		
+	def posToVizPos(self,posPS_XYZ):
+		
+		lin = self.linear_XYZ_XYZ
+		x, y, z = posPS_XYZ[0], posPS_XYZ[1], posPS_XYZ[2]
+		
+		return [ x*lin[0][0] + y*lin[1][0] + z*lin[2][0] + self.offset_XYZ[0],
+			x*lin[0][1] + y*lin[1][1] + z*lin[2][1] + self.offset_XYZ[1],
+			x*lin[0][2] + y*lin[1][2] + z*lin[2][2] + self.offset_XYZ[2] ]
+		
+	def posArrayToVizPos(self,posPS_midx_XYZ):
+		
+		# Converts an Nx3 array of positions in one go
+		
+		return np.dot(posPS_midx_XYZ,self.psToViz_4x4[:3,:3]) + self.psToViz_4x4[3,:3]
+	
+	def poseToVizTransform(self,psPose,transformViz=None):
+		
+		# If transformViz is given, it is overwritten and returned.  Otherwise, a new one is made.
+		
+		if( transformViz is None ):
+			transformViz = viz.Transform()
+		else:
+			transformViz.makeIdent()
+		
+		# PS quats are WABC
+		# Viz wants ABCW
+		transformViz.setQuat([ psPose[4], psPose[5], -psPose[6], -psPose[3] ])
+		
+		# Equal to postTrans(pos) then the axis rotation, with the translation carried through the rotation
+		transformViz.postMult(self.axisTransform)
+		transformViz.postTrans(self.posToVizPos(psPose))
+		
+		return transformViz
+		
+class bufferedMarker():
+	
+	# Stands in for an OWL marker (.id .x .y .z .cond) when markers are read from an owlSampleBuffer
+	
+	def __init__(self):
+		self.id = -1
+		self.x = 0.0
+		self.y = 0.0
+		self.z = 0.0
+		self.cond = -1
+		
+class owlSampleBuffer():
+	
+	# Fixed-size ring buffer of timestamped OWL frames, in phasespace coordinates.
+	# Written by one thread (see phasespaceInterface._acquisitionLoop), and read by another.
+	# A row is published by incrementing numSamplesWritten after it is filled, so readers never wait for the writer.
+	# A reader that holds a row for longer than numSamples OWL frames could see it overwritten.  Copy rows out promptly.
+	# getLatestSample and getSampleAtTime check, after copying, that the writer hasn't reached the row, and copy again if it has.
+	
+	def __init__(self,numSamples,maxMarkers,numRigids):
+		
+		self.numSamples = numSamples
+		self.maxMarkers = maxMarkers
+		self.numRigids = numRigids
+		
+		# viz.tick() when the frame was received
+		self.time_s = np.zeros(numSamples)
+		
+		self.numMarkers_s = np.zeros(numSamples,dtype=np.int32)
+		self.markerID_s_slot = np.zeros((numSamples,maxMarkers),dtype=np.int32) - 1
+		self.markerXYZ_s_slot = np.zeros((numSamples,maxMarkers,3))
+		self.markerCond_s_slot = np.zeros((numSamples,maxMarkers))
+		
+		# pose is [x,y,z,w,a,b,c], as OWL reports it.  Rows are indexed by rigid.id (the tracker index)
+		self.rigidPose_s_ridx = np.zeros((numSamples,numRigids,7))
+		self.rigidCond_s_ridx = np.zeros((numSamples,numRigids)) - 1
+		
+		self.numSamplesWritten = 0
+		
+	def write(self,sampleTime,markers,rigids):
+		
+		row = self.numSamplesWritten % self.numSamples
+		
+		# Markers or rigids missing from this OWL frame are carried over from the last one
+		if( self.numSamplesWritten > 0 ):
+			
+			prevRow = (self.numSamplesWritten - 1) % self.numSamples
+			
+			if( len(markers) == 0 ):
+				self.numMarkers_s[row] = self.numMarkers_s[prevRow]
+				self.markerID_s_slot[row] = self.markerID_s_slot[prevRow]
+				self.markerXYZ_s_slot[row] = self.markerXYZ_s_slot[prevRow]
+				self.markerCond_s_slot[row] = self.markerCond_s_slot[prevRow]
+				
+			self.rigidPose_s_ridx[row] = self.rigidPose_s_ridx[prevRow]
+			self.rigidCond_s_ridx[row] = self.rigidCond_s_ridx[prevRow]
+		
+		self.time_s[row] = sampleTime
+		
+		if( len(markers) ):
+			
+			numMarkers = min(len(markers),self.maxMarkers)
+			self.numMarkers_s[row] = numMarkers
+			
+			for slot in range(numMarkers):
+				
+				psMarker = markers[slot]
+				
+				self.markerID_s_slot[row,slot] = psMarker.id
+				self.markerXYZ_s_slot[row,slot] = [psMarker.x, psMarker.y, psMarker.z]
+				self.markerCond_s_slot[row,slot] = psMarker.cond
+		
+		for rigid in rigids:
+			if( rigid.id < self.numRigids ):
+				self.rigidPose_s_ridx[row,rigid.id] = rigid.pose
+				self.rigidCond_s_ridx[row,rigid.id] = rigid.cond
+		
+		# Publish
+		self.numSamplesWritten += 1
+		
+	def getRowsSince(self,numSamplesRead):
+		
+		# Returns [rows_s, numSamplesWritten]: the rows written since numSamplesWritten was numSamplesRead, oldest first.
+		# Rows that have already been overwritten are skipped.
+		
+		numSamplesWritten = self.numSamplesWritten
+		numSamplesRead = max(numSamplesRead, numSamplesWritten - self.numSamples)
+		
+		return [ np.arange(numSamplesRead,numSamplesWritten) % self.numSamples, numSamplesWritten ]
+		
+	def _copyRow(self,sampleNum):
+		
+		# Copies sample number sampleNum (in row sampleNum % numSamples).
+		# Returns None if the writer reached that row before the copy was done, so that the copy may be torn
+		
+		row = sampleNum % self.numSamples
+		
+		sample = [ self.time_s[row], self.numMarkers_s[row], self.markerID_s_slot[row].copy(), self.markerXYZ_s_slot[row].copy(), 
+			self.markerCond_s_slot[row].copy(), self.rigidPose_s_ridx[row].copy(), self.rigidCond_s_ridx[row].copy() ]
+		
+		# The writer fills the row of sample sampleNum + numSamples while numSamplesWritten is that number
+		if( self.numSamplesWritten >= sampleNum + self.numSamples ):
+			return None
+		
+		return sample
+		
+	def getLatestSample(self):
+		
+		# Returns [time, numMarkers, markerID_slot, markerXYZ_slot, markerCond_slot, rigidPose_ridx, rigidCond_ridx]
+		# or None if nothing has been received yet
+		
+		while( True ):
+			
+			numSamplesWritten = self.numSamplesWritten
+			
+			if( numSamplesWritten == 0 ):
+				return None
+			
+			sample = self._copyRow(numSamplesWritten - 1)
+			
+			# Otherwise overwritten while it was copied.  Take the newer one
+			if( sample is not None ):
+				return sample
+		
+	def getSampleAtTime(self,sampleTime):
+		
+		# As getLatestSample, but interpolated between the two samples either side of sampleTime.
+		# Falls back on the nearest sample if sampleTime is outside of the buffer.
+		# Marker positions are only blended where both samples have the same marker in the same slot with a good cond.
+		
+		while( True ):
+			
+			numSamplesWritten = self.numSamplesWritten
+			
+			if( numSamplesWritten == 0 ):
+				return None
+			
+			sample = self._sampleAtTime(sampleTime,numSamplesWritten)
+			
+			# Otherwise a sample was overwritten while it was copied.  Look again
+			if( sample is not None ):
+				return sample
+		
+	def _sampleAtTime(self,sampleTime,numSamplesWritten):
+		
+		numValid = min(numSamplesWritten,self.numSamples)
+		
+		if( numValid == 1 or sampleTime >= self.time_s[(numSamplesWritten - 1) % self.numSamples] ):
+			return self._copyRow(numSamplesWritten - 1)
+		
+		# Samples from oldest to newest
+		sampleNums_s = np.arange(numSamplesWritten - numValid,numSamplesWritten)
+		time_s = self.time_s[sampleNums_s % self.numSamples]
+		
+		afterIdx = np.searchsorted(time_s,sampleTime)
+		
+		if( afterIdx == 0 ):
+			return self._copyRow(sampleNums_s[0])
+		
+		before = self._copyRow(sampleNums_s[afterIdx-1])
+		after = self._copyRow(sampleNums_s[afterIdx])
+		
+		if( before is None or after is None ):
+			return None
+		
+		alpha = (sampleTime - before[0]) / max(after[0] - before[0],1e-9)
+		
+		# Start from the newer sample
+		sample = after
+		sample[0] = sampleTime
+		
+		numMarkers = min(before[1],after[1])
+		blend_slot = ( (before[2][:numMarkers] == after[2][:numMarkers]) & (before[4][:numMarkers] > 0) & (after[4][:numMarkers] > 0) )
+		
+		sample[3][:numMarkers][blend_slot] = before[3][:numMarkers][blend_slot] + alpha * (after[3][:numMarkers][blend_slot] - before[3][:numMarkers][blend_slot])
+		
+		for ridx in range(self.numRigids):
+			if( before[6][ridx] > 0 and after[6][ridx] > 0 ):
+				sample[5][ridx] = _blendPose(before[5][ridx],after[5][ridx],alpha)
+				
+		return sample
+
+def _blendPose(pose1,pose2,alpha):
+	
+	# Blends two OWL poses [x,y,z,w,a,b,c].  Linear for position, normalized lerp for the quaternion
+	
+	pos_XYZ = pose1[0:3] + alpha * (pose2[0:3] - pose1[0:3])
+	
+	quat1 = pose1[3:7]
+	quat2 = pose2[3:7]
+	
+	# q and -q are the same rotation.  Blend along the shorter arc.
+	if( np.dot(quat1,quat2) < 0 ):
+		quat2 = -quat2
+		
+	quat = quat1 + alpha * (quat2 - quat1)
+	quat = quat / np.sqrt(np.dot(quat,quat))
+	
+	return np.concatenate([pos_XYZ,quat])
+
+def _quatMultiply(quat1,quat2):
+	
+	# Hamilton product of two WABC quaternions
+	
+	w1, a1, b1, c1 = quat1
+	w2, a2, b2, c2 = quat2
+	
+	return np.array([ w1*w2 - a1*a2 - b1*b2 - c1*c2,
+		w1*a2 + a1*w2 + b1*c2 - c1*b2,
+		w1*b2 - a1*c2 + b1*w2 + c1*a2,
+		w1*c2 + a1*b2 - b1*a2 + c1*w2 ])
+
+def _quatToRotationVector(quat):
+	
+	# WABC quaternion to axis * angle (radians)
+	
+	if( quat[0] < 0 ):
+		quat = -quat
+	
+	sinHalfAngle = np.sqrt(np.dot(quat[1:4],quat[1:4]))
+	
+	if( sinHalfAngle < 1e-12 ):
+		return 2 * quat[1:4]
+	
+	return quat[1:4] * 2 * np.arctan2(sinHalfAngle,quat[0]) / sinHalfAngle
+
+def _rotationVectorToQuat(rotVec_XYZ):
+	
+	angle = np.sqrt(np.dot(rotVec_XYZ,rotVec_XYZ))
+	
+	if( angle < 1e-12 ):
+		return np.array([1.0, rotVec_XYZ[0]/2, rotVec_XYZ[1]/2, rotVec_XYZ[2]/2])
+	
+	return np.concatenate([ [np.cos(angle/2)], rotVec_XYZ * np.sin(angle/2) / angle ])
+	
+class rigidPosePredictor():
+	
+	# Extrapolates an OWL rigid pose [x,y,z,w,a,b,c] (phasespace coordinates) to the time it will be on screen.
+	# Linear velocity is the least squares slope of position over the last windowMS of samples,
+	# and angular velocity is the rotation between the first and last samples of that window over its duration.
+	# Both are assumed constant for leadMS past the time of prediction.
+	# 
+	# residual is the error of the same prediction made leadMS before each sample arrived, measured against that sample.
+	# Position error in phasespace units (mm) and angle error in degrees.
+	
+	def __init__(self,leadMS,windowMS=30,historyLength=64,maxExtrapolationMS=100):
+		
+		self.leadMS = leadMS
+		self.windowMS = windowMS
+		self.historyLength = historyLength
+		
+		# Don't extrapolate further than this past the last sample, e.g. when the rigid is occluded
+		self.maxExtrapolationMS = maxExtrapolationMS
+		
+		self.time_h = np.zeros(historyLength)
+		self.pose_h = np.zeros((historyLength,7))
+		self.numSamples = 0
+		
+		# [sampleTime, pose, linearVel_XYZ, angularVel_XYZ] as of the newest sample
+		self.motion = None
+		
+		# [posError, angleErrorDegs] of the last sample, and an RMS over recent samples
+		self.residual = [0.0,0.0]
+		self.residualRMS = [0.0,0.0]
+		self.numResiduals = 0
+		
+	def addSample(self,sampleTime,pose):
+		
+		pose = np.array(pose,dtype=float)
+		
+		if( self.numSamples > 0 ):
+			
+			newestTime = self.time_h[(self.numSamples-1) % self.historyLength]
+			
+			# OWL frames drained in the same refresh share a timestamp.  Keep the first
+			if( sampleTime <= newestTime ):
+				return
+				
+			self._updateResidual(sampleTime,pose)
+			
+			# Keep the quaternion on the same hemisphere as the last, so that differences are along the short arc
+			if( np.dot(pose[3:7],self.pose_h[(self.numSamples-1) % self.historyLength,3:7]) < 0 ):
+				pose[3:7] = -pose[3:7]
+		
+		row = self.numSamples % self.historyLength
+		
+		self.time_h[row] = sampleTime
+		self.pose_h[row] = pose
+		self.numSamples += 1
+		
+		self.motion = self._estimateMotion(sampleTime)
+	
+	def _estimateMotion(self,upToTime):
+		
+		# Returns [sampleTime, pose, linearVel_XYZ, angularVel_XYZ] from the samples at or before upToTime, 
+		# or None if there are none.
+		
+		numValid = min(self.numSamples,self.historyLength)
+		rows_h = np.arange(self.numSamples - numValid,self.numSamples) % self.historyLength
+		
+		rows_h = rows_h[ self.time_h[rows_h] <= upToTime ]
+		
+		if( len(rows_h) == 0 ):
+			return None
+		
+		newestRow = rows_h[-1]
+		rows_h = rows_h[ self.time_h[rows_h] >= self.time_h[newestRow] - self.windowMS / 1000.0 ]
+		
+		linearVel_XYZ = np.zeros(3)
+		angularVel_XYZ = np.zeros(3)
+		
+		if( len(rows_h) > 1 ):
+			
+			time_h = self.time_h[rows_h] - self.time_h[newestRow]
+			pos_h_XYZ = self.pose_h[rows_h,0:3]
+			
+			# Least squares slope
+			time_h = time_h - time_h.mean()
+			linearVel_XYZ = np.dot(time_h,pos_h_XYZ - pos_h_XYZ.mean(axis=0)) / np.dot(time_h,time_h)
+			
+			oldestRow = rows_h[0]
+			
+			quatOldest = self.pose_h[oldestRow,3:7]
+			quatNewest = self.pose_h[newestRow,3:7]
+			
+			# World frame rotation from the oldest to the newest
+			quatOldestInv = quatOldest * [1,-1,-1,-1]
+			rotVec_XYZ = _quatToRotationVector( _quatMultiply(quatNewest,quatOldestInv) )
+			
+			angularVel_XYZ = rotVec_XYZ / (self.time_h[newestRow] - self.time_h[oldestRow])
+		
+		return [ self.time_h[newestRow], self.pose_h[newestRow].copy(), linearVel_XYZ, angularVel_XYZ ]
+		
+	def _extrapolate(self,motion,toTime):
+		
+		sampleTime, pose, linearVel_XYZ, angularVel_XYZ = motion
+		
+		dt = min(max(toTime - sampleTime,0), self.maxExtrapolationMS / 1000.0)
+		
+		quat = _quatMultiply( _rotationVectorToQuat(angularVel_XYZ * dt), pose[3:7] )
+		
+		return np.concatenate([ pose[0:3] + linearVel_XYZ * dt, quat / np.sqrt(np.dot(quat,quat)) ])
+	
+	def _updateResidual(self,sampleTime,pose):
+		
+		motion = self._estimateMotion(sampleTime - self.leadMS / 1000.0)
+		
+		if( motion is None ):
+			return
+			
+		predictedPose = self._extrapolate(motion,sampleTime)
+		
+		posError = np.sqrt(np.sum( (predictedPose[0:3] - pose[0:3])**2 ))
+		angleError = np.degrees( 2 * np.arccos( min(abs(np.dot(predictedPose[3:7],pose[3:7])),1.0) ) )
+		
+		self.residual = [posError,angleError]
+		
+		# Exponentially weighted, over roughly the last 100 samples
+		weight = max(0.01, 1.0 / (self.numResiduals + 1))
+		
+		self.residualRMS = [ np.sqrt( (1-weight) * self.residualRMS[0]**2 + weight * posError**2 ),
+			np.sqrt( (1-weight) * self.residualRMS[1]**2 + weight * angleError**2 ) ]
+			
+		self.numResiduals += 1
+	
+	def predict(self,currentTime):
+		
+		# Returns the pose expected at currentTime + leadMS, or None if no sample has been added
+		
+		if( self.motion is None ):
+			return None
+			
+		return self._extrapolate(self.motion, currentTime + self.leadMS / 1000.0)
+		
+	def getResidual(self):
+		
+		# Returns [[posError, angleErrorDegs] of the last sample, [posErrorRMS, angleErrorRMSDegs]]
+		
+		return [ self.residual, self.residualRMS ]
+	
 class rigidObject(viz.EventClass):
 	
 	def __init__(self,trackerIdx,filePath,fileName,avgMarkerList_midx = [0],rigidOffset_worldXYZ = [0,0,0]):
@@ -52,9 +519,29 @@ class rigidObject(viz.EventClass):
 		
 		self.transformViz = 0
 		
+		# A rigidPosePredictor, if this rigid is extrapolated.  Set by phasespaceInterface.
+		self.predictor = None
+		
+		# Reused for every pose, so that updates do not allocate.  See phasespaceInterface.psPoseToVizTransform
+		self.preallocTransformViz = viz.Transform()
+		
+		# The server's last good pose, and the cond of the last pose it reported
+		self.serverPose = None
+		self.serverCond = -1
+		
+		# The client side fit (see phasespaceInterface.solveRigids), in phasespace coordinates. 
+		# solverResidual is the RMS marker error (mm), and solverServerDiff the distance (mm) from the server's pose, when both are good
+		self.solvedPose = None
+		self.solverResidual = -1
+		self.solverNumMarkers = 0
+		self.solverServerDiff = -1
+		
 		# Create rigid tracker		
 		self._loadDefaults()
 		
+		# Server ID of each marker.  See markerNumToID
+		self.markerServerID_midx = [ markerNumToID(self.trackerIdx, i) for i in range(len(self.markerID_midx)) ]
+		
 		# Create rigidTracker
 		owlTrackeri( self.trackerIdx, OWL_CREATE, OWL_RIGID_TRACKER );
 		
@@ -112,29 +599,32 @@ class rigidObject(viz.EventClass):
 		print 'Mocap: Read ' + str(count) + ' lines from the rigid body file.'
 		if count == 0: print 'This is likely to cause OWL.init() to fail'
 	
-	def getMarkerPositions(self,alPSMarkers_midx):
+	def _findMarkerPositions(self,alPSMarkers_midx,markerSlotByServerID):
+		
+		# Returns the position of each of this rigid's markers that is in alPSMarkers_midx.
+		# markerSlotByServerID maps a marker's server ID to its index in alPSMarkers_midx.
+		# If it is None, it is built here.
+		
+		if( markerSlotByServerID is None ):
+			markerSlotByServerID = makeMarkerSlotIndex(alPSMarkers_midx)
 		
-		# Build list of updated marker positions in newPosWorldCoords
 		newPos_midx_GlobalXYZ = [];
 		
-		for oldMarkerIdx in range( 0, len(self.markerID_midx), 1 ):
-
-			for newMarkerIdx in range( 0, len(alPSMarkers_midx), 1 ):
-				
-				# Confused?  See markerNumToID macro at top!
-				oldRigidIDConverted = markerNumToID( self.trackerIdx, oldMarkerIdx );
-				
-				if( alPSMarkers_midx[newMarkerIdx].id == oldRigidIDConverted ):
-					
-					newPos_midx_GlobalXYZ.append( [ alPSMarkers_midx[newMarkerIdx].x, 
-												alPSMarkers_midx[newMarkerIdx].y,
-												alPSMarkers_midx[newMarkerIdx].z ] );
-												
-				#fi
-				
-			#rof
+		for serverID in self.markerServerID_midx:
 			
-		#rof
+			slot = markerSlotByServerID.get(serverID)
+			
+			if( slot is not None ):
+				
+				psMarker = alPSMarkers_midx[slot]
+				newPos_midx_GlobalXYZ.append( [ psMarker.x, psMarker.y, psMarker.z ] );
+		
+		return newPos_midx_GlobalXYZ
+		
+	def getMarkerPositions(self,alPSMarkers_midx,markerSlotByServerID=None):
+		
+		# Build list of updated marker positions in newPosWorldCoords
+		newPos_midx_GlobalXYZ = self._findMarkerPositions(alPSMarkers_midx,markerSlotByServerID)
 		
 		if( len(newPos_midx_GlobalXYZ) < len(self.markerID_midx ) ):
 			
@@ -174,24 +664,11 @@ class rigidObject(viz.EventClass):
 
 		print "Rigid body definition written to file"
 		
-	def resetRigid( self, alPSMarkers_midx  ):
-		
-		# Build list of updated marker positions in newPosWorldCoords
-		newPos_midx_GlobalXYZ = [];
+	def resetRigid( self, alPSMarkers_midx, markerSlotByServerID=None ):
 		
 		# Find markers that belong to the rigid tracker.
 		# Their most position sensed on this frame is stored in newPos_midx_GlobalXYZH
-		for oldMarkerIdx in range( 0, len(self.markerID_midx), 1 ):
-			for newMarkerIdx in range( 0, len(alPSMarkers_midx), 1 ):
-				
-				# markerNumToID macro defined at top of file!
-				oldRigidIDConverted = markerNumToID( self.trackerIdx, oldMarkerIdx );
-				
-				if( alPSMarkers_midx[newMarkerIdx].id == oldRigidIDConverted ):
-					
-					newPos_midx_GlobalXYZ.append( [ alPSMarkers_midx[newMarkerIdx].x, 
-												alPSMarkers_midx[newMarkerIdx].y,
-												alPSMarkers_midx[newMarkerIdx].z ] );
+		newPos_midx_GlobalXYZ = self._findMarkerPositions(alPSMarkers_midx,markerSlotByServerID)
 
 		# Check to make sure all markers were seen
 		if( len(newPos_midx_GlobalXYZ) < len(self.markerID_midx ) ):
@@ -287,9 +764,10 @@ class rigidObject(viz.EventClass):
 
 class phasespaceInterface(viz.EventClass):
 	
-	def __init__(self, config=None):
+	def __init__(self, config=None, selfUpdate=True):
 		''' Initializes an interface to the phasespace server. 
-		Also sets up rigid body and marker tracker objects. '''
+		Also sets up rigid body and marker tracker objects. 
+		With selfUpdate False, nothing is read from OWL until update() is called (see trackerBackend.phasespaceBackend) '''
 		
 		viz.EventClass.__init__(self)
 		
@@ -298,12 +776,21 @@ class phasespaceInterface(viz.EventClass):
 		self.scale = []
 		self.serverAddress = []
 		self.showEyePosition = 0
-		self.updateActionPaused = 0
 		self.markerSeenThisRound = [];
 		
 		self.allRigidBodyObjects = [];
+		
+		# rigidObjects found by resolveRigid(), by the name they were asked for
+		self.rigidByName = {}
+		
 		self.alPSMarkers_midx = []; # Note that these are vectors of Phasespace marker objects
 		
+		# Server ID -> index in alPSMarkers_midx.  Refreshed with alPSMarkers_midx, in refreshMarkerPositions
+		self.markerSlotByServerID = {}
+		
+		# Vizard positions of alPSMarkers_midx.  Converted in one batch when first asked for, after each refresh
+		self.markerPosViz_slot_XYZ = None
+		
 		# a list of marker IDs on the server.
 		# These ID's are converted to server ID's using the macro
 		# markerNumToID.  
@@ -317,8 +804,10 @@ class phasespaceInterface(viz.EventClass):
 		self.off 			   		= True
 		self.markersUsedInRigid 	= [];
 		
-		self.mainViewUpdateAction = False
 		self.rigidHMDIdx = -1
+		
+		# viz.tick() when the latest OWL data was received
+		self.lastSampleTime = None
 		#self.mainViewLinkedToHead 	= False
 		
 		if config==None:
@@ -331,6 +820,8 @@ class phasespaceInterface(viz.EventClass):
 			self.rigidFileNames_ridx= ['hmd-nvisMount.rb','paddle-hand.rb']
 			self.rigidAvgMarkerList_rIdx_mId = [[1,2],[3,5]]
 			self.rigidOffsetMM_ridx_WorldXYZ = [[0,0,0],[0,0,0]]
+			self.rigidPredictionLeadMS_ridx = [0,0]
+			self.rigidPredictionWindowMS = 30
 			
 			#self.rigidBodyShapes_ridx = ['sphere','cylinder']
 			#self.rigidBodySizes_ridx = [[.1],[.03,.09]]
@@ -345,6 +836,22 @@ class phasespaceInterface(viz.EventClass):
 			self.owlParamModeNum = 1
 			print '**** Using default MODE #' + str(self.owlParamModeNum) + ' ****'
 			
+			self.useAcquisitionThread = False
+			self.sampleBufferLength = 512
+			self.sampleDelayMS = 0
+			self.acquisitionPollMS = 1.0
+			
+			self.rigidSolverMode = 'off'
+			self.rigidSolverMinMarkers = 3
+			self.rigidSolverMaxResidualMM = 5.0
+			
+			self.markerFilterType = 'off'
+			self.markerFilterMaxHoldMS = 100
+			self.markerFilterMinCutoffHz = 1.0
+			self.markerFilterBeta = 5.0
+			self.markerFilterMeasNoiseMM = 0.5
+			self.markerFilterAccelNoise = 30.0
+			
 		else:
 			
 			self.phaseSpaceFilePath 	= 'Resources/'
@@ -355,6 +862,8 @@ class phasespaceInterface(viz.EventClass):
 
 			self.rigidOffsetMM_ridx_WorldXYZ = eval(self.config['phasespace']['rigidOffsetMM_ridx_WorldXYZ'])
 			self.rigidAvgMarkerList_rIdx_mId = eval(self.config['phasespace']['rigidAvgMarkerList_rIdx_mId'])
+			self.rigidPredictionLeadMS_ridx = eval(self.config['phasespace']['rigidPredictionLeadMS_ridx'])
+			self.rigidPredictionWindowMS = self.config['phasespace']['rigidPredictionWindowMS']
 			
 			self.owlParamModeNum	= self.config['phasespace']['owlParamModeNum']
 			
@@ -364,6 +873,28 @@ class phasespaceInterface(viz.EventClass):
 			self.owlParamMarkerCondThresh = self.config['phasespace']['owlParamMarkerCondThresh']
 			self.owlParamRigidCondThresh = self.config['phasespace']['owlParamRigidCondThresh']
 			self.owlParamPostProcess = self.config['phasespace']['owlParamPostProcess']
+			
+			self.useAcquisitionThread = self.config['phasespace']['useAcquisitionThread']
+			self.sampleBufferLength = self.config['phasespace']['sampleBufferLength']
+			self.sampleDelayMS = self.config['phasespace']['sampleDelayMS']
+			self.acquisitionPollMS = self.config['phasespace']['acquisitionPollMS']
+			
+			self.rigidSolverMode = self.config['phasespace']['rigidSolver']
+			self.rigidSolverMinMarkers = self.config['phasespace']['rigidSolverMinMarkers']
+			self.rigidSolverMaxResidualMM = self.config['phasespace']['rigidSolverMaxResidualMM']
+			
+			self.markerFilterType = self.config['phasespace']['markerFilter']
+			self.markerFilterMaxHoldMS = self.config['phasespace']['markerFilterMaxHoldMS']
+			self.markerFilterMinCutoffHz = self.config['phasespace']['markerFilterMinCutoffHz']
+			self.markerFilterBeta = self.config['phasespace']['markerFilterBeta']
+			self.markerFilterMeasNoiseMM = self.config['phasespace']['markerFilterMeasNoiseMM']
+			self.markerFilterAccelNoise = self.config['phasespace']['markerFilterAccelNoise']
+		
+		self.psToViz = psToVizConverter(self.origin,self.scale)
+		
+		# A recording has a slot for each of this tracker's markers and rigids.  See owlReplay.py
+		if( os.environ.get('OWL_RECORD_FILE') ):
+			configureRecording(self.owlParamMarkerCount,len(self.rigidFileNames_ridx))
 		
 		flags = 'OWL_MODE'+ str(self.owlParamModeNum)
 		
@@ -423,6 +954,11 @@ class phasespaceInterface(viz.EventClass):
 			rigidOffsetMM_WorldXYZ = self.rigidOffsetMM_ridx_WorldXYZ[rigidIdx]
 			self.allRigidBodyObjects.append( rigidObject(rigidIdx,self.phaseSpaceFilePath,self.rigidFileNames_ridx[rigidIdx],rigidAvgMarkerList_mId,rigidOffsetMM_WorldXYZ ))
 			
+			if( rigidIdx < len(self.rigidPredictionLeadMS_ridx) and self.rigidPredictionLeadMS_ridx[rigidIdx] > 0 ):
+				
+				self.allRigidBodyObjects[rigidIdx].predictor = rigidPosePredictor(self.rigidPredictionLeadMS_ridx[rigidIdx],self.rigidPredictionWindowMS)
+				print 'Predicting ' + self.rigidFileNames_ridx[rigidIdx] + ' ' + str(self.rigidPredictionLeadMS_ridx[rigidIdx]) + ' ms ahead'
+			
 		### Track markers not on rigid bodies 
 		# Fill allRigidBodyObjects with server data
 		
@@ -493,9 +1029,76 @@ class phasespaceInterface(viz.EventClass):
 			print "HelmetHandPhaseSpace, could not enable OWL_STREAMING, owlGetStatus returned: ", owlGetError()
 			exit();
 
-		# Setup a timer to update owl server
-		self.callback(viz.TIMER_EVENT, self.refreshMarkerPositions)
-		self.starttimer(0,0,viz.FOREVER)
+		####################################################################
+		# Acquisition
+		# Either OWL is read on the render thread, once per frame (refreshMarkerPositions),
+		# or on its own thread at the rate the server streams (see _acquisitionLoop).
+		
+		# Held around calls to OWL, once the acquisition thread is running
+		self.owlLock = threading.RLock()
+		
+		self.acquisitionThread = None
+		self.acquisitionRunning = False
+		self.sampleBuffer = None
+		
+		# Number of samples in sampleBuffer that have been passed on to rigid predictors
+		self.numSamplesPredicted = 0
+		
+		self.predictedRigids_ridx = [ rigidBody for rigidBody in self.allRigidBodyObjects if rigidBody.predictor ]
+		
+		# Stand-ins for OWL markers, refilled from the sample buffer every frame
+		self.bufferedMarkers_slot = []
+		
+		####################################################################
+		# Marker filtering.  Positions are in Vizard coordinates, indexed as markerServerID_mIdx
+		
+		self.markerFilterBank = None
+		self.numSamplesFiltered = 0
+		
+		if( self.markerFilterType != 'off' ):
+			
+			numMarkers = len(self.markerServerID_mIdx)
+			
+			self.markerFilterBank = markerFilter.markerFilterBank(numMarkers,self.markerFilterType,self.markerFilterMaxHoldMS,
+				minCutoffHz=self.markerFilterMinCutoffHz,beta=self.markerFilterBeta,
+				measNoise=self.markerFilterMeasNoiseMM/1000.0,accelNoise=self.markerFilterAccelNoise)
+			
+			# Server ID -> index in markerServerID_mIdx, or -1
+			self.markerIdxByServerID_lut = np.zeros(max(self.markerServerID_mIdx)+1,dtype=np.int32) - 1
+			self.markerIdxByServerID_lut[self.markerServerID_mIdx] = np.arange(numMarkers)
+			
+			# Input to the filter, refilled on every update
+			self.filterInputPos_m_XYZ = np.zeros((numMarkers,3))
+			self.filterInputSeen_m = np.zeros(numMarkers,dtype=bool)
+			
+			print 'Mocap: Filtering markers (' + self.markerFilterType + ')'
+			
+		####################################################################
+		# Client side rigid fitting.  See solveRigids
+		
+		if( self.rigidSolverMode != 'off' ):
+			
+			self._updateSolverDefinitions()
+			print 'Mocap: Solving rigids on the client (' + self.rigidSolverMode + ')'
+		
+		if( self.useAcquisitionThread ):
+			
+			self.sampleBuffer = owlSampleBuffer(self.sampleBufferLength,self.owlParamMarkerCount,len(self.allRigidBodyObjects))
+			self.bufferedMarkers_slot = [ bufferedMarker() for slot in range(self.owlParamMarkerCount) ]
+			
+			if( selfUpdate ):
+				# Before anything else that runs at PRIORITY_FIRST_UPDATE (e.g. the HMD update)
+				frameProfiler.onupdate('applyMocapSample',viz.PRIORITY_FIRST_UPDATE-1,self.applyLatestSample)
+			
+			self.startAcquisitionThread()
+			self.callback(viz.EXIT_EVENT, self.stopAcquisitionThread)
+			
+		elif( selfUpdate ):
+			
+			# Setup a timer to update owl server
+			self.callback(viz.TIMER_EVENT, self.refreshMarkerPositions)
+			self.starttimer(0,0,viz.FOREVER)
+			
 		self.turnOn()
 	
 	# end init
@@ -513,33 +1116,72 @@ class phasespaceInterface(viz.EventClass):
 				
 		print 'returnPointerToRigid: Could not find ' + fileName
 		return 0
+	
+	def resolveRigid(self,fileName):
+		
+		# As returnPointerToRigid, but the name is only searched for the first time it is asked for.
+		# Code that runs every frame should resolve the rigid once, and hold on to the rigidObject.
+		
+		rigidBody = self.rigidByName.get(fileName)
+		
+		if( rigidBody is None ):
+			
+			rigidBody = self.returnPointerToRigid(fileName)
+			
+			if( rigidBody ):
+				self.rigidByName[fileName] = rigidBody
+				
+		return rigidBody
 		
 	def returnPointerToMarker(self,markerIdx):
 	
 		# Uses marker Idx to find the marker's position
 		
-		for mIdx in range(len(self.alPSMarkers_midx)):
-			if( self.alPSMarkers_midx[mIdx].id == self.markerServerID_mIdx[markerIdx] ):
-				return self.alPSMarkers_midx[mIdx]
+		slot = self.markerSlotByServerID.get(self.markerServerID_mIdx[markerIdx])
+		
+		if( slot is not None ):
+			return self.alPSMarkers_midx[slot]
 		
 		print 'returnPointerToMarker: Could not find marker number' + str(markerIdx)
 		return 0
 	
 	def getMarkerPosition(self,markerID):
 		# Returns marker position in VIZARD frame of reference
+		# If markers are filtered ([phasespace] markerFilter), this is the filtered position, 
+		# which is held through gaps of up to markerFilterMaxHoldMS.
 		
-		for mIdx in range(len(self.alPSMarkers_midx)):
-			if( self.alPSMarkers_midx[mIdx].id == self.markerServerID_mIdx[markerID] ):
-				
-				pos_XYZ = [self.alPSMarkers_midx[mIdx].x, self.alPSMarkers_midx[mIdx].y, self.alPSMarkers_midx[mIdx].z]
-				
-				condition = self.alPSMarkers_midx[mIdx].cond
+		if( self.markerFilterBank ):
+			
+			pos_XYZ = self.markerFilterBank.getFiltered(markerID)
+			
+			if( pos_XYZ is None ):
+				return 0
 				
-				if( condition > 0 and condition < self.owlParamMarkerCondThresh ):
-					return self.psPosToVizPos(pos_XYZ)
-				else:
-					# print 'Bad condition'
-					return 0
+			return pos_XYZ
+			
+		return self.getRawMarkerPosition(markerID)
+		
+	def getRawMarkerPosition(self,markerID):
+		# Returns marker position in VIZARD frame of reference, unfiltered
+		
+		slot = self.markerSlotByServerID.get(self.markerServerID_mIdx[markerID])
+		
+		if( slot is None ):
+			return
+		
+		psMarker = self.alPSMarkers_midx[slot]
+		
+		condition = psMarker.cond
+		
+		if( condition > 0 and condition < self.owlParamMarkerCondThresh ):
+			
+			if( self.markerPosViz_slot_XYZ is None ):
+				self.markerPosViz_slot_XYZ = self.psMarkersToVizPos(self.alPSMarkers_midx)
+			
+			return self.markerPosViz_slot_XYZ[slot].tolist()
+		else:
+			# print 'Bad condition'
+			return 0
 				
 	def checkForRigid(self,fileName):
 		return( self.returnPointerToRigid(fileName) )
@@ -549,10 +1191,7 @@ class phasespaceInterface(viz.EventClass):
 			
 	def turnOff(self):
 		
-		if( self.mainViewUpdateAction ):
-			self.disableHMDTracking()
-			self.updateActionPaused = 1;
-			
+		# Also stops trackerBackend.phasespaceBackend polling, so a MainView linked to a rigid holds still
 		self.off = 1
 		self.setEnabled(False)
 		
@@ -561,10 +1200,6 @@ class phasespaceInterface(viz.EventClass):
 		
 		self.off = 0
 		self.setEnabled(True)
-		
-		if( self.updateActionPaused ):
-			self.enableHMDTracking()
-			self.updateActionPaused = 0;
 
 	def isOn(self):
 		return not self.off
@@ -581,6 +1216,276 @@ class phasespaceInterface(viz.EventClass):
 
 	
 	
+	def update(self):
+		
+		# One update, for when the owner of this interface drives it (selfUpdate=False)
+		
+		if( self.useAcquisitionThread ):
+			self.applyLatestSample()
+		else:
+			self.refreshMarkerPositions(0)
+			
+	def startAcquisitionThread(self):
+		
+		if( self.acquisitionRunning ):
+			return
+			
+		self.acquisitionRunning = True
+		self.acquisitionThread = threading.Thread(target=self._acquisitionLoop)
+		self.acquisitionThread.daemon = True
+		self.acquisitionThread.start()
+		
+	def stopAcquisitionThread(self,event=None):
+		
+		if( not self.acquisitionRunning ):
+			return
+		
+		self.acquisitionRunning = False
+		self.acquisitionThread.join()
+		self.acquisitionThread = None
+		
+	def _acquisitionLoop(self):
+		
+		# Reads every OWL frame into self.sampleBuffer as it arrives.  
+		# When the server has nothing new, sleep rather than spin.
+		
+		while( self.acquisitionRunning ):
+			
+			self.owlLock.acquire()
+			
+			try:
+				markersSeen = owlGetMarkers()
+				rigidsSeen = owlGetRigids()
+			finally:
+				self.owlLock.release()
+			
+			if( len(markersSeen) or len(rigidsSeen) ):
+				self.sampleBuffer.write(viz.tick(),markersSeen,rigidsSeen)
+			else:
+				time.sleep(self.acquisitionPollMS / 1000.0)
+				
+	def applyLatestSample(self):
+		
+		# Takes the most recent sample (or, if sampleDelayMS > 0, a sample interpolated to that long ago)
+		# from the sample buffer, and applies it as refreshMarkerPositions does.  Never waits on the acquisition thread.
+		
+		if( self.off ):
+			return
+			
+		if( self.sampleDelayMS > 0 ):
+			sample = self.sampleBuffer.getSampleAtTime( viz.tick() - self.sampleDelayMS / 1000.0 )
+		else:
+			sample = self.sampleBuffer.getLatestSample()
+			
+		if( sample is None ):
+			return
+			
+		sampleTime, numMarkers, markerID_slot, markerXYZ_slot, markerCond_slot, rigidPose_ridx, rigidCond_ridx = sample
+		
+		self.lastSampleTime = sampleTime
+		
+		self.markerSeenThisRound = []
+		
+		firstTime = len(self.alPSMarkers_midx) < numMarkers
+		
+		for slot in range(numMarkers):
+			
+			currentMarkersCondition = markerCond_slot[slot]
+			
+			# Run a quality check!  All markers are taken the first time
+			if( firstTime or ( currentMarkersCondition > 0 and currentMarkersCondition < self.owlParamMarkerCondThresh ) ):
+				
+				psMarker = self.bufferedMarkers_slot[slot]
+				psMarker.id = markerID_slot[slot]
+				psMarker.x, psMarker.y, psMarker.z = markerXYZ_slot[slot]
+				psMarker.cond = currentMarkersCondition
+				
+				self.markerSeenThisRound.append(slot)
+		
+		if( firstTime ):
+			self.alPSMarkers_midx = self.bufferedMarkers_slot[:numMarkers]
+			
+		self.markerSlotByServerID = makeMarkerSlotIndex(self.alPSMarkers_midx)
+		self.markerPosViz_slot_XYZ = None
+		
+		for rIdx in range(len(rigidCond_ridx)):
+			if( rigidCond_ridx[rIdx] > 0 and rigidCond_ridx[rIdx] < self.owlParamMarkerCondThresh and not self.allRigidBodyObjects[rIdx].predictor ):
+				rigidBody = self.allRigidBodyObjects[rIdx]
+				rigidBody.transformViz = self.psPoseToVizTransform(rigidPose_ridx[rIdx],rigidBody.preallocTransformViz)
+		
+		for rIdx in range(len(rigidCond_ridx)):
+			
+			self.allRigidBodyObjects[rIdx].serverCond = rigidCond_ridx[rIdx]
+			
+			if( rigidCond_ridx[rIdx] > 0 and rigidCond_ridx[rIdx] < self.owlParamMarkerCondThresh ):
+				self.allRigidBodyObjects[rIdx].serverPose = rigidPose_ridx[rIdx]
+			
+		if( self.rigidSolverMode != 'off' ):
+			self.solveRigids(sampleTime,markerID_slot[:numMarkers],markerXYZ_slot[:numMarkers],markerCond_slot[:numMarkers])
+		
+		if( self.markerFilterBank ):
+			
+			rows_s, self.numSamplesFiltered = self.sampleBuffer.getRowsSince(self.numSamplesFiltered)
+			
+			for row in rows_s:
+				
+				numRowMarkers = self.sampleBuffer.numMarkers_s[row]
+				
+				self._filterMarkers(self.sampleBuffer.time_s[row], self.sampleBuffer.markerID_s_slot[row,:numRowMarkers],
+					self.sampleBuffer.markerXYZ_s_slot[row,:numRowMarkers], self.sampleBuffer.markerCond_s_slot[row,:numRowMarkers])
+		
+		if( len(self.predictedRigids_ridx) ):
+			
+			# Every sample since the last frame goes to the predictors, with the time it was received.
+			# With rigidSolver 'always', the predictors are fed solved poses only (see solveRigids), so that they fit one source
+			rows_s, self.numSamplesPredicted = self.sampleBuffer.getRowsSince(self.numSamplesPredicted)
+			
+			if( self.rigidSolverMode == 'always' ):
+				rows_s = []
+			
+			for row in rows_s:
+				for rigidBody in self.predictedRigids_ridx:
+					
+					rigidCond = self.sampleBuffer.rigidCond_s_ridx[row,rigidBody.trackerIdx]
+					
+					if( rigidCond > 0 and rigidCond < self.owlParamMarkerCondThresh ):
+						rigidBody.predictor.addSample(self.sampleBuffer.time_s[row],self.sampleBuffer.rigidPose_s_ridx[row,rigidBody.trackerIdx])
+			
+			self.applyRigidPredictions()
+		
+	def _updateSolverDefinitions(self):
+		
+		# Rigid definitions for solveRigids, padded to the same number of markers.  
+		# Call again whenever a definition changes (resetRigid, rotateRigid)
+		
+		numRigids = len(self.allRigidBodyObjects)
+		maxMarkers = max( [ len(rigidBody.markerPos_midx_localXYZ) for rigidBody in self.allRigidBodyObjects ] + [1] )
+		
+		self.solverLocal_r_m_XYZ = np.zeros((numRigids,maxMarkers,3))
+		
+		# Padding points at the extra, never seen, row of the lookup tables in solveRigids
+		self.solverServerID_r_m = np.zeros((numRigids,maxMarkers),dtype=np.int32) - 1
+		
+		for rIdx in range(numRigids):
+			
+			rigidBody = self.allRigidBodyObjects[rIdx]
+			numRigidMarkers = len(rigidBody.markerPos_midx_localXYZ)
+			
+			self.solverLocal_r_m_XYZ[rIdx,:numRigidMarkers] = rigidBody.markerPos_midx_localXYZ
+			self.solverServerID_r_m[rIdx,:numRigidMarkers] = rigidBody.markerServerID_midx[:numRigidMarkers]
+		
+		self.solverLUTSize = max( self.solverServerID_r_m.max(), 0 ) + 2
+		self.solverServerID_r_m[ self.solverServerID_r_m < 0 ] = self.solverLUTSize - 1
+		
+		self.solverXYZ_lut = np.zeros((self.solverLUTSize,3))
+		self.solverWeight_lut = np.zeros(self.solverLUTSize)
+		
+	def solveRigids(self,sampleTime,markerID_slot,markerXYZ_slot,markerCond_slot):
+		
+		# Fits every rigid definition to the markers of one OWL frame (arrays, phasespace coordinates), all at once.
+		# Markers are weighted by 1/cond, so poorly tracked markers count for less.
+		#
+		# rigidSolver 'fallback':  the fit replaces the server's pose when the server's cond is bad
+		# rigidSolver 'always':  the fit is always used
+		# Either way, a fit is only used if it has enough markers and a residual below rigidSolverMaxResidualMM
+		
+		markerID_slot = np.asarray(markerID_slot)
+		markerCond_slot = np.asarray(markerCond_slot)
+		
+		ours_slot = (markerID_slot >= 0) & (markerID_slot < self.solverLUTSize - 1)
+		good_slot = ours_slot & (markerCond_slot > 0) & (markerCond_slot < self.owlParamMarkerCondThresh)
+		
+		self.solverWeight_lut[:] = 0
+		self.solverXYZ_lut[markerID_slot[good_slot]] = np.asarray(markerXYZ_slot)[good_slot]
+		self.solverWeight_lut[markerID_slot[good_slot]] = 1.0 / markerCond_slot[good_slot]
+		
+		pose_r_XYZWABC, rmsResidual_r, numMarkers_r, valid_r = rigidSolver.solveRigids(self.solverLocal_r_m_XYZ,
+			self.solverXYZ_lut[self.solverServerID_r_m], self.solverWeight_lut[self.solverServerID_r_m], self.rigidSolverMinMarkers)
+		
+		for rIdx in range(len(self.allRigidBodyObjects)):
+			
+			rigidBody = self.allRigidBodyObjects[rIdx]
+			
+			rigidBody.solverNumMarkers = numMarkers_r[rIdx]
+			
+			if( not valid_r[rIdx] ):
+				rigidBody.solvedPose = None
+				rigidBody.solverResidual = -1
+				continue
+				
+			rigidBody.solvedPose = pose_r_XYZWABC[rIdx]
+			rigidBody.solverResidual = rmsResidual_r[rIdx]
+			
+			serverGood = rigidBody.serverCond > 0 and rigidBody.serverCond < self.owlParamMarkerCondThresh
+			
+			# Cross check against the server
+			if( serverGood and rigidBody.serverPose is not None ):
+				rigidBody.solverServerDiff = np.sqrt( np.sum( (np.asarray(rigidBody.serverPose[0:3]) - rigidBody.solvedPose[0:3])**2 ) )
+			else:
+				rigidBody.solverServerDiff = -1
+			
+			if( rigidBody.solverResidual > self.rigidSolverMaxResidualMM ):
+				continue
+				
+			if( self.rigidSolverMode == 'always' or not serverGood ):
+				
+				if( rigidBody.predictor ):
+					rigidBody.predictor.addSample(sampleTime,rigidBody.solvedPose)
+				else:
+					rigidBody.transformViz = self.psPoseToVizTransform(rigidBody.solvedPose,rigidBody.preallocTransformViz)
+			
+	def _filterMarkers(self,sampleTime,markerID_slot,markerXYZ_slot,markerCond_slot):
+		
+		# Passes one OWL frame (arrays, phasespace coordinates) to markerFilterBank.  
+		# Markers with a poor cond, or that aren't ours, count as unseen
+		
+		markerID_slot = np.asarray(markerID_slot)
+		markerCond_slot = np.asarray(markerCond_slot)
+		
+		known_slot = (markerID_slot >= 0) & (markerID_slot < len(self.markerIdxByServerID_lut))
+		markerIdx_slot = np.zeros(len(markerID_slot),dtype=np.int32) - 1
+		markerIdx_slot[known_slot] = self.markerIdxByServerID_lut[markerID_slot[known_slot]]
+		
+		good_slot = (markerIdx_slot >= 0) & (markerCond_slot > 0) & (markerCond_slot < self.owlParamMarkerCondThresh)
+		
+		self.filterInputSeen_m[:] = False
+		self.filterInputSeen_m[markerIdx_slot[good_slot]] = True
+		
+		if( good_slot.any() ):
+			self.filterInputPos_m_XYZ[markerIdx_slot[good_slot]] = self.psToViz.posArrayToVizPos(np.asarray(markerXYZ_slot)[good_slot])
+		
+		self.markerFilterBank.update(sampleTime,self.filterInputPos_m_XYZ,self.filterInputSeen_m)
+		
+	def _filterOWLMarkers(self,sampleTime,alPSMarkers_midx):
+		
+		# As _filterMarkers, for a list of OWL markers
+		
+		markerData_midx = np.array([ [psMarker.id, psMarker.cond, psMarker.x, psMarker.y, psMarker.z] for psMarker in alPSMarkers_midx ],dtype=float).reshape(-1,5)
+		
+		self._filterMarkers(sampleTime,markerData_midx[:,0].astype(np.int32),markerData_midx[:,2:5],markerData_midx[:,1])
+		
+	def applyRigidPredictions(self):
+		
+		# Sets the transformViz of predicted rigids to their predicted pose.  Called every frame, even if OWL had nothing new
+		
+		currentTime = viz.tick()
+		
+		for rigidBody in self.predictedRigids_ridx:
+			
+			predictedPose = rigidBody.predictor.predict(currentTime)
+			
+			if( predictedPose is not None ):
+				rigidBody.transformViz = self.psPoseToVizTransform(predictedPose,rigidBody.preallocTransformViz)
+				
+	def getRigidPredictionResidual(self,fileName):
+		
+		# Returns rigidPosePredictor.getResidual() for the named rigid, or None if it is not predicted
+		
+		rigidBody = self.resolveRigid(fileName)
+		
+		if( rigidBody and rigidBody.predictor ):
+			return rigidBody.predictor.getResidual()
+	
 	def refreshMarkerPositions( self, num ):
 		
 		if (num == 0):
@@ -591,6 +1496,10 @@ class phasespaceInterface(viz.EventClass):
 			markersSeen = [];
 			#self.alPSMarkers_midx = []
 			
+			# A rigid the server doesn't report this time has no server pose, for solveRigids' 'fallback'
+			for rigidBody in self.allRigidBodyObjects:
+				rigidBody.serverCond = -1
+			
 			# There is a buffer of rigidsSeen and markersSeen
 			# Empty this buffer and use latest information.
 			while numMarkersSeenThisRound:
@@ -601,6 +1510,8 @@ class phasespaceInterface(viz.EventClass):
 				
 				if( numMarkersSeenThisRound > 0 ):
 					
+					self.lastSampleTime = viz.tick()
+					
 					tempMarkerVector = [];
 					
 					if( numMarkersSeenLastRound == 0 or len(self.alPSMarkers_midx) < self.owlParamMarkerCount ):
@@ -632,6 +1543,10 @@ class phasespaceInterface(viz.EventClass):
 						#rof
 					
 					#fi
+					
+					# Once per OWL frame
+					self.markerSlotByServerID = makeMarkerSlotIndex(self.alPSMarkers_midx)
+					self.markerPosViz_slot_XYZ = None
 			
 				#fi
 				
@@ -657,24 +1572,58 @@ class phasespaceInterface(viz.EventClass):
 							# This runs on all subsequent frames in which a rigid body has been seen
 							for rSeenIdx in range(0,len(rigidsSeen)):
 								
+								self.allRigidBodyObjects[rSeenIdx].serverCond = rigidsSeen[rSeenIdx].cond
+								
 								if( rigidsSeen[rSeenIdx].cond > 0 and  rigidsSeen[rSeenIdx].cond < self.owlParamMarkerCondThresh ):									
 									
 									pose = rigidsSeen[rSeenIdx].pose
-									transformViz = self.psPoseToVizTransform(pose)
+									self.allRigidBodyObjects[rSeenIdx].serverPose = pose
+									
+									if( self.allRigidBodyObjects[rSeenIdx].predictor ):
+										# Timestamped on receipt.  See applyRigidPredictions.  With rigidSolver 'always', only solved poses are predicted
+										if( self.rigidSolverMode != 'always' ):
+											self.allRigidBodyObjects[rSeenIdx].predictor.addSample(viz.tick(),pose)
+										continue
+										
+									rigidBody = self.allRigidBodyObjects[rSeenIdx]
+									transformViz = self.psPoseToVizTransform(pose,rigidBody.preallocTransformViz)
 									#print transformViz
-									self.allRigidBodyObjects[rSeenIdx].transformViz  = transformViz
+									rigidBody.transformViz  = transformViz
 								#else:
 									#print 'Problem!'
 									
+			if( self.rigidSolverMode != 'off' ):
+				
+				# Only the markers that were updated this time
+				markerData_midx = np.array([ [psMarker.id, psMarker.cond, psMarker.x, psMarker.y, psMarker.z] 
+					for psMarker in [ self.alPSMarkers_midx[slot] for slot in self.markerSeenThisRound ] ],dtype=float).reshape(-1,5)
+				
+				self.solveRigids( viz.tick(), markerData_midx[:,0].astype(np.int32), markerData_midx[:,2:5], markerData_midx[:,1] )
+				
+			if( self.markerFilterBank ):
+				# Only the markers that were updated this time
+				self._filterOWLMarkers( viz.tick(), [ self.alPSMarkers_midx[slot] for slot in self.markerSeenThisRound ] )
+				
+			if( len(self.predictedRigids_ridx) ):
+				self.applyRigidPredictions()
+				
 			
 	def resetRigid( self, fileName ):
 		
-		rigidBody = self.returnPointerToRigid( fileName );
+		rigidBody = self.resolveRigid( fileName );
 		
 		if( rigidBody ):
 			
 			#if( self.mainViewUpdateAction ):
-			rigidBody.resetRigid( self.alPSMarkers_midx );
+			self.owlLock.acquire()
+			
+			try:
+				rigidBody.resetRigid( self.alPSMarkers_midx, self.markerSlotByServerID );
+			finally:
+				self.owlLock.release()
+				
+			if( self.rigidSolverMode != 'off' ):
+				self._updateSolverDefinitions()
 		else:
 			
 			print ('Error: Rigid body not initialized');
@@ -684,7 +1633,7 @@ class phasespaceInterface(viz.EventClass):
 	#fed
 		
 	def saveRigid(self,fileName):
-		rigidBody = self.returnPointerToRigid(fileName)
+		rigidBody = self.resolveRigid(fileName)
 		
 		if(rigidBody):
 			rigidBody.saveNewDefaults()
@@ -692,10 +1641,18 @@ class phasespaceInterface(viz.EventClass):
 	
 	def rotateRigid(self,fileName,rotateByDegs_XYZ):
 		
-		rigidBody = self.returnPointerToRigid(fileName)
+		rigidBody = self.resolveRigid(fileName)
 		
 		if(rigidBody):
-			rigidBody.rotateRigid(rotateByDegs_XYZ)
+			self.owlLock.acquire()
+			
+			try:
+				rigidBody.rotateRigid(rotateByDegs_XYZ)
+			finally:
+				self.owlLock.release()
+				
+			if( self.rigidSolverMode != 'off' ):
+				self._updateSolverDefinitions()
 		else: print 'Error: Rigid body not initialized'
 		
 		
@@ -709,7 +1666,7 @@ class phasespaceInterface(viz.EventClass):
 	
 	def toggleEyeProbes(self):
 		
-		hmdRigid = self.returnPointerToRigid('hmd')
+		hmdRigid = self.resolveRigid('hmd')
 		
 		if( hmdRigid ):
 			print 'Toggling eye probes'
@@ -717,45 +1674,6 @@ class phasespaceInterface(viz.EventClass):
 		else:
 			print 'No HMD rigid body'
 	
-	def enableHMDTracking(self):
-		
-		if( self.mainViewUpdateAction is False):
-			print 'phaseSpaceInterface.enableHMDTracking: Mainview now updated to match *hmd*.rb position and orientation'
-			self.mainViewUpdateAction = vizact.onupdate(viz.PRIORITY_FIRST_UPDATE,self.updateMainViewWithRigid,'hmd')
-	
-	def disableHMDTracking(self):
-		
-		if( self.mainViewUpdateAction ):
-			print 'phaseSpaceInterface.enableHMDTracking: Mainview fred from *hmd*.rb'
-			vizact.removeEvent(self.mainViewUpdateAction)
-			self.mainViewUpdateAction = False
-		
-		#self.mainViewUpdateAction.
-		
-	def updateMainViewWithRigid(self,fileName):
-	
-		#print viz.getFrameNumber()
-		rigidBody = self.returnPointerToRigid(fileName)
-		
-		if(rigidBody):
-			
-			# Transform is updated in refreshmarkerpositions
-			transformViz  = rigidBody.transformViz
-			#print transformViz  
-			
-			if transformViz:
-				#print 'mocap.updateMainViewWithRigid: updating with transform'
-				viz.MainView.setMatrix(transformViz)
-			else:
-				# No server data
-				# This should only occur on startup
-				# when rigid body has been registered
-				# but system hasn't yet recieved data
-				#print 'No transform'
-				return
-				
-		else: print 'mocapINterface.updateMainViewWithRigid() Rigid body not initialized'
-
 	def printMarkerIDs(self):
 		
 		for mIdx in range(len(self.alPSMarkers_midx)):
@@ -765,38 +1683,26 @@ class phasespaceInterface(viz.EventClass):
 			
 			#print 'returnPointerToMarker: Could not find marker number' + str(markerID)
 	
-	def psPoseToVizTransform(self,psPose):
+	def psPoseToVizTransform(self,psPose,transformViz=None):
 		
 		# Set rigid body transformation matrix
-		pos_XYZ = [  psPose[0]*self.scale[0] + self.origin[0],
-		 psPose[1]*self.scale[1] + self.origin[1],
-		-psPose[2]*self.scale[2] + self.origin[2] ];
-		
-		# PS quats are WABC
-		# Viz wants ABCW
-		quat_ABCW = [ psPose[4], psPose[5], -psPose[6], -psPose[3] ];
+		# Pass a rigid's preallocTransformViz as transformViz to write into it rather than make a new Transform
 		
-		transformViz = viz.Transform()
-		transformViz.setQuat(quat_ABCW)
-		transformViz.postTrans(pos_XYZ)
-		transformViz.postAxisAngle(0,1,0,90)
-		
-		return transformViz
+		return self.psToViz.poseToVizTransform(psPose,transformViz)
 		
 	def psPosToVizPos(self,posPS_XYZ):
 		
 		# FLip Z axis and rotate basis CCW 90 degs
 		
-		# Set rigid body transformation matrix
-		pos_XYZ = [  posPS_XYZ[0]*self.scale[0] + self.origin[0],
-		 posPS_XYZ[1]*self.scale[1] + self.origin[1],
-		-posPS_XYZ[2]*self.scale[2] + self.origin[2] ];
+		return self.psToViz.posToVizPos(posPS_XYZ)
 		
-		transformViz = viz.Transform()
-		transformViz.postTrans(pos_XYZ)
-		transformViz.postAxisAngle(0,1,0,90)
+	def psMarkersToVizPos(self,alPSMarkers_midx):
 		
-		return transformViz.getPosition()
+		# Vizard positions of a list of OWL markers, as an Nx3 array
+		
+		posPS_midx_XYZ = np.array([ [psMarker.x, psMarker.y, psMarker.z] for psMarker in alPSMarkers_midx ],dtype=float).reshape(-1,3)
+		
+		return self.psToViz.posArrayToVizPos(posPS_midx_XYZ)
 
 if __name__ == "__main__":
 	
@@ -805,16 +1711,18 @@ if __name__ == "__main__":
 	environment = viz.addChild('piazza.osgb')
 	environment.setPosition(2.75,0,-.75)
 	
-	## Setup the phasespace server
-	mocap = phasespaceInterface();
+	## Setup the phasespace server, updated by a trackerManager, which also links the mainview to the hmd rigid
+	import trackerBackend
+	
+	mocap = phasespaceInterface(selfUpdate=False);
+	tracker = trackerBackend.trackerManager([trackerBackend.phasespaceBackend(mocap)])
 	
-	mocap.enableHMDTracking()
+	tracker.linkMainView('hmd')
 	
 	# Auto-update the mainview with the rigid body position
 	# Note the use of 'hmd' as a partial string.
 	# This is used to find a rigid body file that contains this string
 	# In my case, hmd-oculus.rb
-	#vizact.onupdate(viz.PRIORITY_FIRST_UPDATE,mocap.updateMainViewWithRigid,'hmd')
 	#vizact.onupdate(viz.PRIORITY_FIRST_UPDATE,mocap.getMarkerPosition,1)
 	
 	#import oculus
@@ -836,4 +1744,4 @@ if __name__ == "__main__":
 	vizact.onkeydown( 'H', mocap.saveRigid, 'hmd' );
 	vizact.onkeydown( 'p', mocap.resetRigid, 'paddle' );
 	vizact.onkeydown( 'P', mocap.saveRigid, 'paddle' );
-	vizact.onkeydown( 'e', mocap.enableHMDTracking);
+	vizact.onkeydown( 'e', tracker.linkMainView, 'hmd');
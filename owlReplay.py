@@ -0,0 +1,477 @@
+"""
+Records the OWL (PhaseSpace) stream to a file, and plays it back through the same functions as the OWL module.
+
+mocapInterface and phasespaceNew import this module in place of OWL when one of these environment variables is set.
+Otherwise, importing it only provides the file tools (openRecording, owlRecorder, owlPlayer).
+
+	OWL_RECORD_FILE=<path>	Talk to the server through OWL as usual, and write every owlGetMarkers() / owlGetRigids() result to <path>
+	OWL_REPLAY_FILE=<path>	No server.  owlGetMarkers() and owlGetRigids() return what was recorded to <path>
+	OWL_REPLAY_SPEED=<x>	Replay x times faster than recorded (default 1).
+
+Calls that configure the server (owlTracker, owlMarkerfv, ...) do nothing during replay.
+To drive replay from something other than the wall clock, e.g. to step it deterministically one frame at a time,
+see setReplayClock().
+
+A recording is two files, <path>.markers and <path>.rigids.  Each is a 64 byte header followed by fixed-size records
+(see markerRecordDtype, rigidRecordDtype), one per non-empty owlGetMarkers() or owlGetRigids(), so it can be opened with numpy.memmap:
+
+	markerRecords, rigidRecords = owlReplay.openRecording('Data/session.owl')
+	markerRecords['markerXYZ'][:,0]
+
+Records have a slot per marker (or rigid) the tracker is configured for (see configureRecording).
+A call that returns more is recorded truncated, counted in the record's numDropped, and reported.
+"""
+
+import os
+import atexit
+import timeit
+import numpy as np
+
+FILE_MAGIC = 'OWLREC02'
+HEADER_SIZE = 64
+
+# Header.kind
+MARKER_RECORD = 0
+RIGID_RECORD = 1
+
+recordFileSuffixes = { MARKER_RECORD: '.markers', RIGID_RECORD: '.rigids' }
+
+# Slots per record, when the recording is not sized by configureRecording
+DEFAULT_MAX_MARKERS = 64
+DEFAULT_MAX_RIGIDS = 8
+
+headerDtype = np.dtype([ ('magic','S8'), ('kind','<i4'), ('numSlots','<i4') ])
+
+# Times are seconds, from timeit.default_timer, when the call returned.
+# count is the number of slots filled, and numDropped the number of markers or rigids that did not fit
+
+def markerRecordDtype(numSlots):
+
+	return np.dtype([ ('time','<f8'),
+		('count','<i4'),
+		('numDropped','<i4'),
+		('markerID','<i4',(numSlots,)),
+		('markerCond','<f4',(numSlots,)),
+		('markerXYZ','<f4',(numSlots,3)) ])
+
+def rigidRecordDtype(numSlots):
+
+	return np.dtype([ ('time','<f8'),
+		('count','<i4'),
+		('numDropped','<i4'),
+		('rigidID','<i4',(numSlots,)),
+		('rigidCond','<f4',(numSlots,)),
+		('rigidPose','<f4',(numSlots,7)) ])
+
+recordDtypeFuncs = { MARKER_RECORD: markerRecordDtype, RIGID_RECORD: rigidRecordDtype }
+
+def _openRecordFile(fileName,kind):
+
+	# Returns the records of one kind, memory-mapped (read only)
+
+	header = np.fromfile(fileName,dtype=headerDtype,count=1)
+
+	if( len(header) == 0 or header[0]['magic'] != FILE_MAGIC or header[0]['kind'] != kind ):
+		raise IOError(fileName + ' is not an OWL recording of ' + recordFileSuffixes[kind][1:])
+
+	dtype = recordDtypeFuncs[kind](header[0]['numSlots'])
+	numRecords = (os.path.getsize(fileName) - HEADER_SIZE) // dtype.itemsize
+
+	if( numRecords == 0 ):
+		return np.zeros(0,dtype=dtype)
+
+	return np.memmap(fileName,dtype=dtype,mode='r',offset=HEADER_SIZE,shape=(numRecords,))
+
+def openRecording(fileName):
+
+	# Returns [markerRecords, rigidRecords], memory-mapped (read only)
+
+	return [ _openRecordFile(fileName + recordFileSuffixes[kind],kind) for kind in [MARKER_RECORD,RIGID_RECORD] ]
+
+class _recordFile():
+
+	# One kind of record, appended to its own file
+
+	def __init__(self,fileName,kind,numSlots):
+
+		self.fileName = fileName
+		self.numSlots = numSlots
+
+		# One record, refilled for each call
+		self.record = np.zeros(1,dtype=recordDtypeFuncs[kind](numSlots))
+		self.numRecords = 0
+		self.numRecordsTruncated = 0
+		self.numDropped = 0
+
+		header = np.zeros(HEADER_SIZE,dtype=np.uint8)
+		header[:headerDtype.itemsize] = np.frombuffer( np.array([(FILE_MAGIC,kind,numSlots)],dtype=headerDtype).tostring(),dtype=np.uint8 )
+
+		self.fileObject = open(fileName,'wb')
+		header.tofile(self.fileObject)
+
+	def startRecord(self,count):
+
+		# Returns the record to fill, and how many slots to fill in it
+
+		record = self.record[0]
+		record['time'] = timeit.default_timer()
+		record['count'] = min(count,self.numSlots)
+		record['numDropped'] = count - record['count']
+
+		if( record['numDropped'] ):
+
+			if( self.numRecordsTruncated == 0 ):
+				print 'owlReplay: %i of %i in one call do not fit the %i slots of %s.  Replay will not see them' % (record['numDropped'],count,self.numSlots,self.fileName)
+
+			self.numRecordsTruncated += 1
+			self.numDropped += record['numDropped']
+
+		return [record, record['count']]
+
+	def write(self):
+
+		self.record.tofile(self.fileObject)
+		self.numRecords += 1
+
+	def close(self):
+
+		if( self.fileObject ):
+
+			self.fileObject.close()
+			self.fileObject = None
+
+			print 'owlReplay: Wrote %i records to %s' % (self.numRecords,self.fileName)
+
+			if( self.numRecordsTruncated ):
+				print 'owlReplay: %i records of %s were truncated, dropping %i in all' % (self.numRecordsTruncated,self.fileName,self.numDropped)
+
+class owlRecorder():
+
+	def __init__(self,fileName,maxMarkers=DEFAULT_MAX_MARKERS,maxRigids=DEFAULT_MAX_RIGIDS):
+
+		self.fileName = fileName
+
+		self.markerFile = _recordFile(fileName + recordFileSuffixes[MARKER_RECORD],MARKER_RECORD,maxMarkers)
+		self.rigidFile = _recordFile(fileName + recordFileSuffixes[RIGID_RECORD],RIGID_RECORD,maxRigids)
+
+	def writeMarkers(self,markers):
+
+		if( len(markers) == 0 ):
+			return
+
+		record, count = self.markerFile.startRecord(len(markers))
+
+		for slot in range(count):
+
+			marker = markers[slot]
+
+			record['markerID'][slot] = marker.id
+			record['markerCond'][slot] = marker.cond
+			record['markerXYZ'][slot] = [marker.x, marker.y, marker.z]
+
+		self.markerFile.write()
+
+	def writeRigids(self,rigids):
+
+		if( len(rigids) == 0 ):
+			return
+
+		record, count = self.rigidFile.startRecord(len(rigids))
+
+		for slot in range(count):
+
+			rigid = rigids[slot]
+
+			record['rigidID'][slot] = rigid.id
+			record['rigidCond'][slot] = rigid.cond
+			record['rigidPose'][slot] = rigid.pose
+
+		self.rigidFile.write()
+
+	def close(self):
+
+		self.markerFile.close()
+		self.rigidFile.close()
+
+class replayMarker():
+
+	def __init__(self,id,cond,x,y,z):
+		self.id = id
+		self.cond = cond
+		self.x = x
+		self.y = y
+		self.z = z
+
+class replayRigid():
+
+	def __init__(self,id,cond,pose):
+		self.id = id
+		self.cond = cond
+		self.pose = pose
+
+class owlPlayer():
+
+	# Hands out recorded records of each kind, in order, once the replay clock has passed the time they were recorded.
+	# Like the server, each call returns one frame, and an empty list when there is nothing new.
+
+	def __init__(self,fileName,speed=1.0):
+
+		# Indexed by kind.  How far each has been read
+		self.records_kind = openRecording(fileName)
+		self.recordTimes_kind = [ np.array(records['time']) for records in self.records_kind ]
+		self.numRead_kind = [0,0]
+
+		self.speed = speed
+		self.clock = timeit.default_timer
+		self.startClockTime = None
+
+		firstRecordTimes = [ recordTime_rec[0] for recordTime_rec in self.recordTimes_kind if len(recordTime_rec) ]
+
+		if( firstRecordTimes ):
+			self.firstRecordTime = float(min(firstRecordTimes))
+		else:
+			self.firstRecordTime = 0.0
+
+		print 'owlReplay: Replaying %i marker and %i rigid records from %s at %gx' % (len(self.records_kind[MARKER_RECORD]),len(self.records_kind[RIGID_RECORD]),fileName,speed)
+
+		for kind in [MARKER_RECORD,RIGID_RECORD]:
+
+			numDropped = int(self.records_kind[kind]['numDropped'].sum())
+
+			if( numDropped ):
+				print 'owlReplay: %i %s were dropped by the recorder, and will not be replayed' % (numDropped,recordFileSuffixes[kind][1:])
+
+	def setClock(self,clockFunc):
+
+		# clockFunc() returns seconds.  Replay starts from the time of the first call after this
+
+		self.clock = clockFunc
+		self.startClockTime = None
+
+	def getReplayTime(self):
+
+		# The recording time that has been reached
+
+		now = self.clock()
+
+		if( self.startClockTime is None ):
+			self.startClockTime = now
+
+		return self.firstRecordTime + (now - self.startClockTime) * self.speed
+
+	def isFinished(self):
+
+		return all( [ self.numRead_kind[kind] == len(self.records_kind[kind]) for kind in [MARKER_RECORD,RIGID_RECORD] ] )
+
+	def _nextRecord(self,kind):
+
+		numRead = self.numRead_kind[kind]
+
+		if( numRead == len(self.records_kind[kind]) ):
+			return None
+
+		if( self.recordTimes_kind[kind][numRead] > self.getReplayTime() ):
+			return None
+
+		self.numRead_kind[kind] = numRead + 1
+
+		return self.records_kind[kind][numRead]
+
+	def getMarkers(self):
+
+		record = self._nextRecord(MARKER_RECORD)
+
+		if( record is None ):
+			return []
+
+		markerXYZ = record['markerXYZ']
+
+		return [ replayMarker(int(record['markerID'][slot]),float(record['markerCond'][slot]),
+			float(markerXYZ[slot,0]),float(markerXYZ[slot,1]),float(markerXYZ[slot,2])) for slot in range(record['count']) ]
+
+	def getRigids(self):
+
+		record = self._nextRecord(RIGID_RECORD)
+
+		if( record is None ):
+			return []
+
+		return [ replayRigid(int(record['rigidID'][slot]),float(record['rigidCond'][slot]),record['rigidPose'][slot].tolist())
+			for slot in range(record['count']) ]
+
+recordFileName = os.environ.get('OWL_RECORD_FILE')
+replayFileName = os.environ.get('OWL_REPLAY_FILE')
+
+# Set on import, from the environment
+recorder = None
+player = None
+
+def configureRecording(maxMarkers,maxRigids):
+
+	# Sizes the records of OWL_RECORD_FILE to the tracker:  a slot for each of its markers, and each of its rigids.
+	# Call before the first owlGetMarkers / owlGetRigids, after which the recording starts with DEFAULT_MAX_MARKERS / DEFAULT_MAX_RIGIDS.
+	# Does nothing unless recording
+
+	global recorder
+
+	if( not recordFileName ):
+		return
+
+	if( recorder is not None ):
+		print 'owlReplay.configureRecording: %s is already being recorded, and keeps its record size' % recordFileName
+		return
+
+	recorder = owlRecorder(recordFileName,maxMarkers,maxRigids)
+	atexit.register(recorder.close)
+
+def _getRecorder():
+
+	if( recorder is None ):
+		configureRecording(DEFAULT_MAX_MARKERS,DEFAULT_MAX_RIGIDS)
+
+	return recorder
+
+if( replayFileName ):
+
+	##################################################################
+	# Stand-in for the OWL module
+
+	# Nothing is sent to a server, so these only need to be distinct where they are compared.  
+	# OWL_MAX_FREQUENCY is the real one.
+	OWL_NO_ERROR = 0x0
+	OWL_INVALID_VALUE = 0x0020
+	OWL_INVALID_ENUM = 0x0021
+	OWL_INVALID_OPERATION = 0x0022
+
+	OWL_SLAVE = 0x0001
+	OWL_FILE = 0x0002
+	OWL_ASYNC = 0x0008
+	OWL_POSTPROCESS = 0x0010
+	OWL_MODE1 = 0x0100
+	OWL_MODE2 = 0x0200
+	OWL_MODE3 = 0x0300
+	OWL_MODE4 = 0x0400
+
+	OWL_CREATE = 0x0010
+	OWL_DESTROY = 0x0011
+	OWL_ENABLE = 0x0002
+	OWL_DISABLE = 0x0003
+	OWL_SET_LED = 0x0100
+	OWL_SET_POSITION = 0x0101
+	OWL_POINT_TRACKER = 0x0001
+	OWL_RIGID_TRACKER = 0x0002
+
+	OWL_FREQUENCY = 0x0200
+	OWL_STREAMING = 0x0201
+	OWL_INTERPOLATION = 0x0202
+	OWL_MAX_FREQUENCY = 960.0
+
+	def MARKER(tracker,index):
+		return ( ( tracker << 12 ) | index )
+
+	def owlInit(server,flags):
+
+		global player
+
+		if( player is None ):
+			player = owlPlayer(replayFileName,float(os.environ.get('OWL_REPLAY_SPEED',1.0)))
+
+		return 0
+
+	def owlDone():
+		pass
+
+	def owlGetStatus():
+		return 1
+
+	def owlGetError():
+		return OWL_NO_ERROR
+
+	def owlSetFloat(param,value):
+		pass
+
+	def owlSetInteger(param,value):
+		pass
+
+	def owlTracker(tracker,param):
+		pass
+
+	def owlTrackeri(tracker,param,value):
+		pass
+
+	def owlMarkeri(marker,param,value):
+		pass
+
+	def owlMarkerfv(marker,param,values):
+		pass
+
+	def owlGetMarkers():
+
+		if( player is None ):
+			return []
+
+		return player.getMarkers()
+
+	def owlGetRigids():
+
+		if( player is None ):
+			return []
+
+		return player.getRigids()
+
+	def setReplayClock(clockFunc):
+
+		# e.g. owlReplay.setReplayClock(viz.getFrameTime) to replay in step with the frame clock
+
+		owlInit(None,0)
+		player.setClock(clockFunc)
+
+elif( recordFileName ):
+
+	##################################################################
+	# The OWL module, with owlGetMarkers and owlGetRigids recorded
+
+	import OWL
+	from OWL import *
+
+	def owlGetMarkers():
+
+		markers = OWL.owlGetMarkers()
+		_getRecorder().writeMarkers(markers)
+
+		return markers
+
+	def owlGetRigids():
+
+		rigids = OWL.owlGetRigids()
+		_getRecorder().writeRigids(rigids)
+
+		return rigids
+
+	def owlDone():
+
+		if( recorder ):
+			recorder.close()
+
+		OWL.owlDone()
+
+
+if __name__ == "__main__":
+
+	# Summarizes a recording:  python owlReplay.py <file>
+
+	import sys
+
+	records_kind = openRecording(sys.argv[1])
+
+	for kind, label in [[MARKER_RECORD,'marker'],[RIGID_RECORD,'rigid']]:
+
+		records = records_kind[kind]
+		time_rec = np.array(records['time'])
+
+		if( len(time_rec) > 1 ):
+			print '%-7s records: %6i  over %.2f s  (%.1f Hz)' % (label,len(time_rec),time_rec[-1] - time_rec[0],(len(time_rec) - 1) / (time_rec[-1] - time_rec[0]))
+		else:
+			print '%-7s records: %6i' % (label,len(time_rec))
+
+		print '        %i bytes each, %i dropped' % (records.dtype.itemsize,int(records['numDropped'].sum()))
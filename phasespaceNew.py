@@ -2,12 +2,18 @@
 
 import collections
 import logging
-import OWL
+import os
 import random
 import threading
 import time
 import viz
 
+# Record or replay the OWL stream.  See owlReplay.py
+if os.environ.get('OWL_RECORD_FILE') or os.environ.get('OWL_REPLAY_FILE'):
+    import owlReplay as OWL
+else:
+    import OWL
+
 
 ERROR_MAP = {
     OWL.OWL_NO_ERROR: 'No Error',
@@ -460,13 +466,15 @@ class Phasespace(viz.EventClass):
             self._thread = None
 
     def update_thread(self):
+        # owlParamFrequ of 0 means OWL_MAX_FREQUENCY (see sysCfgSpec.ini)
+        period = 1. / (self.owlParamFrequ or OWL.OWL_MAX_FREQUENCY)
         while self._running:
             self.update()
             elapsed = viz.tick() - self._updated
-            wait = 1. / self.owlParamFrequ - elapsed
+            wait = period - elapsed
             while wait < 0:
-                wait += 1. / self.owlParamFrequ
-            #time.sleep(wait)
+                wait += period
+            time.sleep(wait)
 
     def start_timer(self):
         self.callback(viz.TIMER_EVENT, self.update_timer)
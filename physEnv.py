@@ -1,32 +1,233 @@
 ﻿import ode
-import viz
-import vizact
+import math
+import time
+import threading
+import Queue
 
+# physEnv can run without Vizard (see simulateTrials.py).  
+# It is then stepped by calling stepPhysics(), and keeps its own clock.
+try:
+	import viz
+	import vizact
+	_EventClass = viz.EventClass
+except ImportError:
+	viz = None
+	vizact = None
+	
+	class _EventClass:
+		def __init__(self):
+			pass
+
+if( viz ):
+	import frameProfiler
+
+################################################################
+## Collision categories
+# Each physNode belongs to one or more categories, and collides only with the categories in its collide mask.
+# These are mapped onto ODE's geom category and collide bits.
+# ODE tests a pair if either geom's category is in the other's collide mask.
+# To keep two categories apart, leave each out of the other's mask.
+
+CATEGORY_STATIC = 1 # walls, floor and ceiling
+CATEGORY_BALL = 2
+CATEGORY_PADDLE = 4
+CATEGORY_OBJECT = 8 # visObj and anything else that isn't a ball or a paddle
+CATEGORY_MARKER = 16 # mocap marker spheres.  Left out of the default collide masks, so that markers collide with nothing
+CATEGORY_ALL = 0xFFFFFFFF
+
+# Names used in the [visObj] section of the experiment config
+collisionCategoryNames = { 'static' : CATEGORY_STATIC,
+	'ball' : CATEGORY_BALL,
+	'paddle' : CATEGORY_PADDLE,
+	'object' : CATEGORY_OBJECT,
+	'marker' : CATEGORY_MARKER,
+	'all' : CATEGORY_ALL,
+	'none' : 0 }
+
+################################################################
+## Collision events
+
+CONTACT_BEGIN = 'begin'
+CONTACT_END = 'end'
+
+class collisionEvent():
+	
+	# Emitted by physEnv once when two physNodes come into contact (CONTACT_BEGIN),
+	# and once when they separate (CONTACT_END), however many substeps the contact lasts.
+	# time is in the same clock as viz.getFrameTime(), but resolved to the substep.
+	# contactPos_XYZ and contactNormal_XYZ are those of the first contact point (None for CONTACT_END)
+	
+	def __init__(self,eventType,physNode1,physNode2,time,contactPos_XYZ=None,contactNormal_XYZ=None):
+		
+		self.eventType = eventType
+		self.physNode1 = physNode1
+		self.physNode2 = physNode2
+		self.time = time
+		self.contactPos_XYZ = contactPos_XYZ
+		self.contactNormal_XYZ = contactNormal_XYZ
+		
+	def involves(self,thePhysNode):
+		return ( self.physNode1 is thePhysNode or self.physNode2 is thePhysNode )
+	
+	def other(self,thePhysNode):
+		
+		# Returns the physNode that thePhysNode is in contact with
+		
+		if( self.physNode1 is thePhysNode ):
+			return self.physNode2
+		elif( self.physNode2 is thePhysNode ):
+			return self.physNode1
+		else:
+			return None
+
+def _pairKey(physNode1,physNode2):
+	
+	# The same key, whichever order ODE hands the geoms to detectCollisions
+	
+	if( id(physNode1) < id(physNode2) ):
+		return (physNode1,physNode2)
+	else:
+		return (physNode2,physNode1)
+
+# Notices printed by physEnv.__init__ without Vizard, so far in this process
+initNoticesPrinted = set()
+
+def printInitNotice(message):
+	
+	# In Vizard, every time.  Without it, once per process, 
+	# since headless tools such as simulateTrials.py make a physEnv for every trial
+	
+	if( viz or message not in initNoticesPrinted ):
+		print message
+		initNoticesPrinted.add(message)
+
+def categoryBitsFromString(categoryString):
+	
+	# Converts a string such as 'ball|paddle' into category bits.
+	# Ints are returned unchanged
+	
+	if( not isinstance(categoryString,basestring) ):
+		return categoryString
+	
+	categoryBits = 0
+	
+	for categoryName in categoryString.split('|'):
+		
+		categoryName = categoryName.strip()
+		
+		if( collisionCategoryNames.has_key(categoryName) ):
+			categoryBits = categoryBits | collisionCategoryNames[categoryName]
+		else:
+			print 'physEnv.categoryBitsFromString(): Unknown collision category ' + categoryName
+			
+	return categoryBits
+
+def roomPlanes(roomWidth,ceilingHeight,roomLength,translateOnX=0.0,translateOnZ=0.0):
+	
+	# The planes (ABCD) of visEnv.room's ceiling, walls and floor, keyed by their name in visEnv.room
+	
+	wallPos_PosZ = roomLength/2 + translateOnZ
+	wallPos_NegZ = -roomLength/2 + translateOnZ
+	wallPos_PosX = roomWidth/2 + translateOnX
+	wallPos_NegX = -roomWidth/2 + translateOnX
+	
+	return {'ceiling': [0,-1,0,-ceilingHeight],
+		'wall_PosZ': [0,0,-1,-wallPos_PosZ],
+		'wall_NegZ': [0,0,1,wallPos_NegZ],
+		'wall_PosX': [-1,0,0,-wallPos_PosX],
+		'wall_NegX': [1,0,0,wallPos_NegX],
+		'floor': [0,1,0,0]}
 
 # The physical environment
-class physEnv(viz.EventClass):
-	def __init__(self):
+class physEnv(_EventClass):
+	def __init__(self,physCfg=None):
 		
-		viz.EventClass.__init__(self)
+		# physCfg is the [physics] section of the experiment config.
+		# If it is not provided, physEnv uses the defaults below.
 		
-		print 'physEnv.init(): Frame-rate hardcoded at 1/60!'
+		_EventClass.__init__(self)
 		
 		self.frameRate = 1.0/60
 		
 		if( type(self.frameRate) is not float ):
 			print 'physEnv.init(): frame-rate must be a float!'
 			return
-			
+		
+		################################################################
+		## Stepping mode
+		
+		# 'fixed':  every frame, advance the world by self.frameRate in self.numSubsteps substeps
+		# 'realTime':  advance the world in substeps of self.fixedTimeStep to keep up with viz.getFrameElapsed()
+		# 'adaptive':  like 'fixed', but the number of substeps is chosen each frame (see _chooseNumSubsteps)
+		
+		if( physCfg == None ):
+			self.stepMode = 'fixed'
+			self.numSubsteps = 20
+			self.fixedTimeStep = 1.0/240
+			self.maxStepsPerFrame = 16
+			self.interpolateStates = True
+			self.maxAdaptiveSubsteps = 40
+			self.maxTravelPerSubstep = 0.5
+			self.useThread = False
+			self.threadRateHz = 1000.0
+		else:
+			self.stepMode = physCfg['stepMode']
+			self.numSubsteps = physCfg['numSubsteps']
+			self.fixedTimeStep = physCfg['fixedTimeStep']
+			self.maxStepsPerFrame = physCfg['maxStepsPerFrame']
+			self.interpolateStates = physCfg['interpolateStates']
+			self.maxAdaptiveSubsteps = physCfg['maxAdaptiveSubsteps']
+			self.maxTravelPerSubstep = physCfg['maxTravelPerSubstep']
+			self.useThread = physCfg['useThread']
+			self.threadRateHz = physCfg['threadRateHz']
+		
+		if( self.useThread and viz is None ):
+			printInitNotice('physEnv.init(): The physics thread needs Vizard.  Stepping on demand instead.')
+			self.useThread = False
+		
+		if( self.stepMode != 'realTime' and not self.useThread ):
+			printInitNotice('physEnv.init(): Frame-rate hardcoded at 1/60!')
+		
+		# Used by the realTime stepping mode.
+		# Time that has passed, but has not yet been simulated
+		self.timeAccumulator = 0.0
+		
+		# Fraction of a fixedTimeStep between the previous and the current state of the world.
+		# Used to blend between the two when drawing (see physNode.getInterpolatedPosition)
+		self.interpolationAlpha = 1.0
+		
+		# Number of world.step calls on the last frame, 
+		# and the number of frames on which steps were dropped to avoid falling further behind
+		self.stepsLastFrame = 0
+		self.numFramesClamped = 0
+		
+		# The number of world.step calls on every frame so far
+		self.substepCount_fr = []
+		
+		# Radii of all sphere geoms.  The smallest one limits how far anything may move in one substep.
+		# Used by the adaptive stepping mode
+		self.sphereRadius_geom = {}
+		self.minSphereRadius = None
+		
+		# Below this speed (m/s), a dynamic body counts as being at rest
+		self.restSpeed = 0.001
+		
 		# Keep track of physnodes in here
 		self.physNodes_phys = []
 		
+		# Index of geoms and bodies to the physNode that owns them.
+		# Kept up to date by makePhysNode() and physNode.remove(), so that
+		# detectCollisions() can find the physNodes of a contact in constant time
+		self.physNodeByGeom = {}
+		self.physNodeByBody = {}
+		
 		# This will be turned to TRUE when a collision has been detected
 		self.collisionDetected = False
 		
 		# ODE initialization steps
 		self.world = ode.World()
 		
-		print 'physEnv.init(): FIX:  Grav hardcoded at 9.8. Should accept gravity as a parameter, or include a function to change gravity'
+		printInitNotice('physEnv.init(): FIX:  Grav hardcoded at 9.8. Should accept gravity as a parameter, or include a function to change gravity')
 		self.world.setGravity( [0,-9.8,0] )
 		
 		#self.world.setCFM(0.00001)
@@ -43,8 +244,25 @@ class physEnv(viz.EventClass):
 		# Collision space where geoms live and collisions are simulated
 		# 0 for a 'simple' space (faster and less accurate), 1 for a hash space
 		self.space = ode.Space(1) 
+		
+		# Planes never move, and never need to be tested against each other.
+		# They live in their own space, which is only ever tested against self.space
+		self.staticSpace = ode.Space(0)
+		
 		self.minBounceVel = .2 # min vel to cause a bounce
 		
+		# Contact joints are made for at most this many contacts between two geoms, per step
+		if( physCfg == None ):
+			self.maxContactsPerPair = 4
+		else:
+			self.maxContactsPerPair = physCfg['maxContactsPerPair']
+		
+		# [bounce, bounceVel, mu] for each pair of physNodes that has been in contact.  See getContactParams()
+		self.contactParams_pair = {}
+		
+		# The minBounceVel that contactParams_pair was made with
+		self.contactParamsBounceVel = self.minBounceVel
+		
 		####  A better description: 
 		##Spaces are containers for geom objects that are the actual objects tested for collision. 
 		##For the collision detection a Space is the same as the World for the dynamics simulation, and a geom object corresponds to a body object. 
@@ -59,23 +277,154 @@ class physEnv(viz.EventClass):
 		# A list of non-collision joints, such as fixed joints, etc
 		self.joints_jIdx = []
 		
+		# Contact events.  See collisionEvent and subscribeToCollisions()
+		# The first contact of each pair of physNodes touching during the current substep, and the last substep
+		self.contactsThisStep_pair = {}
+		self.contactsLastStep_pair = {}
+		
+		# Events emitted since the start of the current frame
+		self.collisionEvents_idx = []
+		
+		# Callbacks, keyed by a pair of physNodes.  One of the pair may be None, to match any physNode.
+		self.collisionSubscribers_pair = {}
+		
+		################################################################
+		## Physics thread
+		# If useThread is set, the world is stepped on its own thread at threadRateHz, instead of in stepPhysics().
+		# While the thread runs, ODE is only touched from that thread:
+		# - changes to physNodes (setPosition, setLinearVel, etc.) are queued, and applied between two steps
+		# - the render thread reads positions and quaternions from a snapshot (see getSnapshotPose)
+		# - collision events are handed over to the render thread once per frame (see _syncWithPhysicsThread)
+		
+		self.physicsThread = None
+		self.threadRunning = False
+		
+		# (function, args) to be called on the physics thread between two steps
+		self.commandQueue = Queue.Queue()
+		
+		# Held by the physics thread while it steps the world.  
+		# makePhysNode() and physNode.remove() take it too, so that geoms and bodies are never added or removed mid-step
+		self.worldLock = threading.RLock()
+		
+		# Double buffer of {physNode: [pos_XYZ, quat_XYZW]}.  
+		# The physics thread fills a new back buffer after each step, and publishes it by swapping the reference.
+		# The render thread latches the published buffer once per frame, so every visObj is drawn from the same step.
+		self.snapshot_phys = {}
+		self.frameSnapshot_phys = {}
+		
+		# Collision events emitted by the physics thread since the last frame.  Guarded by eventLock
+		self.threadEvents_idx = []
+		self.eventLock = threading.Lock()
+		
+		# Number of steps taken by the physics thread, 
+		# and the number of times it fell so far behind that it skipped ahead
+		self.threadStepCount = 0
+		self.threadStepCountLastFrame = 0
+		self.numThreadOverruns = 0
+		
 		############################################################################################
 		############################################################################################
 		## Contact/collision functions
 		
-		vizact.onupdate( viz.PRIORITY_PHYSICS, self.stepPhysics)
+		# Without Vizard, the frame clock is kept here, and advanced by self.frameRate in stepPhysics()
+		self.headlessFrameTime = 0.0
+		
+		if( viz is None ):
+			pass
+		elif( self.useThread ):
+			frameProfiler.onupdate( 'physics', viz.PRIORITY_PHYSICS, self._syncWithPhysicsThread)
+			vizact.onexit( self.stopPhysicsThread )
+			self.startPhysicsThread()
+		else:
+			frameProfiler.onupdate( 'physics', viz.PRIORITY_PHYSICS, self.stepPhysics)
 		#vizact.onupdate( viz.PRIOR, self.emptyContactGroups)
 		
-	def makePhysNode(self,type,pos=[0,0,0],size=[]):
+	def makePhysNode(self,type,pos=[0,0,0],size=[],category=None,collideWith=None):
+		
+		# category and collideWith accept category bits, or strings such as 'ball|paddle'
+		# By default, planes are CATEGORY_STATIC and collide with everything that isn't static or a marker.
+		# Everything else is CATEGORY_OBJECT and collides with everything but markers.
 		
-		newPhysNode = physNode(self.world,self.space,type,pos,size)
+		# Wait for the physics thread to finish its step before adding to the world
+		self.worldLock.acquire()
+		
+		try:
+			newPhysNode = self._makePhysNode(type,pos,size,category,collideWith)
+		finally:
+			self.worldLock.release()
+			
+		return newPhysNode
+		
+	def _makePhysNode(self,type,pos,size,category,collideWith):
+		
+		if( type == 'plane' ):
+			newPhysNode = physNode(self.world,self.staticSpace,type,pos,size)
+			defaultCategory = CATEGORY_STATIC
+			defaultCollideWith = CATEGORY_ALL & ~(CATEGORY_STATIC | CATEGORY_MARKER)
+		else:
+			newPhysNode = physNode(self.world,self.space,type,pos,size)
+			defaultCategory = CATEGORY_OBJECT
+			defaultCollideWith = CATEGORY_ALL & ~CATEGORY_MARKER
+		
+		if( category is None ):
+			category = defaultCategory
+			
+		if( collideWith is None ):
+			collideWith = defaultCollideWith
+		
+		if( newPhysNode.geom ):
+			newPhysNode.setCollisionCategory(category)
+			newPhysNode.setCollideWith(collideWith)
+		
+		# Store the physnode in the list of physnodes and in the geom/body index
 		self.physNodes_phys.append(newPhysNode)
+		self._indexPhysNode(newPhysNode)
 		
-		#print 'Tried to make type ' + type + '.  Made type ' + str(type(newPhysNode)
-		# Store the physnode in the list of physnodes
-		#print 'physEnv.makePhysNode:  What happens to the list of physnodes when a physnode is erased?  Does the list update itself?'
+		# The physNode needs to know its physEnv so that physNode.remove() can unindex it
+		newPhysNode.parentPhysEnv = self
 		
 		return newPhysNode 
+	
+	def _indexPhysNode(self,thePhysNode):
+		
+		if( thePhysNode.geom ):
+			self.physNodeByGeom[thePhysNode.geom] = thePhysNode
+			
+			if( type(thePhysNode.geom) == ode.GeomSphere ):
+				self.sphereRadius_geom[thePhysNode.geom] = thePhysNode.geom.getRadius()
+				self.minSphereRadius = min(self.sphereRadius_geom.values())
+			
+		if( thePhysNode.body ):
+			self.physNodeByBody[thePhysNode.body] = thePhysNode
+	
+	def _unindexPhysNode(self,thePhysNode):
+		
+		# Called by physNode.remove(), before the physNode drops its geom and body
+		
+		if( thePhysNode.geom ):
+			self.physNodeByGeom.pop(thePhysNode.geom,None)
+			
+			if( self.sphereRadius_geom.pop(thePhysNode.geom,None) is not None ):
+				if( len(self.sphereRadius_geom) ):
+					self.minSphereRadius = min(self.sphereRadius_geom.values())
+				else:
+					self.minSphereRadius = None
+			
+		if( thePhysNode.body ):
+			self.physNodeByBody.pop(thePhysNode.body,None)
+		
+		if( thePhysNode in self.physNodes_phys ):
+			self.physNodes_phys.remove(thePhysNode)
+		
+		# Forget its contacts, so that no events are emitted for it after removal
+		for pairKey in self.contactsLastStep_pair.keys():
+			if( thePhysNode in pairKey ):
+				del self.contactsLastStep_pair[pairKey]
+		
+		# and its contact parameters, which would otherwise keep it referenced
+		for pairKey in self.contactParams_pair.keys():
+			if( thePhysNode in pairKey ):
+				del self.contactParams_pair[pairKey]
 
 	def stepPhysics(self):
 		
@@ -85,63 +434,396 @@ class physEnv(viz.EventClass):
 		
 		self.emptyCollisionBuffer()
 		
-		numCycles = 20
+		if( viz is None ):
+			self.headlessFrameTime += self.frameRate
+		
+		if( self.stepMode == 'realTime' ):
+			self._stepRealTime()
+		elif( self.stepMode == 'adaptive' ):
+			self._stepAdaptive()
+		else:
+			self._stepFixed()
 		
-		timeStep = (1.0/60) / numCycles
+		self.substepCount_fr.append(self.stepsLastFrame)
 		
-		for idx in range(numCycles):
-			self.space.collide(self,self.detectCollisions)
-			self.world.step( timeStep  )
+		self._dispatchCollisionEvents()
 		
 		 # New collisions are now stored in self.contactJoints_idx
 		 # They can be accessed using physEnv.getCollisions()
+	
+	def _stepFixed(self):
 		
-	def returnPointerToPhysNode(self,geomOrBody):
+		numCycles = self.numSubsteps
 		
-		# Accept a body or geom and return pointer to the phys node
+		timeStep = self.frameRate / numCycles
+		
+		# The world state when this frame's first collision test happens 
+		startTime = self.getFrameTime() - self.frameRate
+		
+		for idx in range(numCycles):
+			self._collideAndStep( timeStep, startTime + idx * timeStep )
+		
+		self.stepsLastFrame = numCycles
+	
+	def getFrameTime(self):
+		
+		# viz.getFrameTime(), or the time simulated so far when running without Vizard
+		
+		if( viz is None ):
+			return self.headlessFrameTime
+			
+		return viz.getFrameTime()
+	
+	def _collideAndStep(self,timeStep,contactTime):
+		
+		# One substep.  contactTime is the time of the world state that is tested for collisions
+		
+		self._collide()
+		self.world.step( timeStep )
+		self._updateCollisionEvents(contactTime)
+		
+	def _updateCollisionEvents(self,contactTime):
+		
+		# Compare the pairs in contact on this substep with those on the last substep
+		
+		for pairKey, contactObject in self.contactsThisStep_pair.iteritems():
+			if( not self.contactsLastStep_pair.has_key(pairKey) ):
+				
+				contactPos_XYZ, contactNormal_XYZ, depth, geom1, geom2 = contactObject.getContactGeomParams()
+				self._emitCollisionEvent( collisionEvent(CONTACT_BEGIN,pairKey[0],pairKey[1],contactTime,contactPos_XYZ,contactNormal_XYZ) )
+		
+		for pairKey in self.contactsLastStep_pair.iterkeys():
+			if( not self.contactsThisStep_pair.has_key(pairKey) ):
+				self._emitCollisionEvent( collisionEvent(CONTACT_END,pairKey[0],pairKey[1],contactTime) )
+		
+		self.contactsLastStep_pair = self.contactsThisStep_pair
+		self.contactsThisStep_pair = {}
+		
+	def _emitCollisionEvent(self,event):
+		
+		if( self.threadRunning ):
+			# On the physics thread.  Handed to the render thread by _syncWithPhysicsThread()
+			self.eventLock.acquire()
+			self.threadEvents_idx.append(event)
+			self.eventLock.release()
+		else:
+			self.collisionEvents_idx.append(event)
+		
+	def _dispatchCollisionEvents(self):
+		
+		if( len(self.collisionSubscribers_pair) == 0 ):
+			return
+		
+		for event in self.collisionEvents_idx:
+			
+			pairKeys_idx = [ _pairKey(event.physNode1,event.physNode2), (event.physNode1,None), (event.physNode2,None) ]
+			
+			for pairKey in pairKeys_idx:
+				for callbackFunc in self.collisionSubscribers_pair.get(pairKey,[]):
+					callbackFunc(event)
+	
+	def subscribeToCollisions(self,physNode1,physNode2,callbackFunc):
+		
+		# callbackFunc(event) is called with a collisionEvent when the two physNodes begin or end contact.
+		# Pass None as physNode2 to hear about physNode1's contacts with anything.
+		# Callbacks run at the end of stepPhysics()
+		
+		if( physNode2 is None ):
+			pairKey = (physNode1,None)
+		else:
+			pairKey = _pairKey(physNode1,physNode2)
+			
+		self.collisionSubscribers_pair.setdefault(pairKey,[]).append(callbackFunc)
+		
+	def unsubscribeFromCollisions(self,physNode1,physNode2,callbackFunc):
+		
+		if( physNode2 is None ):
+			pairKey = (physNode1,None)
+		else:
+			pairKey = _pairKey(physNode1,physNode2)
 		
-		if( geomOrBody == ode.Body):
-			print '*1'
+		callbacks_idx = self.collisionSubscribers_pair.get(pairKey,[])
 		
-		if( type(geomOrBody) == ode.Body):
-			print '*2'
+		if( callbackFunc in callbacks_idx ):
+			callbacks_idx.remove(callbackFunc)
 			
-		if( type(geomOrBody) == ode.GeomObject or
-			type(geomOrBody) == ode.GeomBox or
-			type(geomOrBody) == ode.GeomCapsule or
-			type(geomOrBody) == ode.GeomCCylinder or
-			type(geomOrBody) == ode.GeomCylinder or
-			type(geomOrBody) == ode.GeomPlane or
-			type(geomOrBody) == ode.GeomRay or
-			type(geomOrBody) == ode.GeomSphere or
-			type(geomOrBody) == ode.GeomTriMesh ):
+		if( len(callbacks_idx) == 0 ):
+			self.collisionSubscribers_pair.pop(pairKey,None)
 			
-			'Searching geom'
+	def getCollisionEvents(self):
+		
+		# Returns the collisionEvents emitted during this frame's stepPhysics()
+		return self.collisionEvents_idx
+	
+	def _collide(self):
+		
+		# Moving geoms against each other, then against the static geoms.  
+		# Static geoms are never tested against each other.
+		# Pairs excluded by category/collide bits are rejected by ODE, and never reach detectCollisions
+		
+		self.space.collide(self,self.detectCollisions)
+		ode.collide2(self.space,self.staticSpace,self,self.detectCollisions)
+		
+	def _stepAdaptive(self):
+		
+		numCycles = self._chooseNumSubsteps()
+		
+		if( numCycles > 0 ):
+			
+			timeStep = self.frameRate / numCycles
+			startTime = self.getFrameTime() - self.frameRate
 			
-			for idx in range(len(self.physNodes_phys)):
-				if( self.physNodes_phys[idx].geom == geomOrBody ):
-					return self.physNodes_phys[idx]
-			print 'physEnv.returnPointerToPhysNode(): Geom not found in physNodes_phys'
+			for idx in range(numCycles):
+				self._collideAndStep( timeStep, startTime + idx * timeStep )
+		
+		self.stepsLastFrame = numCycles
+	
+	def _chooseNumSubsteps(self):
+		
+		# Choose enough substeps that the fastest dynamic body moves no more than 
+		# maxTravelPerSubstep * (radius of the smallest sphere) per substep.  
+		# This prevents a small, fast ball from tunnelling through the paddle or a wall.
+		# Returns 0 if there are no dynamic bodies, and 1 if all dynamic bodies are at rest.
+		
+		maxSpeedSq = -1.0
+		
+		for thePhysNode in self.physNodeByBody.itervalues():
+			
+			theBody = thePhysNode.body
+			
+			if( theBody.isKinematic() ):
+				continue
 				
-		elif( type(geomOrBody) == ode.Body ):
-			'Searching body'
-			for idx in range(len(self.physNodes_phys)):
-				if( self.physNodes_phys[idx].body == geomOrBody ):
-					return self.physNodes_phys[idx]
-			print 'physEnv.returnPointerToPhysNode(): Body not found in physNodes_phys'
+			vel_XYZ = theBody.getLinearVel()
+			speedSq = vel_XYZ[0]*vel_XYZ[0] + vel_XYZ[1]*vel_XYZ[1] + vel_XYZ[2]*vel_XYZ[2]
+			
+			if( speedSq > maxSpeedSq ):
+				maxSpeedSq = speedSq
+		
+		if( maxSpeedSq < 0 ):
+			# Nothing to simulate
+			return 0
+		
+		maxSpeed = maxSpeedSq ** 0.5
+		
+		if( maxSpeed < self.restSpeed or self.minSphereRadius is None ):
+			return 1
+		
+		maxTravel = self.maxTravelPerSubstep * self.minSphereRadius
+		numCycles = int( math.ceil( maxSpeed * self.frameRate / maxTravel ) )
 		
+		return max( 1, min( numCycles, self.maxAdaptiveSubsteps ) )
+	
+	def getSubstepSummary(self):
+		
+		# Returns [number of frames, mean substeps per frame, max substeps per frame]
+		
+		numFrames = len(self.substepCount_fr)
+		
+		if( numFrames == 0 ):
+			return [0,0,0]
+		
+		return [ numFrames, float(sum(self.substepCount_fr)) / numFrames, max(self.substepCount_fr) ]
+	
+	def printSubstepSummary(self):
+		
+		numFrames, meanSubsteps, maxSubsteps = self.getSubstepSummary()
+		print 'physEnv: %i frames, %.2f substeps per frame on average (max %i)' % (numFrames,meanSubsteps,maxSubsteps)
+		
+	def _stepRealTime(self):
+		
+		# Step the world in substeps of fixedTimeStep, until it has caught up with the frame time.
+		# Time left over is carried on to the next frame
+		
+		if( viz is None ):
+			self.timeAccumulator += self.frameRate
 		else:
-			print 'physEnv.returnPointerToPhysNode(): Function accepts only geoms or body types.  You provided a ' + str(type(geomOrBody))
+			self.timeAccumulator += viz.getFrameElapsed()
+		
+		numSteps = int( self.timeAccumulator / self.fixedTimeStep )
+		
+		if( numSteps > self.maxStepsPerFrame ):
+			
+			# After a stall, don't try to catch up all at once.
+			# That would make this frame take even longer, and the next frame longer still.
+			# Simulated time falls behind instead.
+			
+			numSteps = self.maxStepsPerFrame
+			self.timeAccumulator = numSteps * self.fixedTimeStep
+			self.numFramesClamped += 1
+		
+		self.timeAccumulator -= numSteps * self.fixedTimeStep
+		
+		# The time left in the accumulator has not yet been simulated
+		startTime = self.getFrameTime() - self.timeAccumulator - numSteps * self.fixedTimeStep
+		
+		for idx in range(numSteps):
+			
+			# Keep the state before the last step, for interpolation
+			if( idx == numSteps-1 and self.interpolateStates ):
+				self._storePreviousStates()
+			
+			self._collideAndStep( self.fixedTimeStep, startTime + idx * self.fixedTimeStep )
+			
+		self.interpolationAlpha = self.timeAccumulator / self.fixedTimeStep
+		self.stepsLastFrame = numSteps
+		
+	def _storePreviousStates(self):
+		
+		for thePhysNode in self.physNodeByBody.itervalues():
+			thePhysNode.storePreviousState()
+		
+	def getInterpolationAlpha(self):
+		
+		# Returns 1 unless interpolation between states is in use
+		
+		if( self.stepMode == 'realTime' and self.interpolateStates and not self.useThread ):
+			return self.interpolationAlpha
+		else:
+			return 1.0
+			
+	def returnPointerToPhysNode(self,geomOrBody):
+		
+		# Accept a body or geom and return pointer to the phys node
+		# Returns None if the geom or body does not belong to a physNode
+		
+		thePhysNode = self.physNodeByGeom.get(geomOrBody)
+		
+		if( thePhysNode is None ):
+			thePhysNode = self.physNodeByBody.get(geomOrBody)
+		
+		return thePhysNode
 	
 	def emptyCollisionBuffer(self):
 		# This functino is explicit to make it clear 
 		# that there is a buffer that should be emptied on each iteration
 		
+		self._emptyContactJoints()
+		self.collisionEvents_idx = []
+		
+	def _emptyContactJoints(self):
+		
 		self.jointGroup.empty()
 		self.collisionList_idx_physNodes = []
 		self.contactJoints_idx = []
 		self.contactObjects_idx = []
 		self.collisionDetected = False
+	
+	################################################################
+	## Physics thread
+	
+	def startPhysicsThread(self):
+		
+		if( self.threadRunning ):
+			return
+		
+		self.threadRunning = True
+		self.physicsThread = threading.Thread(target=self._physicsThreadLoop)
+		self.physicsThread.daemon = True
+		self.physicsThread.start()
+		
+	def stopPhysicsThread(self):
+		
+		# Blocks until the current step has finished.  Queued commands are applied before returning
+		
+		if( not self.threadRunning ):
+			return
+		
+		self.threadRunning = False
+		self.physicsThread.join()
+		self.physicsThread = None
+		
+		self._applyQueuedCommands()
+		
+	def isPhysicsThread(self):
+		return threading.currentThread() is self.physicsThread
+		
+	def queueCommand(self,func,args):
+		
+		# func(*args) is called on the physics thread, before its next step
+		self.commandQueue.put( (func,args) )
+		
+	def _applyQueuedCommands(self):
+		
+		while( True ):
+			try:
+				func, args = self.commandQueue.get_nowait()
+			except Queue.Empty:
+				return
+				
+			func(*args)
+		
+	def _physicsThreadLoop(self):
+		
+		timeStep = 1.0 / self.threadRateHz
+		
+		# The time of the world state that the next step starts from
+		nextStepTime = viz.tick()
+		
+		while( self.threadRunning ):
+			
+			self.worldLock.acquire()
+			
+			try:
+				self._applyQueuedCommands()
+				self._emptyContactJoints()
+				self._collideAndStep( timeStep, nextStepTime )
+				self._publishSnapshot()
+			finally:
+				self.worldLock.release()
+			
+			self.threadStepCount += 1
+			nextStepTime += timeStep
+			
+			sleepTime = nextStepTime - viz.tick()
+			
+			if( sleepTime > 0 ):
+				time.sleep(sleepTime)
+			elif( sleepTime < -self.frameRate ):
+				# More than a frame behind.  Don't try to catch up; simulated time falls behind instead
+				nextStepTime = viz.tick()
+				self.numThreadOverruns += 1
+				
+	def _publishSnapshot(self):
+		
+		# Fill the back buffer, then swap it in.  
+		# The old front buffer is left to whoever still holds it, and never written to again.
+		
+		backBuffer_phys = {}
+		
+		for thePhysNode in self.physNodeByBody.itervalues():
+			
+			odeFormQuat = thePhysNode.body.getQuaternion()
+			backBuffer_phys[thePhysNode] = [ thePhysNode.body.getPosition(), 
+				[ odeFormQuat[1], odeFormQuat[2], odeFormQuat[3], odeFormQuat[0] ] ]
+			
+		self.snapshot_phys = backBuffer_phys
+		
+	def _syncWithPhysicsThread(self):
+		
+		# Takes the place of stepPhysics() on the render thread when useThread is set
+		
+		self.frameSnapshot_phys = self.snapshot_phys
+		
+		self.eventLock.acquire()
+		self.collisionEvents_idx = self.threadEvents_idx
+		self.threadEvents_idx = []
+		self.eventLock.release()
+		
+		stepCount = self.threadStepCount
+		self.stepsLastFrame = stepCount - self.threadStepCountLastFrame
+		self.threadStepCountLastFrame = stepCount
+		
+		self.substepCount_fr.append(self.stepsLastFrame)
+		
+		self._dispatchCollisionEvents()
+		
+	def getSnapshotPose(self,thePhysNode):
+		
+		# Returns [pos_XYZ, quat_XYZW] of a physNode's body, as of the physics step latched at the start of this frame.
+		# Returns None if the physNode has no body, or has not yet been stepped
+		
+		return self.frameSnapshot_phys.get(thePhysNode)
 		
 	def getCollisions(self):
 		
@@ -156,82 +838,108 @@ class physEnv(viz.EventClass):
 		 #  This callback is called whenever two objects may potentially collide. 
 		 # The callback function then has to do a proper collision test and has to create contact joints whenever a collision has occured. 
 		
-		# Check if the objects do collide
+		# Check if the objects do collide.  
+		# Contacts are generated once per pair, and then used for everything below.
 		contactObjectList_idx = ode.collide(geom1, geom2)
 		
-		# Create contact joints
-		for contactObject in contactObjectList_idx:
+		if( len(contactObjectList_idx) == 0 ):
+			return
+		
+		# physNode objects have extra parameters attached to them, like bouncincess and friction
+		physNode1 = self.physNodeByGeom.get(geom1)
+		physNode2 = self.physNodeByGeom.get(geom2)
+		
+		if( physNode1 is None or physNode2 is None ):
+			return
+		
+		body1 = geom1.getBody()
+		body2 = geom2.getBody()
+		
+		#####################################################################
+		## Bounce!  Calculate dynamics of bounce 
+		
+		self.collisionDetected = True
+		self.collisionList_idx_physNodes.append([physNode1,physNode2])
+		
+		pairKey = _pairKey(physNode1,physNode2)
+		
+		if( not self.contactsThisStep_pair.has_key(pairKey) ):
+			self.contactsThisStep_pair[pairKey] = contactObjectList_idx[0]
+		
+		#####################################################################
+		#####################################################################
+		#  Should it stick?
+		# <physNode> stickTo_gIdx is a list of pointers to geoms
+		# that the node should stick to via fixed joint
+		
+#		## exit without doing anything if the two bodies are connected by a joint
+#		# because this includes type contact joint, thsi prevents multiple contacts/collisions
+#		if( body1 and body2 and ode.areConnected(body1, body2)):
+#			print 'already connected'
+#			return;
+
+		if( geom2 in physNode1.stickTo_gIdx ):
+			
+			physNode1.disableCollisions()
+			physNode1.disableMovement()
+		
+			# Ball always seems to be be the first geom
+			physNode1.collisionPosLocal_XYZ = body2.getPosRelPoint(body1.getPosition())
+		
+		# This determines the dynamics of this particular collision / contact
+		bounce, bounceVel, mu = self.getContactParams(physNode1,physNode2)
+		
+		# Create contact joints, for at most maxContactsPerPair contacts
+		for contactObject in contactObjectList_idx[:self.maxContactsPerPair]:
 			
-			body1 = geom1.getBody()
-			body2 = geom2.getBody()
+			contactObject.setBounce(bounce) # Coefficient of restitution
 			
-			# physNode objects have extra parameters attached to them, like bouncincess and friction
-			physNode1 = self.returnPointerToPhysNode(geom1)
-			physNode2 = self.returnPointerToPhysNode(geom2)
+			# setBounceVel DOES NOT INFLUENCE BOUNCINESS.  it is the min vel needed for bounce to occur
+			contactObject.setBounceVel(bounceVel)
 			
-			#  Note that, for some reason, the ball is always geom  1
-			if (physNode1 is None) is False and (physNode2 is None) is False:
-				
-				#####################################################################
-				## Funct(geom): Return physnode that geom corresponds to
-				## Bounce!  Calculate dynamics of bounce 
-				
-				self.collisionDetected = True
-
-				#####################################################################
-				
-				self.collisionList_idx_physNodes.append([physNode1,physNode2])
-				contactInfo = ode.collide(geom1,geom2)
-
-				#####################################################################
-				#####################################################################
-				#  Should it stick?
-				# <physNode> stickTo_gIdx is a list of pointers to geoms
-				# that the node should stick to via fixed joint
-				
-#				## exit without doing anything if the two bodies are connected by a joint
-#				# because this includes type contact joint, thsi prevents multiple contacts/collisions
-#				if( body1 and body2 and ode.areConnected(body1, body2)):
-#					print 'already connected'
-#					return;
-
-
-				for gIdx in range(len(physNode1.stickTo_gIdx)):
-					if( physNode1.stickTo_gIdx[gIdx] == geom2 ):
-						
-						physNode1.disableCollisions()
-						physNode1.disableMovement()
-					
-						# Ball always seems to be be the first geom
-						physNode1.collisionPosLocal_XYZ = body2.getPosRelPoint(body1.getPosition())
-				else:
-					
-					# This determines the dynamics of this particular collision / contact
-					contactObject.setBounce(physNode1.bounciness * physNode2.bounciness ) # Coefficient of restitution
-					
-					#print str(viz.getFrameNumber()) + ': bounciness (1,2,Both): ' + str(physNode1.bounciness) + ' ' + str(physNode2.bounciness) + ' ' + str(physNode1.bounciness * physNode2.bounciness )
-					
-					# setBounceVel DOES NOT INFLUENCE BOUNCINESS.  it is the min vel needed for bounce to occur
-					contactObject.setBounceVel(self.minBounceVel)
-					
-					contactObject.setMu(physNode1.friction * physNode2.friction ) # Friction
-					
-					# store for later
-					self.contactObjects_idx.append(contactObject)
-					
-					#  Add joint to the contact group
-					contactJoint = ode.ContactJoint(thePhysEnv.world, self.jointGroup, contactObject)
-					
-					# Create contact joint
-					contactJoint.attach(body1, body2)
-					self.contactJoints_idx.append(contactJoint)
-					
+			contactObject.setMu(mu) # Friction
+			
+			# store for later
+			self.contactObjects_idx.append(contactObject)
+			
+			#  Add joint to the contact group
+			contactJoint = ode.ContactJoint(thePhysEnv.world, self.jointGroup, contactObject)
+			
+			# Create contact joint
+			contactJoint.attach(body1, body2)
+			self.contactJoints_idx.append(contactJoint)
 				
 		#####################################################		
 		# Note that empyContactGroups is called automatically on each iteration 
 		# This is necessary.
 		### in physEnv.init(): vizact.onupdate( viz.PRIORITY_LAST_UPDATE, self.emptyContactGroups)
 		#####################################################
+	
+	def getContactParams(self,physNode1,physNode2):
+		
+		# Returns [bounce, bounceVel, mu] for contacts between two physNodes.
+		# These are computed once per pair, and reused until a physNode's bounciness or friction, or minBounceVel, changes.
+		
+		if( self.minBounceVel != self.contactParamsBounceVel ):
+			self.forgetContactParams()
+		
+		contactParams = self.contactParams_pair.get((physNode1,physNode2))
+		
+		if( contactParams is None ):
+			
+			contactParams = [ physNode1.bounciness * physNode2.bounciness, 
+				self.minBounceVel,
+				physNode1.friction * physNode2.friction ]
+				
+			self.contactParams_pair[(physNode1,physNode2)] = contactParams
+			
+		return contactParams
+		
+	def forgetContactParams(self):
+		
+		# Called by physNode when its bounciness or friction changes, and by getContactParams when minBounceVel has
+		self.contactParams_pair.clear()
+		self.contactParamsBounceVel = self.minBounceVel
 
 class physNode():
 
@@ -243,6 +951,9 @@ class physNode():
 		self.parentWorld = []
 		self.parentSpace = []
 		
+		# Set by physEnv.makePhysNode()
+		self.parentPhysEnv = None
+		
 		self.bounciness = bounciness;
 		self.friction = friction;
 		
@@ -250,6 +961,11 @@ class physNode():
 		self.stickTo_gIdx = []
 		self.collisionPosLocal_XYZ = []
 		
+		# State of the body before the most recent step of the world
+		# Set by storePreviousState(), and used for interpolation
+		self.prevPos_XYZ = None
+		self.prevQuat_WXYZ = None
+		
 		if shape == 'plane':
 			
 			# print 'phsEnv.createGeom(): type=plane expects pos=ABCD,and NO size. SIze is auto infinite.'
@@ -330,14 +1046,26 @@ class physNode():
 			# When I wrote this note, it was in-line with Y (direction=2)
 			# The geom, however, can only be made in-line with the Z axis
 			# This creates an offset to bring the two in-line
-			vizOffsetTrans = viz.Transform()
-			
-			if( shape[-2:] == '_X'):
-				vizOffsetTrans.setAxisAngle(1,0,0,90)
-			elif(shape[-2:] == '_Y'):
-				vizOffsetTrans.setAxisAngle(0,0,1,90)
-			
-			vizOffsetQuat = vizOffsetTrans.getQuat()
+			if( viz is None ):
+				
+				# Same rotations, without viz.Transform.  [x,y,z,w]
+				halfAngle = math.radians(90) / 2
+				
+				if( shape[-2:] == '_X'):
+					vizOffsetQuat = [math.sin(halfAngle),0,0,math.cos(halfAngle)]
+				elif(shape[-2:] == '_Y'):
+					vizOffsetQuat = [0,0,math.sin(halfAngle),math.cos(halfAngle)]
+				else:
+					vizOffsetQuat = [0,0,0,1]
+			else:
+				vizOffsetTrans = viz.Transform()
+				
+				if( shape[-2:] == '_X'):
+					vizOffsetTrans.setAxisAngle(1,0,0,90)
+				elif(shape[-2:] == '_Y'):
+					vizOffsetTrans.setAxisAngle(0,0,1,90)
+				
+				vizOffsetQuat = vizOffsetTrans.getQuat()
 			
 			odeRotMat = self.vizQuatToRotationMat(vizOffsetQuat)
 			
@@ -410,6 +1138,22 @@ class physNode():
 		
 		#self.parentRoom.physEnv.removeGeom(self.physGeom)
 		
+		# Remove from the physEnv's geom/body index
+		if( self.parentPhysEnv ):
+			
+			# Wait for the physics thread to finish its step
+			self.parentPhysEnv.worldLock.acquire()
+			
+			try:
+				self.parentPhysEnv._unindexPhysNode(self)
+				self._remove()
+			finally:
+				self.parentPhysEnv.worldLock.release()
+		else:
+			self._remove()
+			
+	def _remove(self):
+		
 		self.geom.setBody(None)
 		self.parentSpace.remove(self.geom)
 		
@@ -422,6 +1166,23 @@ class physNode():
 		
 	def removeBody(self):
 		
+		if( self.parentPhysEnv ):
+			
+			# Wait for the physics thread to finish its step.  It iterates physNodeByBody
+			self.parentPhysEnv.worldLock.acquire()
+			
+			try:
+				self._removeBody()
+			finally:
+				self.parentPhysEnv.worldLock.release()
+		else:
+			self._removeBody()
+		
+	def _removeBody(self):
+		
+		if( self.parentPhysEnv and self.body ):
+			self.parentPhysEnv.physNodeByBody.pop(self.body,None)
+		
 		del self.body
 		self.body = 0
 		
@@ -443,6 +1204,66 @@ class physNode():
 		
 		return vizFormQuat 
 		
+	def storePreviousState(self):
+		
+		if( self.body ):
+			self.prevPos_XYZ = self.body.getPosition()
+			self.prevQuat_WXYZ = self.body.getQuaternion()
+		
+	def getInterpolatedPosition(self,alpha):
+		
+		# Blends between the position before and after the most recent step of the world.
+		# alpha = 0 is the previous position, alpha = 1 the current position
+		
+		if( self.body ):
+			currentPos_XYZ = self.body.getPosition()
+		else:
+			return self.geom.getPosition()
+		
+		if( self.prevPos_XYZ is None or alpha >= 1.0 ):
+			return currentPos_XYZ
+		
+		prev = self.prevPos_XYZ
+		
+		return [ prev[0] + alpha * (currentPos_XYZ[0] - prev[0]),
+			prev[1] + alpha * (currentPos_XYZ[1] - prev[1]),
+			prev[2] + alpha * (currentPos_XYZ[2] - prev[2]) ]
+		
+	def getInterpolatedQuaternion(self,alpha):
+		
+		# Normalized lerp between the quaternion before and after the most recent step of the world.
+		# Returned in vizard's XYZW format (see getQuaternion)
+		
+		if( not self.body or self.prevQuat_WXYZ is None or alpha >= 1.0 ):
+			return self.getQuaternion()
+		
+		prev = self.prevQuat_WXYZ
+		current = self.body.getQuaternion()
+		
+		# q and -q are the same rotation.  Blend along the shorter arc.
+		if( prev[0]*current[0] + prev[1]*current[1] + prev[2]*current[2] + prev[3]*current[3] < 0 ):
+			current = [ -current[0], -current[1], -current[2], -current[3] ]
+		
+		blended_WXYZ = [ prev[i] + alpha * (current[i] - prev[i]) for i in range(4) ]
+		
+		norm = ( blended_WXYZ[0]**2 + blended_WXYZ[1]**2 + blended_WXYZ[2]**2 + blended_WXYZ[3]**2 ) ** 0.5
+		
+		return [ blended_WXYZ[1]/norm, blended_WXYZ[2]/norm, blended_WXYZ[3]/norm, blended_WXYZ[0]/norm ]
+		
+	def _queueIfThreaded(self,func,*args):
+		
+		# While the physics thread is running, changes made from any other thread are queued,
+		# and applied by the physics thread between two steps.
+		# Returns True if the call was queued
+		
+		thePhysEnv = self.parentPhysEnv
+		
+		if( thePhysEnv and thePhysEnv.threadRunning and not thePhysEnv.isPhysicsThread() ):
+			thePhysEnv.queueCommand(func,args)
+			return True
+			
+		return False
+		
 	def updateWithTransform(self,transform):
 		
 		newPos = transform.getPosition()
@@ -458,6 +1279,9 @@ class physNode():
 		# however, ODE's quats are wxyz
 		# here, we convert!
 		
+		if( self._queueIfThreaded(self.setQuaternion,vizFormQuat) ):
+			return
+		
 		odeFormQuat = [ vizFormQuat[3], vizFormQuat[0], vizFormQuat[1], vizFormQuat[2]]
 		
 		if( self.body ):
@@ -468,6 +1292,9 @@ class physNode():
 		
 	def setPosition(self,pos):
 		
+		if( self._queueIfThreaded(self.setPosition,pos) ):
+			return
+		
 		if( self.body ):
 			self.body.setPosition(pos)
 		
@@ -478,19 +1305,36 @@ class physNode():
 		self.setLinearVel(vel_XYZ)
 		
 	def setLinearVel(self,vel_XYZ):
+		
+		if( self._queueIfThreaded(self.setLinearVel,vel_XYZ) ):
+			return
+			
 		self.body.setLinearVel(vel_XYZ)
 		
 	def setBounciness(self,bounciness):
 		self.bounciness = bounciness
 		
+		if( self.parentPhysEnv ):
+			self.parentPhysEnv.forgetContactParams()
+		
 	def setFriction(self,friction):
 		self.friction = friction
+		
+		if( self.parentPhysEnv ):
+			self.parentPhysEnv.forgetContactParams()
 	
 	def enableMovement(self):
+		
+		if( self._queueIfThreaded(self.enableMovement) ):
+			return
+			
 		self.body.setDynamic()
 	
 	def disableMovement(self):
 		
+		if( self._queueIfThreaded(self.disableMovement) ):
+			return
+		
 		self.body.setLinearVel([0,0,0])
 		self.body.setKinematic()
 		
@@ -514,10 +1358,28 @@ class physNode():
 				
 		return 0
 	
+	def setCollisionCategory(self,category):
+		
+		# Accepts category bits, or a string such as 'ball|paddle'.  See physEnv.CATEGORY_*
+		self.geom.setCategoryBits(categoryBitsFromString(category))
+		
+	def setCollideWith(self,collideWith):
+		
+		# Accepts category bits, or a string such as 'static|paddle'.  See physEnv.CATEGORY_*
+		self.geom.setCollideBits(categoryBitsFromString(collideWith))
+		
 	def enableCollisions(self):
+		
+		if( self._queueIfThreaded(self.enableCollisions) ):
+			return
+			
 		self.geom.enable()
 	
 	def disableCollisions(self):
+		
+		if( self._queueIfThreaded(self.disableCollisions) ):
+			return
+			
 		self.geom.disable()
 		
 	def vizQuatToRotationMat(self,quat):
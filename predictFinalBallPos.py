@@ -1,12 +1,206 @@
-﻿
-import viz
+﻿"""
+Closed-form prediction of a ball's flight, for one launch or for many at once.
 
+The ball flies under gravity alone (no drag), bounces once off a horizontal floor, 
+and leaves the floor with its vertical velocity scaled by -elasticity.  
+This is what physEnv simulates for a ball launched in an empty room, 
+so these predictions can stand in for stepping ODE when choosing launch parameters.
 
+Every function accepts a single launch ([x,y,z]) or many ([[x,y,z],...], one row per launch).
+Results are numpy arrays, with one row (or value) per launch.
 
-def predictFinalBallPosition(ballObj):
+elasticity is the coefficient of restitution of the bounce.  
+physEnv uses the product of the two physNodes' bounciness (see physEnv.getContactParams).
+ODE does not bounce a ball that reaches the floor slower than physEnv.minBounceVel.  That is not modelled here.
+"""
+
+import numpy as np
+
+def _asRows(values_XYZ):
+	
+	# Returns an array with one [x,y,z] per row, and whether a single launch was passed in
+	values_bXYZ = np.asarray(values_XYZ,dtype=float)
+	
+	if( values_bXYZ.ndim == 1 ):
+		return values_bXYZ.reshape(1,3), True
+		
+	return values_bXYZ, False
+
+def _earliestRoot(a,b,c,minT=0.0):
+	
+	# Earliest t > minT at which a*t^2 + b*t + c = 0, for arrays a, b and c.  
+	# NaN if there is none.
+	
+	a, b, c = np.broadcast_arrays(np.asarray(a,dtype=float),np.asarray(b,dtype=float),np.asarray(c,dtype=float))
+	
+	root_b = np.empty(a.shape)
+	root_b.fill(np.nan)
+	
+	isLinear_b = np.abs(a) < 1e-12
+	
+	with np.errstate(divide='ignore',invalid='ignore'):
+		
+		# Linear: b*t + c = 0
+		tLin_b = -c / b
+		root_b = np.where( isLinear_b & (tLin_b > minT), tLin_b, root_b )
+		
+		# Quadratic
+		disc_b = b*b - 4*a*c
+		sqrtDisc_b = np.sqrt(np.where(disc_b >= 0, disc_b, np.nan))
+		
+		t1_b = (-b - sqrtDisc_b) / (2*a)
+		t2_b = (-b + sqrtDisc_b) / (2*a)
+		
+		tLow_b = np.fmin(t1_b,t2_b)
+		tHigh_b = np.fmax(t1_b,t2_b)
+		
+		tQuad_b = np.where( tLow_b > minT, tLow_b, np.where( tHigh_b > minT, tHigh_b, np.nan ) )
+	
+	return np.where( isLinear_b, root_b, tQuad_b )
+
+def positionAtTime(pos_XYZ,vel_XYZ,t,gravity=9.8):
+	
+	# Position of a ball in free flight, t seconds after it was at pos_XYZ with velocity vel_XYZ
+	
+	pos_bXYZ, isSingle = _asRows(pos_XYZ)
+	vel_bXYZ = _asRows(vel_XYZ)[0]
+	t_b = np.asarray(t,dtype=float).reshape(-1,1)
+	
+	newPos_bXYZ = pos_bXYZ + vel_bXYZ * t_b
+	newPos_bXYZ[:,1] -= 0.5 * gravity * t_b[:,0]**2
+	
+	if( isSingle ):
+		return newPos_bXYZ[0]
+		
+	return newPos_bXYZ
+
+def predictBounce(launchPos_XYZ,launchVel_XYZ,gravity=9.8,ballRadius=0.035,elasticity=1.0,floorHeight=0.0):
+	
+	# Returns [bounceTime, bouncePos_XYZ, bounceVel_XYZ]
+	# bounceTime is the pre-bounce flight duration, measured from launch.
+	# bouncePos_XYZ is the ball's center when it touches the floor.
+	# bounceVel_XYZ is its velocity as it leaves the floor.
+	# NaN for launches that start below the floor.
+	
+	launchPos_bXYZ, isSingle = _asRows(launchPos_XYZ)
+	launchVel_bXYZ = _asRows(launchVel_XYZ)[0]
+	
+	vy_b = launchVel_bXYZ[:,1]
+	heightAboveContact_b = launchPos_bXYZ[:,1] - (floorHeight + ballRadius)
+	
+	# y0 + vy*t - g/2*t^2 = floorHeight + ballRadius, later root
+	with np.errstate(invalid='ignore'):
+		bounceTime_b = ( vy_b + np.sqrt( vy_b**2 + 2 * gravity * heightAboveContact_b ) ) / gravity
+	
+	bounceTime_b = np.where( heightAboveContact_b >= 0, bounceTime_b, np.nan )
+	
+	bouncePos_bXYZ = launchPos_bXYZ + launchVel_bXYZ * bounceTime_b[:,np.newaxis]
+	bouncePos_bXYZ[:,1] = floorHeight + ballRadius
+	
+	bounceVel_bXYZ = launchVel_bXYZ.copy()
+	bounceVel_bXYZ[:,1] = -elasticity * ( vy_b - gravity * bounceTime_b )
+	
+	if( isSingle ):
+		return [bounceTime_b[0], bouncePos_bXYZ[0], bounceVel_bXYZ[0]]
+		
+	return [bounceTime_b, bouncePos_bXYZ, bounceVel_bXYZ]
+
+def predictPlaneCrossing(launchPos_XYZ,launchVel_XYZ,planeNormal_XYZ=[0,0,1],planeOffset=0.0,
+	gravity=9.8,ballRadius=0.035,elasticity=1.0,floorHeight=0.0):
+	
+	# Where and when the ball's center crosses the plane dot(planeNormal_XYZ,pos) = planeOffset, 
+	# such as the plane of the paddle.  The crossing may happen before or after the bounce.
+	# Returns [crossingTime, crossingPos_XYZ, hasBounced], with crossingTime measured from launch.
+	# NaN if the ball never reaches the plane (before it would bounce a second time).
+	
+	launchPos_bXYZ, isSingle = _asRows(launchPos_XYZ)
+	launchVel_bXYZ = _asRows(launchVel_XYZ)[0]
+	normal_XYZ = np.asarray(planeNormal_XYZ,dtype=float)
+	
+	bounceTime_b, bouncePos_bXYZ, bounceVel_bXYZ = predictBounce(launchPos_bXYZ,launchVel_bXYZ,gravity,ballRadius,elasticity,floorHeight)
+	
+	# dot(n, p0 + v*t - g/2*t^2*Y) = offset, which is a quadratic in t
+	a = -0.5 * gravity * normal_XYZ[1]
+	
+	preBounceTime_b = _earliestRoot( a, launchVel_bXYZ.dot(normal_XYZ), launchPos_bXYZ.dot(normal_XYZ) - planeOffset )
+	postBounceTime_b = _earliestRoot( a, bounceVel_bXYZ.dot(normal_XYZ), bouncePos_bXYZ.dot(normal_XYZ) - planeOffset )
+	
+	# A second bounce is not modelled
+	secondBounceTime_b = 2 * bounceVel_bXYZ[:,1] / gravity
+	
+	with np.errstate(invalid='ignore'):
+		hasBounced_b = ~( preBounceTime_b <= bounceTime_b )
+		postBounceTime_b = np.where( postBounceTime_b <= secondBounceTime_b, postBounceTime_b, np.nan )
+	
+	crossingTime_b = np.where( hasBounced_b, bounceTime_b + postBounceTime_b, preBounceTime_b )
+	
+	crossingPos_bXYZ = np.where( hasBounced_b[:,np.newaxis],
+		positionAtTime(bouncePos_bXYZ,bounceVel_bXYZ,postBounceTime_b,gravity),
+		positionAtTime(launchPos_bXYZ,launchVel_bXYZ,preBounceTime_b,gravity) )
+	
+	if( isSingle ):
+		return [crossingTime_b[0], crossingPos_bXYZ[0], bool(hasBounced_b[0])]
+		
+	return [crossingTime_b, crossingPos_bXYZ, hasBounced_b]
+
+def solveLaunchVelocity(launchPos_XYZ,targetBouncePos_XYZ,preBounceFlightDur,gravity=9.8,ballRadius=0.035,floorHeight=0.0):
+	
+	# The launch velocity that makes the ball bounce at targetBouncePos_XYZ (X and Z are used)
+	# preBounceFlightDur seconds after launch.  The inverse of predictBounce.
+	# preBounceFlightDur may be a single value, or one per launch.
+	
+	launchPos_bXYZ, isSingle = _asRows(launchPos_XYZ)
+	targetPos_bXYZ = _asRows(targetBouncePos_XYZ)[0]
+	
+	flightDur_b = np.asarray(preBounceFlightDur,dtype=float).reshape(-1)
+	
+	launchVel_bXYZ = np.empty( np.broadcast(launchPos_bXYZ,targetPos_bXYZ).shape )
+	
+	launchVel_bXYZ[:,0] = ( targetPos_bXYZ[:,0] - launchPos_bXYZ[:,0] ) / flightDur_b
+	launchVel_bXYZ[:,2] = ( targetPos_bXYZ[:,2] - launchPos_bXYZ[:,2] ) / flightDur_b
+	
+	# floorHeight + ballRadius = y0 + vy*T - g/2*T^2
+	launchVel_bXYZ[:,1] = ( floorHeight + ballRadius - launchPos_bXYZ[:,1] + 0.5 * gravity * flightDur_b**2 ) / flightDur_b
+	
+	if( isSingle and len(launchVel_bXYZ) == 1 ):
+		return launchVel_bXYZ[0]
+		
+	return launchVel_bXYZ
+
+def predictFinalBallPosition(ballObj,gravity=9.8,elasticity=1.0,floorHeight=0.0):
+	
+	# Takes a visEnv.visObj sphere in flight.
+	# Returns [bounceTime, bouncePos_XYZ, bounceVel_XYZ] as predictBounce, with bounceTime measured from now
+	
+	ballRadius = ballObj.size
+	
+	if( isinstance(ballRadius,list) ):
+		ballRadius = ballRadius[0]
+	
+	return predictBounce( ballObj.visNode.getPosition(), ballObj.getVelocity(), 
+		gravity, ballRadius, elasticity, floorHeight )
+
+if __name__ == "__main__":
+	
+	# Compare the closed form with a simple fine-grained simulation of one launch
+	
+	launchPos_XYZ = [0,1.5,10]
+	launchVel_XYZ = [0.5,3,-8]
+	
+	bounceTime, bouncePos_XYZ, bounceVel_XYZ = predictBounce(launchPos_XYZ,launchVel_XYZ,elasticity=0.8)
+	crossingTime, crossingPos_XYZ, hasBounced = predictPlaneCrossing(launchPos_XYZ,launchVel_XYZ,[0,0,1],0.0,elasticity=0.8)
+	
+	print 'Bounce at t = %.4f s, pos = %s' % (bounceTime,str(bouncePos_XYZ))
+	print 'Crosses Z=0 at t = %.4f s, pos = %s, after bounce: %s' % (crossingTime,str(crossingPos_XYZ),str(hasBounced))
+	
+	print 'Launch velocity back from the bounce: ' + str(solveLaunchVelocity(launchPos_XYZ,bouncePos_XYZ,bounceTime))
+	
+	# Many candidate launches at once
+	numLaunches = 100000
+	launchVel_bXYZ = np.column_stack( [ np.random.uniform(-1,1,numLaunches), np.random.uniform(0,5,numLaunches), np.random.uniform(-12,-6,numLaunches) ] )
+	launchPos_bXYZ = np.tile(launchPos_XYZ,(numLaunches,1))
 	
-	spf = (1/60) # seconds per frame
-	pos_time_xyz
-	while( 
-	pass
-	
\ No newline at end of file
+	import time
+	startTime = time.clock()
+	crossingTime_b, crossingPos_bXYZ, hasBounced_b = predictPlaneCrossing(launchPos_bXYZ,launchVel_bXYZ,[0,0,1],0.0,elasticity=0.8)
+	print '%i launches in %.2f ms' % (numLaunches,1000 * (time.clock() - startTime))
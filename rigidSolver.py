@@ -0,0 +1,86 @@
+"""
+Fits rigid body definitions to the markers that are visible, on the client rather than the OWL server.
+
+solveRigids() does every rigid of a frame at once (weighted Kabsch: weighted centroids, then an SVD of the weighted covariance).
+Rigids are padded to the same number of markers.  Padding, and markers that were not seen, get a weight of 0.
+
+Poses are returned as OWL reports them, [x,y,z,w,a,b,c] in phasespace coordinates,
+such that observed = rotate(quat, local) + pos.  So they can go to phasespaceInterface.psPoseToVizTransform as they are.
+"""
+
+import numpy as np
+
+def rotationMatrixToQuat(rot_r_3_3):
+
+	# Rotation matrices (column vector convention) to WABC quaternions, with w >= 0
+
+	trace_r = rot_r_3_3[:,0,0] + rot_r_3_3[:,1,1] + rot_r_3_3[:,2,2]
+
+	# Magnitudes of each component, from the diagonal.  Signs from the off diagonals
+	quat_r_WABC = np.sqrt( np.maximum( 0, np.column_stack([ 1 + trace_r,
+		1 + rot_r_3_3[:,0,0] - rot_r_3_3[:,1,1] - rot_r_3_3[:,2,2],
+		1 - rot_r_3_3[:,0,0] + rot_r_3_3[:,1,1] - rot_r_3_3[:,2,2],
+		1 - rot_r_3_3[:,0,0] - rot_r_3_3[:,1,1] + rot_r_3_3[:,2,2] ]) ) ) / 2
+
+	quat_r_WABC[:,1] = np.copysign( quat_r_WABC[:,1], rot_r_3_3[:,2,1] - rot_r_3_3[:,1,2] )
+	quat_r_WABC[:,2] = np.copysign( quat_r_WABC[:,2], rot_r_3_3[:,0,2] - rot_r_3_3[:,2,0] )
+	quat_r_WABC[:,3] = np.copysign( quat_r_WABC[:,3], rot_r_3_3[:,1,0] - rot_r_3_3[:,0,1] )
+
+	return quat_r_WABC / np.sqrt( np.sum(quat_r_WABC**2,axis=1) )[:,np.newaxis]
+
+def solveRigids(local_r_m_XYZ,observed_r_m_XYZ,weight_r_m,minMarkers=3):
+
+	'''
+	local_r_m_XYZ:  marker positions in each rigid's own frame (e.g. rigidObject.markerPos_midx_localXYZ)
+	observed_r_m_XYZ:  where those markers are now
+	weight_r_m:  0 for markers that were not seen, or are padding
+
+	Returns [pose_r_XYZWABC, rmsResidual_r, numMarkers_r, valid_r].
+	A rigid is valid if at least minMarkers (no fewer than 3) markers have a weight.
+	rmsResidual is the weighted RMS distance between the fitted and observed markers, in the units of the positions.
+	'''
+
+	local_r_m_XYZ = np.asarray(local_r_m_XYZ,dtype=float)
+	observed_r_m_XYZ = np.asarray(observed_r_m_XYZ,dtype=float)
+	weight_r_m = np.asarray(weight_r_m,dtype=float)
+
+	numRigids = len(weight_r_m)
+
+	numMarkers_r = np.sum(weight_r_m > 0,axis=1)
+	valid_r = numMarkers_r >= max(minMarkers,3)
+
+	# Keep invalid rigids from dividing by 0.  Their results are not used
+	totalWeight_r = np.sum(weight_r_m,axis=1)
+	totalWeight_r[totalWeight_r == 0] = 1
+
+	localCentroid_r_XYZ = np.einsum('rm,rmi->ri',weight_r_m,local_r_m_XYZ) / totalWeight_r[:,np.newaxis]
+	observedCentroid_r_XYZ = np.einsum('rm,rmi->ri',weight_r_m,observed_r_m_XYZ) / totalWeight_r[:,np.newaxis]
+
+	localCentered_r_m_XYZ = local_r_m_XYZ - localCentroid_r_XYZ[:,np.newaxis,:]
+	observedCentered_r_m_XYZ = observed_r_m_XYZ - observedCentroid_r_XYZ[:,np.newaxis,:]
+
+	covariance_r_3_3 = np.einsum('rm,rmi,rmj->rij',weight_r_m,localCentered_r_m_XYZ,observedCentered_r_m_XYZ)
+
+	u_r_3_3, s_r_3, vt_r_3_3 = np.linalg.svd(covariance_r_3_3)
+
+	# Guard against reflections
+	v_r_3_3 = np.transpose(vt_r_3_3,(0,2,1))
+	ut_r_3_3 = np.transpose(u_r_3_3,(0,2,1))
+
+	reflect_r = np.linalg.det( np.einsum('rij,rjk->rik',v_r_3_3,ut_r_3_3) ) < 0
+	v_r_3_3[reflect_r,:,2] *= -1
+
+	rot_r_3_3 = np.einsum('rij,rjk->rik',v_r_3_3,ut_r_3_3)
+
+	pos_r_XYZ = observedCentroid_r_XYZ - np.einsum('rij,rj->ri',rot_r_3_3,localCentroid_r_XYZ)
+
+	fitted_r_m_XYZ = np.einsum('rij,rmj->rmi',rot_r_3_3,local_r_m_XYZ) + pos_r_XYZ[:,np.newaxis,:]
+	sqError_r_m = np.sum( (fitted_r_m_XYZ - observed_r_m_XYZ)**2, axis=2 )
+
+	rmsResidual_r = np.sqrt( np.sum(weight_r_m * sqError_r_m,axis=1) / totalWeight_r )
+
+	pose_r_XYZWABC = np.zeros((numRigids,7))
+	pose_r_XYZWABC[:,0:3] = pos_r_XYZ
+	pose_r_XYZWABC[:,3:7] = rotationMatrixToQuat(rot_r_3_3)
+
+	return [pose_r_XYZWABC, rmsResidual_r, numMarkers_r, valid_r]
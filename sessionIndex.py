@@ -0,0 +1,86 @@
+"""
+An index of where each block, trial and event falls in a session's logs, written alongside them while recording.
+
+One JSON object per line, in the order they happened:
+
+	{"kind": "session", "expData": "Data/exp_data-2014-5-1-12-0.txt", "frameLog": "Data/exp_data-2014-5-1-12-0.npy", ...}
+	{"kind": "block", "block": 0, "row": 0, "byte": 0, "frame": 412, "frameTime": 6.86}
+	{"kind": "trial", "block": 0, "trial": 0, "trialType": "t1", "drawnParams": {"ballDiameter": ["fixed", "0.07", 0.07], ...}, "row": 0, ...}
+	{"kind": "event", "eventFlag": 1, "block": 0, "trial": 0, "row": 233, "line": 233, "byte": 40127, ...}
+
+row is the number of frames logged before that frame in this session, which is its row in the binary frame log.
+line and byte are the number and offset of its line in the text log (expData), if there is one.
+The text log is appended to, so these start after whatever was already in it (see the session entry), and differ from row.
+drawnParams are the trial's values, as {varName: [distType, distParams, value]} (see drawNumberFromDist.drawTrialParams).
+
+Events are the eventFlag of a frame, when it is not 0 (1 launch, 3 floor, 4 paddle, 6 trial end, 7 block end).
+They carry the block and trial that was running, so the 6 that ends a trial belongs to that trial, not the next.
+
+	index = sessionIndex.loadSessionIndex('Data/exp_data-2014-5-1-12-0.index.jsonl')
+	lines = sessionIndex.readTrialLines(index,0,3)		# the text log lines of block 0, trial 3, without reading the rest
+"""
+
+import json
+
+class sessionIndex():
+
+	def __init__(self,dataFile):
+
+		# dataFile is open for writing (a file, or an asyncWriter.asyncFileWriter)
+
+		self.dataFile = dataFile
+
+	def addEntry(self,entry):
+
+		self.dataFile.write( json.dumps(entry,sort_keys=True,default=str) + '\n' )
+
+def loadSessionIndex(fileName):
+
+	# Returns the entries, as a list of dicts
+
+	return [ json.loads(line) for line in open(fileName) if line.strip() ]
+
+def getEntries(index,kind):
+
+	return [ entry for entry in index if entry['kind'] == kind ]
+
+def getTrialRange(index,blockNum,trialNum):
+
+	# Returns [trialEntry, nextEntry] for a trial.  nextEntry is the next trial or block entry, or None if the trial was the last
+
+	boundaries = [ entry for entry in index if entry['kind'] in ['block','trial'] ]
+
+	for bIdx in range(len(boundaries)):
+
+		entry = boundaries[bIdx]
+
+		if( entry['kind'] == 'trial' and entry['block'] == blockNum and entry['trial'] == trialNum ):
+
+			for nextEntry in boundaries[bIdx + 1:]:
+				if( nextEntry['row'] > entry['row'] ):
+					return [entry, nextEntry]
+
+			return [entry, None]
+
+	raise KeyError('sessionIndex: No block %i, trial %i' % (blockNum,trialNum))
+
+def readTrialLines(index,blockNum,trialNum,expDataFileName=None):
+
+	# The text log lines of one trial.  Seeks to them, rather than reading the whole log
+
+	if( expDataFileName is None ):
+		expDataFileName = getEntries(index,'session')[0]['expData']
+
+	trialEntry, nextEntry = getTrialRange(index,blockNum,trialNum)
+
+	dataFile = open(expDataFileName,'rb')
+	dataFile.seek(trialEntry['byte'])
+
+	if( nextEntry is None ):
+		text = dataFile.read()
+	else:
+		text = dataFile.read(nextEntry['byte'] - trialEntry['byte'])
+
+	dataFile.close()
+
+	return text.splitlines()
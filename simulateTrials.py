@@ -0,0 +1,262 @@
+"""
+Runs the trials of an experiment config through physEnv without Vizard, and reports where and when each ball bounces.
+
+Usage:  python simulateTrials.py [expConfigFile] [numRepeats] [outputCsvFile]
+
+The room's walls and floor are the planes of visEnv.room (see physEnv.roomPlanes).
+Trials are drawn from the [blocks] and [trialTypes] sections, as main.block and main.trial do.
+The blocks are run numRepeats times, and the trials are spread over a pool of processes.
+
+Each trial launches a ball from launchPos_X/Y/Z with launchVel_X/Y/Z, 
+and steps physEnv until the ball first touches the floor, or maxFlightDur has passed.
+These, and ballDiameter and ballElasticity, are taken from the trial if it has them
+(as a fixed value or as a distribution in [trialTypes]), and from defaultLaunchParams otherwise.
+"""
+
+import sys
+import csv
+import math
+import multiprocessing
+
+sys.path.append('Utils')
+from configobj import ConfigObj
+from configobj import flatten_errors
+from validate import Validator
+
+import physEnv
+from drawNumberFromDist import drawTrialParams
+from predictFinalBallPos import predictBounce
+
+defaultLaunchParams = {'ballDiameter': 0.07,
+	'ballElasticity': 0.8,
+	'launchPos_X': 0.0,
+	'launchPos_Y': 1.5,
+	'launchPos_Z': 10.0,
+	'launchVel_X': 0.0,
+	'launchVel_Y': 3.0,
+	'launchVel_Z': -8.0,
+	'maxFlightDur': 3.0}
+
+def loadExpConfig(expCfgName):
+	
+	# Parses and validates an experiment config, as vrlabConfig.VRLabConfig does (without its _LOAD_ section)
+	
+	expCfg = ConfigObj(expCfgName, configspec='expCfgSpec.ini', raise_errors = True, file_error = True)
+	
+	validator = Validator()
+	res = expCfg.validate(validator, preserve_errors=True)
+	
+	if res != True:
+		print 'Experiment config file validation failed!'
+		
+		for section_list, key, error in flatten_errors(expCfg, res):
+			if key is not None:
+				section_list.append(key)
+			else:
+				section_list.append('[missing section]')
+			if error == False:
+				error = 'Missing value or section.'
+			print ', '.join(section_list), ' = ', error
+			
+		sys.exit(1)
+		
+	return expCfg
+	
+def getLaunchParams(expCfg,trialType,drawnParams):
+	
+	# The value of each of defaultLaunchParams for this trial
+	
+	launchParams = {}
+	
+	for varName, defaultValue in defaultLaunchParams.iteritems():
+		
+		if( drawnParams.has_key(varName) ):
+			launchParams[varName] = drawnParams[varName][2]
+		elif( expCfg['trialTypes'].has_key(trialType) and expCfg['trialTypes'][trialType].has_key(varName) ):
+			launchParams[varName] = float(expCfg['trialTypes'][trialType][varName])
+		elif( expCfg['trialTypes']['default'].has_key(varName) ):
+			launchParams[varName] = float(expCfg['trialTypes']['default'][varName])
+		else:
+			launchParams[varName] = defaultValue
+			
+	return launchParams
+
+def makeTrialList(expCfg,numRepeats=1):
+	
+	# Returns one [blockName, trialType, launchParams] per trial, in block order.
+	# Trial types are not shuffled within a block, because the order does not change the outcome of a trial.
+	
+	trialList_tr = []
+	
+	for repeatIdx in range(numRepeats):
+		for blockName in expCfg['experiment']['blockList']:
+			
+			trialTypesInBlock = expCfg['blocks'][blockName]['trialTypesString'].split(',')
+			numOfEachTrialType_type = map(int,expCfg['blocks'][blockName]['trialTypeCountString'].split(','))
+			
+			for typeIdx in range(len(trialTypesInBlock)):
+				for count in range(numOfEachTrialType_type[typeIdx]):
+					
+					trialType = trialTypesInBlock[typeIdx]
+					drawnParams = drawTrialParams(expCfg,trialType)
+					
+					trialList_tr.append( [blockName, trialType, getLaunchParams(expCfg,trialType,drawnParams)] )
+	
+	return trialList_tr
+
+def simulateTrial(job):
+	
+	# Runs in a worker process.  job is [trialNum, blockName, trialType, launchParams, physCfg, roomCfg]
+	# Returns a dict with one entry per column of the report
+	
+	trialNum, blockName, trialType, launchParams, physCfg, roomCfg = job
+	
+	thePhysEnv = physEnv.physEnv(physCfg)
+	
+	roomWidth, ceilingHeight, roomLength = roomCfg['roomSize_WHL']
+	planes_ABCD = physEnv.roomPlanes(roomWidth,ceilingHeight,roomLength,roomCfg['translateRoom_X'],roomCfg['translateRoom_Z'])
+	
+	physNodeByPlane = {}
+	
+	for planeName, planeABCD in planes_ABCD.iteritems():
+		physNodeByPlane[planeName] = thePhysEnv.makePhysNode('plane',planeABCD)
+	
+	theFloor = physNodeByPlane['floor']
+	
+	ballRadius = launchParams['ballDiameter']/2
+	launchPos_XYZ = [launchParams['launchPos_X'],launchParams['launchPos_Y'],launchParams['launchPos_Z']]
+	launchVel_XYZ = [launchParams['launchVel_X'],launchParams['launchVel_Y'],launchParams['launchVel_Z']]
+	
+	ball = thePhysEnv.makePhysNode('sphere',launchPos_XYZ,ballRadius,physEnv.CATEGORY_BALL)
+	ball.setBounciness(launchParams['ballElasticity'])
+	ball.setVelocity(launchVel_XYZ)
+	ball.enableMovement()
+	
+	launchTime = thePhysEnv.getFrameTime()
+	
+	result = {'trialNum': trialNum, 'blockName': blockName, 'trialType': trialType}
+	result.update(launchParams)
+	
+	result['bounceTime'] = float('NaN')
+	result['bouncePos_X'] = result['bouncePos_Y'] = result['bouncePos_Z'] = float('NaN')
+	result['otherContacts'] = ''
+	
+	numFrames = int( math.ceil( launchParams['maxFlightDur'] / thePhysEnv.frameRate ) )
+	
+	for frameIdx in range(numFrames):
+		
+		thePhysEnv.stepPhysics()
+		
+		hasBounced = False
+		
+		for event in thePhysEnv.getCollisionEvents():
+			
+			if( event.eventType != physEnv.CONTACT_BEGIN or not event.involves(ball) ):
+				continue
+			
+			otherPhysNode = event.other(ball)
+			
+			if( otherPhysNode is theFloor ):
+				
+				result['bounceTime'] = event.time - launchTime
+				result['bouncePos_X'], result['bouncePos_Y'], result['bouncePos_Z'] = event.contactPos_XYZ
+				hasBounced = True
+				break
+			else:
+				# A wall or the ceiling, before the bounce
+				for planeName, planePhysNode in physNodeByPlane.iteritems():
+					if( planePhysNode is otherPhysNode ):
+						result['otherContacts'] = result['otherContacts'] + planeName + ' '
+		
+		if( hasBounced ):
+			break
+	
+	# The closed-form prediction, for comparison
+	gravity = -thePhysEnv.world.getGravity()[1]
+	predictedBounceTime, predictedBouncePos_XYZ, bounceVel_XYZ = predictBounce(launchPos_XYZ,launchVel_XYZ,
+		gravity,ballRadius,launchParams['ballElasticity'])
+	
+	result['predictedBounceTime'] = float(predictedBounceTime)
+	
+	return result
+
+def runTrials(expCfg,numRepeats=1,numProcesses=None):
+	
+	trialList_tr = makeTrialList(expCfg,numRepeats)
+	
+	physCfg = dict(expCfg['physics'])
+	roomCfg = {'roomSize_WHL': map(float,expCfg['room']['roomSize_WHL']),
+		'translateRoom_X': float(expCfg['room']['translateRoom_X']),
+		'translateRoom_Z': float(expCfg['room']['translateRoom_Z'])}
+	
+	jobs_tr = [ [trialNum, blockName, trialType, launchParams, physCfg, roomCfg] 
+		for trialNum, (blockName, trialType, launchParams) in enumerate(trialList_tr) ]
+	
+	pool = multiprocessing.Pool(numProcesses)
+	
+	try:
+		results_tr = pool.map( simulateTrial, jobs_tr, max(1, len(jobs_tr) / (4 * multiprocessing.cpu_count())) )
+	finally:
+		pool.close()
+		pool.join()
+	
+	return results_tr
+
+def printSummary(results_tr):
+	
+	print '  trialType   numTrials   noBounce   bounceTime (mean, sd)   |bounceTime - predicted| (mean, max)'
+	
+	trialTypes = sorted( set( [result['trialType'] for result in results_tr] ) )
+	
+	for trialType in trialTypes:
+		
+		results = [result for result in results_tr if result['trialType'] == trialType]
+		bounceTimes = [result['bounceTime'] for result in results if not math.isnan(result['bounceTime'])]
+		timeErrors = [abs(result['bounceTime'] - result['predictedBounceTime']) for result in results if not math.isnan(result['bounceTime'])]
+		
+		numBounced = len(bounceTimes)
+		
+		if( numBounced ):
+			meanTime = sum(bounceTimes) / numBounced
+			sdTime = ( sum([(t - meanTime)**2 for t in bounceTimes]) / numBounced ) ** 0.5
+			meanError = sum(timeErrors) / numBounced
+			maxError = max(timeErrors)
+		else:
+			meanTime = sdTime = meanError = maxError = float('NaN')
+		
+		print '  %-9s   %9i   %8i   %10.4f, %-10.4f   %10.4f, %-10.4f' % (trialType,len(results),len(results) - numBounced,meanTime,sdTime,meanError,maxError)
+
+def writeCsv(results_tr,fileName):
+	
+	columns_col = ['trialNum','blockName','trialType','bounceTime','predictedBounceTime',
+		'bouncePos_X','bouncePos_Y','bouncePos_Z','otherContacts'] + sorted(defaultLaunchParams.keys())
+	
+	outFile = open(fileName,'wb')
+	writer = csv.DictWriter(outFile,columns_col)
+	writer.writerow( dict( zip(columns_col,columns_col) ) )
+	writer.writerows(results_tr)
+	outFile.close()
+		
+if __name__ == "__main__":
+	
+	expCfgName = 'exampleExpConfig.cfg'
+	numRepeats = 1
+	outputFileName = None
+	
+	if( len(sys.argv) > 1 ):
+		expCfgName = sys.argv[1]
+	if( len(sys.argv) > 2 ):
+		numRepeats = int(sys.argv[2])
+	if( len(sys.argv) > 3 ):
+		outputFileName = sys.argv[3]
+	
+	import time
+	startTime = time.time()
+	
+	results_tr = runTrials(loadExpConfig(expCfgName),numRepeats)
+	
+	print 'simulateTrials: %i trials in %.2f s' % (len(results_tr),time.time() - startTime)
+	printSummary(results_tr)
+	
+	if( outputFileName ):
+		writeCsv(results_tr,outputFileName)
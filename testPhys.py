@@ -59,15 +59,15 @@ if useConfig:
 	# note that 'hmd' is used to search rigid body files for the partial string
 	# in my current setup, it will find hmd-oculus.rb and link to that
 	
-	if( config.use_phasespace and config.use_HMD and config.mocap.returnPointerToRigid('hmd') ):
+	if( config.use_phasespace and config.use_HMD and config.tracker.resolve('hmd') ):
 			
-			config.mocap.enableHMDTracking()
+			config.tracker.linkMainView('hmd')
 			
-			vizact.onkeydown('-',config.mocap.disableHMDTracking)
-			vizact.onkeydown('=',config.mocap.enableHMDTracking)
+			vizact.onkeydown('-',config.tracker.unlinkMainView)
+			vizact.onkeydown('=',config.tracker.linkMainView,'hmd')
 			
-			vizact.onkeydown( 'h', config.mocap.resetRigid, 'hmd' );
-			vizact.onkeydown( 'H', config.mocap.saveRigid, 'hmd' );
+			vizact.onkeydown( 'h', config.phasespace.resetRigid, 'hmd' );
+			vizact.onkeydown( 'H', config.phasespace.saveRigid, 'hmd' );
 	else:
 		
 		viz.MainView.setPosition([room.wallPos_NegX +.1, 2, room.wallPos_NegZ +.1])
@@ -101,6 +101,7 @@ if useConfig:
 	
 	#visObj(room,shape,size,position=[0,.25,-3],color=[.5,0,0])):
 	ball = visObj(room,'sphere',.15,ballInitialPos,[0,1,1])
+	ball.collisionCategory = physEnv.CATEGORY_BALL
 	ball.visNode.alpha(1)
 	ball.setVelocity(ballInitialVel)
 	ball.toggleUpdateWithPhys()
@@ -0,0 +1,319 @@
+"""
+One interface to the trackers, whichever is in use.
+
+A trackerBackend wraps one tracker implementation:
+
+	phasespaceBackend	mocapInterface.phasespaceInterface
+	phasespaceNewBackend	phasespaceNew.Phasespace
+	hiballBackend		HiBallCameraMT.HiBallCamera (head, and optionally body)
+
+trackerManager owns the updates of its backends, so that each frame pays for one update path.
+Backends that are safe to poll from another thread (threadSafe) can share one acquisition thread.
+The rest are polled once per frame, before anything that uses them.
+
+Poses are looked up by handle.  Resolve a name ('hmd', 'paddle', ...) to a handle once, then use the handle every frame:
+
+	hmdHandle = tracker.resolve('hmd')
+	transformViz = tracker.getTransform(hmdHandle)
+
+The link between a pose and viz.MainView is made here too (linkMainView),
+and the age of each pose when it reaches the MainView is kept in a trackingLatency.mainViewLatency.
+"""
+
+import time
+import threading
+import viz
+import vizact
+import frameProfiler
+import trackingLatency
+
+class trackerBackend():
+
+	# Base class.  Handles are whatever the backend finds most convenient, and are only passed back to the same backend.
+
+	name = 'none'
+
+	# True if poll() may be called from the acquisition thread
+	threadSafe = False
+
+	def poll(self):
+		# Read the tracker
+		pass
+
+	def resolveHandle(self,name):
+		# Returns a handle for the named pose, or None
+		return None
+
+	def getTransform(self,handle):
+		# Returns the latest pose as a viz.Transform in Vizard coordinates, or None
+		return None
+
+	def getSampleTime(self,handle):
+		# Returns the viz.tick() at which the latest pose was received, or None
+		return None
+
+	def getMarkerPosition(self,markerIdx):
+		# Returns a marker position in Vizard coordinates, or None
+		return None
+
+	def getOutput(self):
+		return ''
+
+class phasespaceBackend(trackerBackend):
+
+	# Create the phasespaceInterface with selfUpdate=False, so that this is its only update
+
+	name = 'phasespace'
+
+	def __init__(self,mocap):
+
+		self.mocap = mocap
+
+	def poll(self):
+
+		# Not while it is turned off
+		if( self.mocap.isOn() ):
+			self.mocap.update()
+
+	def resolveHandle(self,name):
+		return self.mocap.resolveRigid(name) or None
+
+	def getTransform(self,rigidBody):
+		return rigidBody.transformViz or None
+
+	def getSampleTime(self,rigidBody):
+		return self.mocap.lastSampleTime
+
+	def getMarkerPosition(self,markerIdx):
+		return self.mocap.getMarkerPosition(markerIdx) or None
+
+	def getOutput(self):
+		return self.mocap.getOutput()
+
+class phasespaceNewBackend(trackerBackend):
+
+	# Phasespace.update() takes the trackers' locks, so it can be polled from the acquisition thread.
+	# Don't also call start_thread() or start_timer()
+
+	name = 'phasespaceNew'
+	threadSafe = True
+
+	def __init__(self,phasespace):
+
+		self.phasespace = phasespace
+		self.lastSampleTime = None
+
+	def poll(self):
+
+		self.phasespace.update()
+		self.lastSampleTime = viz.tick()
+
+	def resolveHandle(self,name):
+		return self.phasespace.get_rigidTracker(name) or None
+
+	def getTransform(self,rigidTracker):
+		return rigidTracker.get_transform()
+
+	def getSampleTime(self,rigidTracker):
+		return self.lastSampleTime
+
+	def getMarkerPosition(self,markerIdx):
+		return self.phasespace.get_MarkerPos(markerIdx)
+
+class hiballBackend(trackerBackend):
+
+	# Create the cameras with attachTo=None and selfUpdate=False.  The head camera answers to 'hmd' and 'head'
+
+	name = 'hiball'
+
+	def __init__(self,headCam,bodyCam=None):
+
+		self.camerasByName = {'hmd': headCam, 'head': headCam}
+
+		if( bodyCam ):
+			self.camerasByName['body'] = bodyCam
+
+		self.cameras_cIdx = [ camera for camera in [headCam,bodyCam] if camera ]
+		self.lastSampleTime = None
+
+	def poll(self):
+
+		for camera in self.cameras_cIdx:
+			camera.updateView()
+
+		self.lastSampleTime = viz.tick()
+
+	def resolveHandle(self,name):
+		return self.camerasByName.get(name)
+
+	def getTransform(self,camera):
+		return getattr(camera,'matrix',None)
+
+	def getSampleTime(self,camera):
+		return self.lastSampleTime
+
+	def getOutput(self):
+		return ''.join( [ camera.getOutput() for camera in self.cameras_cIdx ] )
+
+class trackerManager():
+
+	def __init__(self,backends,useAcquisitionThread=False,pollRateHz=500):
+
+		self.backends = backends
+
+		# name -> [backend, handle]
+		self.handlesByName = {}
+
+		self.mainViewUpdateAction = None
+		self.mainViewHandle = None
+
+		# Age of each pose when it was applied to the MainView, and when it was displayed
+		self.mainViewLatency = trackingLatency.mainViewLatency()
+
+		self.pollRateHz = pollRateHz
+		self.acquisitionThread = None
+		self.acquisitionRunning = False
+
+		# Backends polled on the acquisition thread, and on the frame loop
+		self.threadBackends = []
+		self.frameBackends = []
+
+		for backend in backends:
+			if( useAcquisitionThread and backend.threadSafe ):
+				self.threadBackends.append(backend)
+			else:
+				self.frameBackends.append(backend)
+
+		if( len(self.frameBackends) ):
+			# Before anything else that runs at PRIORITY_FIRST_UPDATE
+			frameProfiler.onupdate('trackerPoll',viz.PRIORITY_FIRST_UPDATE-1,self.pollFrameBackends)
+
+		if( len(self.threadBackends) ):
+			self.startAcquisitionThread()
+			vizact.onexit(self.stopAcquisitionThread)
+
+		print 'trackerManager: ' + ', '.join( [ backend.name for backend in backends ] ) + \
+			( ' (acquisition thread: ' + ', '.join( [ backend.name for backend in self.threadBackends ] ) + ')' if len(self.threadBackends) else '' )
+
+	def pollFrameBackends(self):
+
+		for backend in self.frameBackends:
+			backend.poll()
+
+	def startAcquisitionThread(self):
+
+		if( self.acquisitionRunning ):
+			return
+
+		self.acquisitionRunning = True
+		self.acquisitionThread = threading.Thread(target=self._acquisitionLoop)
+		self.acquisitionThread.daemon = True
+		self.acquisitionThread.start()
+
+	def stopAcquisitionThread(self):
+
+		if( not self.acquisitionRunning ):
+			return
+
+		self.acquisitionRunning = False
+		self.acquisitionThread.join()
+		self.acquisitionThread = None
+
+	def _acquisitionLoop(self):
+
+		period = 1.0 / self.pollRateHz
+
+		while( self.acquisitionRunning ):
+
+			startTime = viz.tick()
+
+			for backend in self.threadBackends:
+				backend.poll()
+
+			wait = period - (viz.tick() - startTime)
+
+			if( wait > 0 ):
+				time.sleep(wait)
+
+	def resolve(self,name):
+
+		# Returns a handle for the named pose from the first backend that has it, or None.
+		# Resolve once, and keep the handle
+
+		handle = self.handlesByName.get(name)
+
+		if( handle ):
+			return handle
+
+		for backend in self.backends:
+
+			backendHandle = backend.resolveHandle(name)
+
+			if( backendHandle is not None ):
+				handle = [backend, backendHandle]
+				self.handlesByName[name] = handle
+				return handle
+
+		print 'trackerManager.resolve: No tracker has ' + name
+		return None
+
+	def getTransform(self,handle):
+		return handle[0].getTransform(handle[1])
+
+	def getSampleTime(self,handle):
+		return handle[0].getSampleTime(handle[1])
+
+	def getMarkerPosition(self,markerIdx):
+
+		for backend in self.backends:
+
+			pos_XYZ = backend.getMarkerPosition(markerIdx)
+
+			if( pos_XYZ is not None ):
+				return pos_XYZ
+
+	def linkMainView(self,name='hmd'):
+
+		if( self.mainViewUpdateAction ):
+			return
+
+		handle = self.resolve(name)
+
+		if( handle is None ):
+			return
+
+		self.mainViewHandle = handle
+		self.mainViewUpdateAction = frameProfiler.onupdate('updateMainViewWithTracker',viz.PRIORITY_FIRST_UPDATE,self._updateMainView,handle)
+
+		print 'trackerManager.linkMainView: Mainview now follows ' + name
+
+	def unlinkMainView(self):
+
+		if( self.mainViewUpdateAction ):
+			vizact.removeEvent(self.mainViewUpdateAction)
+			self.mainViewUpdateAction = None
+
+			print 'trackerManager.unlinkMainView: Mainview freed'
+
+	def isMainViewLinked(self):
+		return self.mainViewUpdateAction is not None
+
+	def toggleMainViewLink(self,name='hmd'):
+
+		if( self.isMainViewLinked() ):
+			self.unlinkMainView()
+		else:
+			self.linkMainView(name)
+
+	def _updateMainView(self,handle):
+
+		transformViz = handle[0].getTransform(handle[1])
+
+		if( transformViz ):
+
+			viz.MainView.setMatrix(transformViz)
+			self.mainViewLatency.stampApply( handle[0].getSampleTime(handle[1]) )
+
+	def getOutput(self):
+
+		return ''.join( [ backend.getOutput() for backend in self.backends ] )
@@ -0,0 +1,166 @@
+"""
+How old a tracked pose is by the time it reaches the display.
+
+Three times are taken for the pose that drives viz.MainView each frame, all from viz.tick():
+
+	sample		when the tracker data was received (refreshMarkerPositions, or the acquisition thread)
+	apply		when it was applied to the MainView (stampApply)
+	swap		at viz.POST_SWAP_EVENT, once the frame that shows it has been swapped (stampSwap)
+
+mainViewLatency keeps the last numFrames of sample->apply, apply->swap and sample->swap in latencyStats,
+and reports each frame's latencies, with their p50/p95/p99, through getOutput() (text) or fillLogRow() (frameLogger).
+
+Text data is written before the frame is drawn, so getOutput() reports the last frame that was swapped.
+"""
+
+import viz
+import numpy as np
+
+class latencyStats():
+
+	# The last numSamples latencies (ms), in a ring buffer
+
+	def __init__(self,numSamples=1000):
+
+		self.latency_s = np.zeros(numSamples)
+		self.numSamples = numSamples
+		self.numAdded = 0
+
+	def add(self,latencyMS):
+
+		self.latency_s[self.numAdded % self.numSamples] = latencyMS
+		self.numAdded += 1
+
+	def getPercentiles(self,percentiles=[50,95,99]):
+
+		# Returns a list of latencies, or None if nothing has been added
+
+		numValid = min(self.numAdded,self.numSamples)
+
+		if( numValid == 0 ):
+			return None
+
+		return list( np.percentile(self.latency_s[:numValid],percentiles) )
+
+	def getSummary(self,percentiles=[50,95,99]):
+
+		latency_p = self.getPercentiles(percentiles)
+
+		if( latency_p is None ):
+			return 'no samples'
+
+		return ' '.join( [ 'p%i %.2f' % (percentiles[pIdx],latency_p[pIdx]) for pIdx in range(len(percentiles)) ] ) + ' ms'
+
+class mainViewLatency():
+
+	# Stages, in the order they are logged
+	stageNames = ['sampleApply','applySwap','sampleSwap']
+
+	percentiles = [50,95,99]
+
+	def __init__(self,numFrames=1000,summaryIntervalS=1.0):
+
+		self.stats_stage = [ latencyStats(numFrames) for stage in self.stageNames ]
+
+		# Of the pose applied since the last swap.  None until one is applied
+		self.sampleTime = None
+		self.applyTime = None
+
+		# The last swapped frame's latencies (ms).  nan for stages that were not timed
+		self.frameLatencyMS_stage = [float('nan')] * len(self.stageNames)
+
+		# Percentiles are recomputed at most every summaryIntervalS, rather than every frame
+		self.summaryIntervalS = summaryIntervalS
+		self.lastSummaryTime = None
+		self.percentileMS_stage_p = [ [float('nan')] * len(self.percentiles) for stage in self.stageNames ]
+
+	def stampApply(self,sampleTime):
+
+		# Call right after the MainView is set.  sampleTime is the viz.tick() at which the pose was received, or None if unknown
+
+		self.applyTime = viz.tick()
+		self.sampleTime = sampleTime
+
+		if( sampleTime is not None ):
+			self.stats_stage[0].add( 1000 * (self.applyTime - sampleTime) )
+
+	def stampSwap(self):
+
+		# Call on viz.POST_SWAP_EVENT
+
+		swapTime = viz.tick()
+
+		frameLatencyMS_stage = [float('nan')] * len(self.stageNames)
+
+		if( self.applyTime is not None ):
+
+			frameLatencyMS_stage[1] = 1000 * (swapTime - self.applyTime)
+			self.stats_stage[1].add( frameLatencyMS_stage[1] )
+
+			if( self.sampleTime is not None ):
+
+				frameLatencyMS_stage[0] = 1000 * (self.applyTime - self.sampleTime)
+				frameLatencyMS_stage[2] = 1000 * (swapTime - self.sampleTime)
+				self.stats_stage[2].add( frameLatencyMS_stage[2] )
+
+		self.frameLatencyMS_stage = frameLatencyMS_stage
+
+		# Each application is counted once
+		self.applyTime = None
+		self.sampleTime = None
+
+	def _refreshPercentiles(self):
+
+		now = viz.tick()
+
+		if( self.lastSummaryTime is not None and now - self.lastSummaryTime < self.summaryIntervalS ):
+			return
+
+		self.lastSummaryTime = now
+
+		for stageIdx in range(len(self.stageNames)):
+
+			percentileMS_p = self.stats_stage[stageIdx].getPercentiles(self.percentiles)
+
+			if( percentileMS_p is not None ):
+				self.percentileMS_stage_p[stageIdx] = percentileMS_p
+
+	def getLogFields(self):
+
+		# The frame's latencies, then the percentiles of each stage
+		self.logFieldNames = ['poseLatencyMS_' + '_'.join(self.stageNames)] + \
+			[ '%sMS_p%i_p%i_p%i' % ((stageName,) + tuple(self.percentiles)) for stageName in self.stageNames ]
+
+		return [ [self.logFieldNames[0],'f8',len(self.stageNames)] ] + \
+			[ [fieldName,'f8',len(self.percentiles)] for fieldName in self.logFieldNames[1:] ]
+
+	def fillLogRow(self,row):
+
+		self._refreshPercentiles()
+
+		row[self.logFieldNames[0]] = self.frameLatencyMS_stage
+
+		for stageIdx in range(len(self.stageNames)):
+			row[self.logFieldNames[1 + stageIdx]] = self.percentileMS_stage_p[stageIdx]
+
+	def getOutput(self):
+
+		self._refreshPercentiles()
+
+		outputString = '[ poseLatencyMS_%s %f %f %f ] ' % ('_'.join(self.stageNames),
+			self.frameLatencyMS_stage[0],self.frameLatencyMS_stage[1],self.frameLatencyMS_stage[2])
+
+		for stageIdx in range(len(self.stageNames)):
+
+			percentileMS_p = self.percentileMS_stage_p[stageIdx]
+
+			outputString = outputString + '[ %sMS_p%i_p%i_p%i %f %f %f ] ' % ((self.stageNames[stageIdx],) + tuple(self.percentiles) + tuple(percentileMS_p))
+
+		return outputString
+
+	def printSummary(self):
+
+		print 'MainView pose latency over the last %i frames:' % min(self.stats_stage[2].numAdded,self.stats_stage[2].numSamples)
+
+		for stageIdx in range(len(self.stageNames)):
+			print '  %-12s %s' % (self.stageNames[stageIdx],self.stats_stage[stageIdx].getSummary(self.percentiles))
@@ -6,6 +6,7 @@ import ode
 import physEnv
 import vizact
 import Shadow
+import frameProfiler
 
 ft = .3048
 inch = 0.0254
@@ -23,7 +24,10 @@ class room():
         
         ##################################
         ## Physical environment
-        self.physEnv = physEnv.physEnv()
+        if config==None:
+            self.physEnv = physEnv.physEnv()
+        else:
+            self.physEnv = physEnv.physEnv(config.expCfg['physics'])
         ##################################
         
         if config==None:
@@ -75,6 +79,10 @@ class room():
             self.visObjNames_idx = config.expCfg['visObj']['visObjVarNames']
             self.visObjShapes_idx = config.expCfg['visObj']['visObjShapes']
             self.visObjSizes_idx = eval(config.expCfg['visObj']['visObjSizesString'])
+            
+            # Collision categories and masks, e.g. 'paddle' and 'static|ball'.  See physEnv.CATEGORY_*
+            self.visObjCategories_idx = config.expCfg['visObj']['visObjCategories']
+            self.visObjCollideWith_idx = config.expCfg['visObj']['visObjCollideWith']
         
             self.fillWithVisObj()
             
@@ -89,32 +97,36 @@ class room():
         wallTexPath = self.texPath  + 'tile_slate.jpg'
         floorTexPath = self.texPath + 'tile_wood.jpg'
         
-        planeABCD = [0,-1,0,-self.ceilingHeight]
+        # Also used without Vizard, by simulateTrials.py
+        planes_ABCD = physEnv.roomPlanes(self.roomWidth,self.ceilingHeight,self.roomLength,
+                                         self.translateOnX,self.translateOnZ)
+        
+        planeABCD = planes_ABCD['ceiling']
         self.ceiling = wall(self.physEnv,[self.roomWidth,self.roomLength],[1,0,0,-90],
                                 [self.translateOnX,self.ceilingHeight,self.translateOnZ],
                                 wallTexPath,texScale,planeABCD);        
                                 
-        planeABCD = [0,0,-1,-self.wallPos_PosZ]
+        planeABCD = planes_ABCD['wall_PosZ']
         self.wall_PosZ = wall(self.physEnv,[self.ceilingHeight,self.roomWidth],[0,0,1,90],
                                 [self.translateOnX,self.ceilingHeight/2, self.wallPos_PosZ],
                                 wallTexPath,texScale,planeABCD);
        
-        planeABCD = [0,0,1,self.wallPos_NegZ] 
+        planeABCD = planes_ABCD['wall_NegZ']
         self.wall_NegZ = wall(self.physEnv,[self.roomWidth,self.ceilingHeight],[0,1,0,180],
                                 [self.translateOnX,self.ceilingHeight/2, self.wallPos_NegZ],
                                 wallTexPath,texScale,planeABCD);
         
-        planeABCD = [-1,0,0,-self.wallPos_PosX] 
+        planeABCD = planes_ABCD['wall_PosX']
         self.wall_PosX = wall(self.physEnv,[self.roomLength,self.ceilingHeight],[0,1,0,90],
                                 [self.wallPos_PosX,self.ceilingHeight/2,self.translateOnZ ],
                                 wallTexPath,texScale,planeABCD);
         
-        planeABCD = [1,0,0,self.wallPos_NegX] 
+        planeABCD = planes_ABCD['wall_NegX']
         self.wall_NegX = wall(self.physEnv,[self.roomLength,self.ceilingHeight],[0,-1,0,90],
                                 [self.wallPos_NegX,self.ceilingHeight/2,self.translateOnZ ],
                                 wallTexPath,texScale,planeABCD);
        
-        planeABCD = [0,1,0,0]
+        planeABCD = planes_ABCD['floor']
         self.floor = wall(self.physEnv,[self.roomWidth,self.roomLength],[1,0,0,90],
                                 [self.translateOnX,0, self.translateOnZ],
                                 floorTexPath,texScale,planeABCD);
@@ -141,6 +153,19 @@ class room():
                     execString = 'self.' + self.visObjNames_idx[idx] + ' = visObj(self,self.visObjShapes_idx[idx],self.visObjSizes_idx[idx])'
                     print 'VisEnv:Room: Added ' + self.visObjNames_idx[idx]
                     exec(execString)
+                    
+                    # Empty or missing entries leave the defaults in place:  a visObj named ball or paddle is in that category,
+                    # and anything else in the physEnv default
+                    newVisObj = getattr(self,self.visObjNames_idx[idx])
+                    
+                    if( self.visObjNames_idx[idx] in ['ball','paddle'] ):
+                        newVisObj.collisionCategory = self.visObjNames_idx[idx]
+                    
+                    if( idx < len(self.visObjCategories_idx) and len(self.visObjCategories_idx[idx])>0 ):
+                        newVisObj.collisionCategory = self.visObjCategories_idx[idx]
+                        
+                    if( idx < len(self.visObjCollideWith_idx) and len(self.visObjCollideWith_idx[idx])>0 ):
+                        newVisObj.collideWith = self.visObjCollideWith_idx[idx]
         
     def createStandingBox(self):
         
@@ -262,6 +287,11 @@ class visObj(viz.EventClass):
         self.physNode = 0
         self.obj = []
         
+        # Collision category and mask of the physNode.  None uses the physEnv default.
+        # Must be set before the physNode is created (see enablePhysNode)
+        self.collisionCategory = None
+        self.collideWith = None
+        
         ################################################################################################
         ################################################################################################
         ## Variables related to automated updating with physics or motion capture
@@ -380,7 +410,8 @@ class visObj(viz.EventClass):
     def enablePhysNode(self):
 
         ## Create physical object
-        self.physNode = self.parentRoom.physEnv.makePhysNode(self.shape,self.position,self.size)
+        self.physNode = self.parentRoom.physEnv.makePhysNode(self.shape,self.position,self.size,
+                                                             self.collisionCategory,self.collideWith)
         self.setVelocity([0,0,0])
         self.physNode.disableMovement()
         
@@ -388,7 +419,7 @@ class visObj(viz.EventClass):
         
         #self.visNode.setVelocity(velocity)
         if( self.physNode.body ):
-            self.physNode.body.setLinearVel(velocity)
+            self.physNode.setLinearVel(velocity)
     
     def getVelocity(self):
         
@@ -439,7 +470,7 @@ class visObj(viz.EventClass):
     
     def setMocapRigidBody(self,mocap,rigidBodyFileString):        
        
-       self.rigidBodyFile = mocap.returnPointerToRigid(rigidBodyFileString)
+       self.rigidBodyFile = mocap.resolveRigid(rigidBodyFileString)
     
     def removeUpdateAction(self):
         
@@ -460,7 +491,7 @@ class visObj(viz.EventClass):
                 print 'Now updating with mocap'
                 
                 self.updatingWithMocap = True
-                self.updateAction = vizact.onupdate(viz.PRIORITY_FIRST_UPDATE, self.applyRigidToVis)
+                self.updateAction = frameProfiler.onupdate('applyRigidToVis',viz.PRIORITY_FIRST_UPDATE, self.applyRigidToVis)
                 
 #                if( self.physNode ):
 #                    self.applyVisToPhysAction = vizact.onupdate(viz.PRIORITY_FIRST_UPDATE, self.applyVisToPhys)
@@ -484,7 +515,7 @@ class visObj(viz.EventClass):
             if( self.updatingWithMocap == False ):
                 #print 'Now updating with mocap'
                 self.updatingWithMocap = True
-                self.updateAction = vizact.onupdate(viz.PRIORITY_FIRST_UPDATE, self.applyMarkerToVis)
+                self.updateAction = frameProfiler.onupdate('applyMarkerToVis',viz.PRIORITY_FIRST_UPDATE, self.applyMarkerToVis)
             else:
                 self.updatingWithMocap = False
                 self.updateAction.remove()
@@ -504,7 +535,7 @@ class visObj(viz.EventClass):
         if( self.updatingWithPhys == False ):
             print 'Now updating with physics'
             self.updatingWithPhys = True
-            self.updateAction = vizact.onupdate(viz.PRIORITY_FIRST_UPDATE, self.applyPhysToVis)
+            self.updateAction = frameProfiler.onupdate('applyPhysToVis',viz.PRIORITY_FIRST_UPDATE, self.applyPhysToVis)
             #self.physNode.enableMovement()
         else:
             print 'No longer updating with physics'
@@ -528,7 +559,7 @@ class visObj(viz.EventClass):
         
         if( self.updatingPhysWithVis == False ):
             self.updatingPhysWithVis = True
-            self.applyVisToPhysAction = vizact.onupdate(viz.PRIORITY_FIRST_UPDATE, self.applyVisToPhys)
+            self.applyVisToPhysAction = frameProfiler.onupdate('applyVisToPhys',viz.PRIORITY_FIRST_UPDATE, self.applyVisToPhys)
             
         else:
             self.updatingPhysWithVis = False
@@ -572,8 +603,28 @@ class visObj(viz.EventClass):
     
     def applyPhysToVis(self):
         
-        self.visNode.setPosition(self.physNode.geom.getPosition())
-        self.visNode.setQuat(self.physNode.getQuaternion())
+        thePhysEnv = self.parentRoom.physEnv
+        
+        if( thePhysEnv.useThread ):
+            
+            # Physics runs on its own thread.  Read from the snapshot instead of ODE.
+            pose = thePhysEnv.getSnapshotPose(self.physNode)
+            
+            if( pose ):
+                self.visNode.setPosition(pose[0])
+                self.visNode.setQuat(pose[1])
+                
+            return
+        
+        alpha = thePhysEnv.getInterpolationAlpha()
+        
+        if( alpha < 1.0 ):
+            # Blend between the last two physics states (realTime stepping mode)
+            self.visNode.setPosition(self.physNode.getInterpolatedPosition(alpha))
+            self.visNode.setQuat(self.physNode.getInterpolatedQuaternion(alpha))
+        else:
+            self.visNode.setPosition(self.physNode.geom.getPosition())
+            self.visNode.setQuat(self.physNode.getQuaternion())
     
     def applyRigidToVis(self):
         
@@ -617,6 +668,10 @@ class mocapMarkerSphere(visObj):
         self.markerNumber = markerNum
         self.mocapDevice = mocap
         self.toggleUpdateWithMarker()
+        
+        # Markers only show where the LEDs are.  Should they get a physNode, it collides with nothing
+        self.collisionCategory = physEnv.CATEGORY_MARKER
+        self.collideWith = 'none'
 
 def drawMarkerSpheres(room,mocap):
     
@@ -651,22 +706,22 @@ if __name__ == "__main__":
         # note that 'hmd' is used to search rigid body files for the partial string
         # in my current setup, it will find hmd-oculus.rb and link to that
         
-        if( config.use_phasespace and config.use_HMD and config.mocap.returnPointerToRigid('hmd') ):
+        if( config.use_phasespace and config.use_HMD and config.tracker.resolve('hmd') ):
                 
-                config.mocap.enableHMDTracking()
+                config.tracker.linkMainView('hmd')
                 
-                vizact.onkeydown('-',config.mocap.disableHMDTracking)
-                vizact.onkeydown('=',config.mocap.enableHMDTracking)
+                vizact.onkeydown('-',config.tracker.unlinkMainView)
+                vizact.onkeydown('=',config.tracker.linkMainView,'hmd')
                 
-                vizact.onkeydown( 'h', config.mocap.resetRigid, 'hmd' );
-                vizact.onkeydown( 'H', config.mocap.saveRigid, 'hmd' );
+                vizact.onkeydown( 'h', config.phasespace.resetRigid, 'hmd' );
+                vizact.onkeydown( 'H', config.phasespace.saveRigid, 'hmd' );
         else:
             
             viz.MainView.setPosition([room.wallPos_NegX +.1, 2, room.wallPos_NegZ +.1])
             viz.MainView.lookAt([0,2,0])
                 
         # Draw markers where the spehres are
-        drawMarkerSpheres(room,config.mocap)
+        drawMarkerSpheres(room,config.phasespace)
         
         #########################################################
         # Register some keypresses
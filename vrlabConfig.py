@@ -37,6 +37,9 @@ class VRLabConfig:
 	VRLabConfig.eyeTrackingCal: The eyetracking interface. None if we aren't eyetracking
 	VRLabConfig.camera: The virtual camera, positioned by headtracking. None if no such camera.
 	VRLabConfig.bodyCam: A second virtual camera or tracker
+	VRLabConfig.phasespace: The phasespaceInterface (see mocapInterface.py). None if use_phasespace is false.  Phasespace-only calls, like resetRigid / saveRigid, go here.
+	VRLabConfig.tracker: The trackerManager that updates phasespace / hiball, and links the MainView to the HMD (see trackerBackend.py). None if neither is used.
+	VRLabConfig.mainViewLatency: Timing of the tracked poses that drive the MainView (a trackingLatency.mainViewLatency). None if no tracker drives it.
 	VRLabConfig.phase_space_markers: Markers for phasespace. Undefined if use_phasespace is false.
 	VRLabConfig.phasespace_server: Server for phasespace. Undefined if use_phasespace is false.
 	
@@ -156,6 +159,13 @@ class VRLabConfig:
 		
 	def __setupSystem(self):
 		
+		# Time the per-frame callbacks.  Must come first, so that callbacks registered below are profiled
+		if self.sysCfg['use_frameProfiler']:
+			import frameProfiler
+			frameProfiler.enable(self.sysCfg['frameProfiler']['numFrames'], 
+				self.sysCfg['frameProfiler']['showOverlay'], 
+				self.sysCfg['frameProfiler']['outFileName'])
+		
 		# Set up the wiimote
 		################################################################
 		################################################################
@@ -200,6 +210,9 @@ class VRLabConfig:
 				self.eyeTrackingCal = EyeTrackerCalibrationNVIS_MT.EyeTrackerCalibrationNVIS(self.sysCfg['eyetracker']['settingsDir'])
 				self.eyeTrackingCal.changeDisplayNum(self.sysCfg['displays'][0])
 				
+				if self.sysCfg['eyetracker']['useSamplingThread']:
+					self.eyeTrackingCal.startSampling(self.sysCfg['eyetracker']['samplePollHz'],self.sysCfg['eyetracker']['trackerRateHz'])
+				
 				
 				print "Eye tracking enabled using NVIS visor"
 			else:
@@ -212,12 +225,18 @@ class VRLabConfig:
 		#self.writables.append(self.eyeTrackingCal)
 			
 		self.mocap = None
+		self.phasespace = None
 		self.bodyCam = None
 		
+		# The trackers don't update themselves, or drive the MainView.  The trackerManager (self.tracker) does both
+		self.tracker = None
+		
 		if self.sysCfg['use_phasespace']:
 			
 			from mocapInterface import phasespaceInterface			
-			self.mocap = phasespaceInterface(self.sysCfg);
+			# Kept apart from self.mocap, which the HiBall replaces below
+			self.phasespace = phasespaceInterface(self.sysCfg, selfUpdate = False);
+			self.mocap = self.phasespace
 				
 			self.use_phasespace = True
 		else:
@@ -226,15 +245,44 @@ class VRLabConfig:
 		if self.sysCfg['use_hiball']:
 			from HiBallCameraMT import HiBallCamera
 			#self.mocap = HiBallCamera(self.sysCfg['hiball']['origin'], self.sysCfg['hiball']['scale'], None, None, self.sysCfg, None);
-			self.mocap = HiBallCamera(self.sysCfg['hiball']['origin'], particle=None, sensorNum=self.sysCfg['hiball']['headCam'], attachTo=viz.MainView, preTrans = self.sysCfg['hiball']['preTransHead'])
+			self.mocap = HiBallCamera(self.sysCfg['hiball']['origin'], particle=None, sensorNum=self.sysCfg['hiball']['headCam'], attachTo=None, preTrans = self.sysCfg['hiball']['preTransHead'], selfUpdate = False)
 			if self.sysCfg['hiball']['bodyCam'] != -1:
-				self.bodyCam = HiBallCamera(self.sysCfg['hiball']['origin'], particle=None, sensorNum=self.sysCfg['hiball']['bodyCam'], attachTo=None, preTrans = self.sysCfg['hiball']['preTransBody'])
+				self.bodyCam = HiBallCamera(self.sysCfg['hiball']['origin'], particle=None, sensorNum=self.sysCfg['hiball']['bodyCam'], attachTo=None, preTrans = self.sysCfg['hiball']['preTransBody'], selfUpdate = False)
 			else:
 				self.bodyCam = None
 			self.use_hiball = True
 		else:
 			self.use_hiball = False
 		
+		if self.use_phasespace or self.use_hiball:
+			
+			import trackerBackend
+			
+			backends = []
+			
+			if self.use_phasespace:
+				backends.append(trackerBackend.phasespaceBackend(self.phasespace))
+			
+			if self.use_hiball:
+				backends.append(trackerBackend.hiballBackend(self.mocap,self.bodyCam))
+				
+			self.tracker = trackerBackend.trackerManager(backends, 
+				self.sysCfg['trackerManager']['useAcquisitionThread'], 
+				self.sysCfg['trackerManager']['pollRateHz'])
+			
+			# HiBall always drove the MainView.  Phasespace waits for experiment.__init__ (see use_HMD)
+			if self.use_hiball:
+				self.tracker.linkMainView(self.sysCfg['trackerManager']['mainViewHandle'])
+		
+
+		# The trackerManager times the poses that drive the MainView.  The swap is stamped in __record_data__
+		if self.tracker:
+			self.mainViewLatency = self.tracker.mainViewLatency
+		else:
+			self.mainViewLatency = None
+		
+		if self.mainViewLatency:
+			vizact.onexit(self.mainViewLatency.printSummary)
 
 		self.writables.append(self.mocap)
 		self.writables.append(self.bodyCam)
@@ -284,6 +332,9 @@ class VRLabConfig:
 			
 	def __record_data__(self, e):
 		
+		if self.mainViewLatency:
+			self.mainViewLatency.stampSwap()
+		
 		if self.use_DVR and self.writer != None:
 			#print "Writing..."
 			self.writer.write(self.writables)